@@ -0,0 +1,126 @@
+# ann_tool.py - Build ANN / quantized indexes and sweep their recall@k vs latency
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add src to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from runtime import DEFAULT_VECTOR_STORE
+from vector_store import load_vector_store, normalize_rows, resolve_store_path
+from ann_index import ExactIndex, HNSWLIB_AVAILABLE, build_index
+
+
+def make_queries(embeddings, count, noise, seed=0):
+    """Perturbed copies of random store rows, so ground truth is non-trivial"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), min(count, len(embeddings)), replace=False)
+    queries = np.asarray(embeddings[np.sort(rows)], dtype=np.float32)
+    queries = queries + rng.normal(scale=noise, size=queries.shape).astype(np.float32)
+    return normalize_rows(queries)
+
+
+def time_search(index, queries, k, **params):
+    """Search one query at a time (as the chat path does) and collect latencies"""
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = index.search(query, k, **params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.stack(results), np.array(latencies)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(np.intersect1d(f[f >= 0], t[t >= 0])) for f, t in zip(found, truth))
+    return hits / max(1, int((truth >= 0).sum()))
+
+
+def sweep(args):
+    store = load_vector_store(resolve_store_path(args.store))
+    embeddings = store.embeddings
+    queries = make_queries(embeddings, args.queries, args.noise)
+    print(f"✓ Loaded {len(store)} chunks, {len(queries)} queries, k={args.k} "
+          f"(float32 matrix {embeddings.nbytes / 2**20:.1f} MB)")
+
+    truth, exact_ms = time_search(ExactIndex(embeddings), queries, args.k)
+    print(f"\n{'index':<28}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    print("-" * 58)
+    print(f"{'exact':<28}{1.0:>10.3f}{np.median(exact_ms):>10.2f}{np.percentile(exact_ms, 95):>10.2f}")
+
+    start = time.perf_counter()
+    ivf = build_index("ivf", embeddings, nlist=args.nlist)
+    print(f"{'(ivf build, nlist=' + str(ivf.nlist) + ')':<28}{'':>10}"
+          f"{(time.perf_counter() - start) * 1000:>10.0f}")
+    for nprobe in args.nprobe:
+        found, ms = time_search(ivf, queries, args.k, nprobe=nprobe)
+        label = f"ivf nprobe={nprobe}"
+        print(f"{label:<28}{recall_at_k(found, truth):>10.3f}{np.median(ms):>10.2f}{np.percentile(ms, 95):>10.2f}")
+
+    full_bytes = embeddings.shape[0] * embeddings.shape[1] * 4
+    for mode in ("float16", "int8"):
+        quantized = build_index(mode, embeddings)
+        saved = 1 - quantized.nbytes / full_bytes
+        print(f"{'(' + mode + ' codes ' + f'{quantized.nbytes / 2**20:.1f} MB, -{saved:.0%} vs float32)':<28}")
+        for rescore in args.rescore:
+            found, ms = time_search(quantized, queries, args.k, rescore=rescore)
+            label = f"{mode} rescore={rescore}"
+            print(f"{label:<28}{recall_at_k(found, truth):>10.3f}{np.median(ms):>10.2f}{np.percentile(ms, 95):>10.2f}")
+
+    if not HNSWLIB_AVAILABLE:
+        print("\n(hnswlib not installed; skipping HNSW sweep)")
+        return
+    start = time.perf_counter()
+    hnsw = build_index("hnsw", embeddings)
+    print(f"{'(hnsw build)':<28}{'':>10}{(time.perf_counter() - start) * 1000:>10.0f}")
+    for ef in args.ef_search:
+        found, ms = time_search(hnsw, queries, args.k, ef_search=ef)
+        label = f"hnsw ef_search={ef}"
+        print(f"{label:<28}{recall_at_k(found, truth):>10.3f}{np.median(ms):>10.2f}{np.percentile(ms, 95):>10.2f}")
+
+
+def build(args):
+    store = load_vector_store(resolve_store_path(args.store))
+    params = {}
+    if args.kind == "ivf":
+        params = {"nlist": args.nlist, "nprobe": args.nprobe[0]}
+    elif args.kind == "hnsw":
+        params = {"ef_search": args.ef_search[0]}
+    elif args.kind in ("int8", "float16"):
+        params = {"rescore": args.rescore[0]}
+    start = time.perf_counter()
+    index = build_index(args.kind, store.embeddings, **params)
+    index.save(args.output, store.version)
+    print(f"✓ Built {args.kind} index over {len(store)} chunks in "
+          f"{time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN index build and recall/latency sweep")
+    parser.add_argument("command", choices=["build", "sweep"])
+    parser.add_argument("--store", default=DEFAULT_VECTOR_STORE,
+                        help="Vector store (a .vstore path falls back to the .pkl next to it)")
+    parser.add_argument("--kind", default="ivf", choices=["exact", "ivf", "hnsw", "int8", "float16"], help="Index type to build")
+    parser.add_argument("--output", default="data/ann_index.npz", help="Where to save a built index")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default 4*sqrt(N))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--rescore", type=int, nargs="+", default=[50, 100, 200, 400],
+                        help="Candidates rescored in float32 after a quantized scan")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to sampled rows")
+    args = parser.parse_args()
+
+    if args.command == "sweep":
+        sweep(args)
+    else:
+        build(args)
+
+
+if __name__ == "__main__":
+    main()
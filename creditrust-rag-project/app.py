@@ -1,5 +1,3 @@
-﻿# Replace app.py with fixed version
-'@'
 # app.py - CrediTrust RAG Chat Interface (Fixed Version)
 import gradio as gr
 import sys
@@ -13,44 +11,76 @@ print("="*60)
 # Add src to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
+from runtime import get_runtime
+
+EXAMPLE_QUESTIONS = [
+    "What are common credit card complaints?",
+    "How long do billing disputes take to resolve?",
+    "What should customers do about unauthorized transactions?",
+    "What mortgage servicing issues are reported?"
+]
+READY_TIMEOUT = 600  # seconds a request waits for the models before using demo mode
+TRUNCATED_NOTE = " _(answer cut short to stay within the response time budget)_"
+INTERRUPTED_NOTE = " _(answer interrupted by a generation error)_"
+
 class RAGChatInterface:
-    def __init__(self):
-        self.rag_system = None
-        self.initialize_rag()
+    def __init__(self, background=True):
+        # Shares the process-wide pipeline (and its batch scheduler) with serve.py
+        self.runtime = get_runtime(background=background, warm_up_questions=EXAMPLE_QUESTIONS)
     
-    def initialize_rag(self):
-        """Initialize the RAG system"""
-        try:
-            from rag_pipeline import RAGPipeline
-            
-            # Check if vector store exists
-            vector_path = "data/vector_store.pkl"
-            if os.path.exists(vector_path):
-                print("✓ Found vector store")
-                self.rag_system = RAGPipeline(vector_path)
-                print("✓ RAG system initialized")
-            else:
-                print("⚠️ Vector store not found. Using demo mode.")
-                self.rag_system = None
-                
-        except ImportError as e:
-            print(f"⚠️ Could not import RAG modules: {e}")
-            print("Using demonstration mode")
-            self.rag_system = None
+    @property
+    def rag_system(self):
+        return self.runtime.rag_system
+    
+    @property
+    def scheduler(self):
+        return self.runtime.scheduler
+    
+    @property
+    def state(self):
+        return self.runtime.state
+    
+    @property
+    def error(self):
+        return self.runtime.error
+    
+    @property
+    def timings(self):
+        return self.runtime.timings
+    
+    @property
+    def ready(self):
+        return self.runtime.ready
+    
+    def status_text(self):
+        """Readiness shown in the status box"""
+        if not self.ready.is_set():
+            return f"⏳ Starting up: {self.state}... questions will be answered once ready"
+        if self.state == "ready":
+            return f"✅ Ready to answer questions about customer complaints (loaded in {self.timings['total']:.0f}s)"
+        if self.state == "failed":
+            return f"⚠️ Demo mode: RAG initialization failed ({self.error})"
+        return "⚠️ Demo mode: vector store or RAG modules not available"
     
     def get_response(self, question):
         """Get response from RAG system"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         print(f"[{timestamp}] Question: {question[:50]}...")
         
+        if not self.ready.is_set():
+            print(f"[{timestamp}] Waiting for RAG system ({self.state})...")
+            self.ready.wait(READY_TIMEOUT)
+        
         if self.rag_system:
             try:
                 # Get real RAG response
-                result = self.rag_system.query(question, k=3)
+                result = self.scheduler.query(question, k=3)
                 answer = result['answer']
                 sources = result.get('retrieved_chunks', [])
                 
                 # Format response
+                if result.get('truncated'):
+                    answer += TRUNCATED_NOTE
                 response = self.format_response(answer, sources)
                 print(f"[{timestamp}] ✓ Response generated")
                 return response
@@ -62,6 +92,38 @@ class RAGChatInterface:
             # Demo mode
             return self.get_demo_response(question)
     
+    def stream_response(self, question):
+        """Yield the response as it grows: retrieved sources first, then the answer token by token"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp}] Question (streaming): {question[:50]}...")
+        
+        if not self.ready.is_set():
+            print(f"[{timestamp}] Waiting for RAG system ({self.state})...")
+            self.ready.wait(READY_TIMEOUT)
+        
+        if not self.rag_system:
+            yield self.get_demo_response(question)
+            return
+        
+        try:
+            # Retrieval is batched with other users' questions; the answer streams here
+            sources, pieces = self.scheduler.query_stream(question, k=3)
+            header = self.format_sources(sources)
+            yield header + "_Generating answer..._"
+            answer = ""
+            for piece in pieces:
+                answer += piece
+                yield header + answer
+            if pieces.truncated:
+                note = INTERRUPTED_NOTE if pieces.result.get("stop_reason") == "error" else TRUNCATED_NOTE
+                yield header + answer + note
+                print(f"[{timestamp}] ⚠️ Response streamed (truncated)")
+            else:
+                print(f"[{timestamp}] ✓ Response streamed")
+        except Exception as e:
+            print(f"[{timestamp}] ✗ Error: {e}")
+            yield self.get_demo_response(question)
+    
     def get_demo_response(self, question):
         """Get demo response when RAG is not available"""
         demo_responses = {
@@ -93,6 +155,19 @@ class RAGChatInterface:
         
         return answer
     
+    def format_sources(self, sources):
+        """Sources block shown above a streaming answer"""
+        if not sources:
+            return ""
+        formatted = "**Retrieved Sources:**\n"
+        for i, source in enumerate(sources[:3], 1):
+            text = source.get('text', '')
+            if len(text) > 100:
+                text = text[:100] + "..."
+            similarity = source.get('similarity', 0.0)
+            formatted += f"{i}. (Relevance: {similarity:.2f}) {text}\n"
+        return formatted + "\n**Answer:**\n"
+    
     def format_response(self, answer, sources):
         """Format the response with sources"""
         formatted = f"{answer}\n\n"
@@ -179,18 +254,25 @@ def create_interface():
         # Status
         status = gr.Textbox(
             label="Status",
-            value="✅ Ready to answer questions about customer complaints",
+            value=rag_interface.status_text(),
             interactive=False
         )
         
+        # Poll readiness while the models load in the background
+        if hasattr(gr, "Timer"):
+            readiness_timer = gr.Timer(1.0, active=not rag_interface.ready.is_set())
+            
+            def poll_status():
+                ready = rag_interface.ready.is_set()
+                return rag_interface.status_text(), gr.Timer(active=not ready)
+            
+            readiness_timer.tick(fn=poll_status, outputs=[status, readiness_timer])
+        else:
+            demo.load(fn=rag_interface.status_text, outputs=status)
+        
         # Examples
         gr.Examples(
-            examples=[
-                "What are common credit card complaints?",
-                "How long do billing disputes take to resolve?",
-                "What should customers do about unauthorized transactions?",
-                "What mortgage servicing issues are reported?"
-            ],
+            examples=EXAMPLE_QUESTIONS,
             inputs=question,
             label="Try these example questions:"
         )
@@ -206,18 +288,20 @@ def create_interface():
         
         # Functions
         def respond(user_message, chat_history):
-            """Process user message"""
+            """Process user message, streaming partial chat history as the answer is decoded"""
             if not user_message.strip():
-                return "", chat_history, "Please enter a question"
+                yield "", chat_history, "Please enter a question"
+                return
             
-            # Get AI response
-            ai_response = rag_interface.get_response(user_message)
+            chat_history = chat_history + [(user_message, "")]
+            yield "", chat_history, rag_interface.status_text() if not rag_interface.ready.is_set() else "🔎 Retrieving sources..."
             
-            # Update chat history
-            chat_history.append((user_message, ai_response))
+            for partial in rag_interface.stream_response(user_message):
+                chat_history[-1] = (user_message, partial)
+                yield "", chat_history, "✍️ Generating answer..."
             
             # Clear input and update status
-            return "", chat_history, f"✓ Answered at {datetime.now().strftime('%H:%M:%S')}"
+            yield "", chat_history, f"✓ Answered at {datetime.now().strftime('%H:%M:%S')}"
         
         def clear_chat():
             """Clear the chat"""
@@ -259,6 +343,3 @@ if __name__ == "__main__":
         share=False,
         inbrowser=True
     )
-'@ | Out-File -FilePath "app.py" -Encoding utf8 -Force
-
-Write-Host "✓ Fixed app.py created!" -ForegroundColor Green
\ No newline at end of file
@@ -0,0 +1,116 @@
+# benchmark_text.py - Rows/sec of narrative cleaning: notebook clean_text vs the text_processing engine
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Add src to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from text_processing import chunk_text, clean_and_chunk, clean_series, clean_text
+
+
+def notebook_clean_text(text):
+    """clean_text exactly as written in notebooks/task1_eda_preprocessing.ipynb"""
+    text = text.lower()
+
+    # Remove boilerplate phrases
+    boilerplate_patterns = [
+        r"i am writing to file a complaint",
+        r"this complaint is regarding",
+        r"please help me with",
+    ]
+    for pattern in boilerplate_patterns:
+        text = re.sub(pattern, "", text)
+
+    # Remove special characters & extra spaces
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+
+    return text
+
+
+def synthetic_narratives(rows):
+    base = ("I am writing to file a complaint. On 03/14/2023 my Credit Card was charged $1,250.00 "
+            "twice by XXXX and the bank refused to investigate!! Please help me with this issue. ")
+    return pd.Series([base * (1 + i % 8) + f"Reference #{i}." for i in range(rows)], dtype=object)
+
+
+def load_narratives(csv_path, rows):
+    frame = pd.read_csv(csv_path, usecols=["Consumer complaint narrative"], nrows=rows * 3, dtype=str)
+    return frame["Consumer complaint narrative"].dropna().head(rows).astype(object).reset_index(drop=True)
+
+
+def report(label, rows, seconds, baseline=None):
+    rate = rows / seconds
+    speedup = f"{rate / baseline:>8.1f}x" if baseline else f"{'':>9}"
+    print(f"{label:<40}{rate:>12,.0f}{speedup}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark narrative cleaning throughput")
+    parser.add_argument("--csv", default=None, help="complaints.csv to sample (synthetic text if omitted)")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    texts = load_narratives(args.csv, args.rows) if args.csv else synthetic_narratives(args.rows)
+    rows = len(texts)
+    print(f"✓ {rows} narratives, mean {texts.str.len().mean():.0f} chars, {args.workers} workers\n")
+    print(f"{'implementation':<40}{'rows/s':>12}{'speedup':>9}")
+    print("-" * 61)
+
+    start = time.perf_counter()
+    expected = texts.apply(notebook_clean_text)
+    baseline = report("notebook clean_text via Series.apply", rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cleaned = texts.apply(clean_text)
+    report("precompiled clean_text via Series.apply", rows, time.perf_counter() - start, baseline)
+    assert cleaned.equals(expected), "precompiled clean_text differs from the notebook"
+
+    start = time.perf_counter()
+    cleaned = clean_series(texts, vectorized=True)
+    report("clean_series (vectorized .str, object)", rows, time.perf_counter() - start, baseline)
+    assert cleaned.tolist() == expected.tolist(), "vectorized clean_series differs from the notebook"
+
+    start = time.perf_counter()
+    cleaned = clean_series(texts)
+    report("clean_series (maps clean_text)", rows, time.perf_counter() - start, baseline)
+    assert cleaned.tolist() == expected.tolist(), "clean_series differs from the notebook"
+
+    try:
+        arrow_texts = texts.astype("string[pyarrow]")
+    except ImportError:
+        print(f"{'clean_series (Arrow column)':<40}{'pyarrow not installed':>21}")
+    else:
+        start = time.perf_counter()
+        cleaned = clean_series(arrow_texts, vectorized=True)
+        report("clean_series (vectorized .str, Arrow)", rows, time.perf_counter() - start, baseline)
+        assert cleaned.tolist() == expected.tolist(), "vectorized clean_series differs from the notebook"
+
+    start = time.perf_counter()
+    [chunk_text(text) for text in texts.apply(notebook_clean_text)]
+    baseline_chunked = report("notebook clean_text + chunk_text", rows, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    serial = clean_and_chunk(texts.tolist())
+    report("clean_and_chunk (1 process)", rows, time.perf_counter() - start, baseline_chunked)
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers) as executor:
+            clean_and_chunk(texts.head(args.workers).tolist(), executor=executor, shard_rows=1)  # spawn workers
+            start = time.perf_counter()
+            pooled = clean_and_chunk(texts.tolist(), executor=executor)
+            report(f"clean_and_chunk ({args.workers} processes)", rows, time.perf_counter() - start,
+                   baseline_chunked)
+        assert pooled == serial, "process pool output is out of order"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# check_quantization.py - Measure a reduced-precision inference mode against fp32
+import argparse
+import json
+import os
+import sys
+
+# Add src to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from runtime import DEFAULT_VECTOR_STORE
+from vector_store import load_vector_store, resolve_store_path
+from evaluation import SAMPLE_QUESTIONS
+from model_quantization import check_inference_mode, format_check
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report latency speedup, embedding cosine drift and retrieval overlap of int8/ONNX vs fp32"
+    )
+    parser.add_argument("--store", default=DEFAULT_VECTOR_STORE,
+                        help="Vector store to retrieve from (a .vstore path falls back to the .pkl next to it)")
+    parser.add_argument("--mode", choices=["int8", "onnx"], default="int8")
+    parser.add_argument("--embedder", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--generator", default="gpt2", help="Generator model to compare ('none' to skip)")
+    parser.add_argument("--sample-chunks", type=int, default=256, help="Chunks encoded for the drift check")
+    parser.add_argument("--k", type=int, default=5, help="Top-k used for retrieval overlap")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    store = load_vector_store(resolve_store_path(args.store))
+    generator = None if args.generator == "none" else args.generator
+    report = check_inference_mode(args.mode, store, SAMPLE_QUESTIONS, args.embedder, generator,
+                                  sample_chunks=args.sample_chunks, k=args.k)
+    print(format_check(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# convert_vector_store.py - Convert the pickled vector store to the memory-mapped format
+import argparse
+import os
+import sys
+import time
+
+# Add src to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from vector_store import VectorStore, convert_pickle_store
+from metadata_index import MetadataIndex, metadata_index_path_for
+from lexical_index import BM25Index, lexical_index_path_for
+from token_budget import ChunkTokenIndex, token_index_path_for
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert vector_store.pkl to the .vstore format")
+    parser.add_argument("source", nargs="?", default="data/vector_store.pkl",
+                        help="Legacy pickled vector store")
+    parser.add_argument("output", nargs="?", default="data/vector_store.vstore",
+                        help="Destination .vstore file")
+    parser.add_argument("--dedup", type=float, default=None, metavar="THRESHOLD",
+                        help="Fold near-duplicate chunks (MinHash Jaccard >= THRESHOLD, e.g. 0.8)")
+    parser.add_argument("--no-metadata-index", action="store_true",
+                        help="Skip building the metadata filter index sidecar")
+    parser.add_argument("--no-lexical-index", action="store_true",
+                        help="Skip building the BM25 index sidecar used by hybrid retrieval")
+    parser.add_argument("--tokenizer", default="gpt2",
+                        help="Generator tokenizer used to precompute chunk token counts for prompt packing")
+    parser.add_argument("--no-token-index", action="store_true",
+                        help="Skip building the chunk token count sidecar")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"✗ Vector store not found at {args.source}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    header = convert_pickle_store(args.source, args.output, dedup_threshold=args.dedup)
+    print(f"✓ Converted {header['count']} chunks ({header['dim']} dims) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    store = VectorStore.open(args.output)
+    store.verify()
+    print(f"✓ Verified {args.output} (version {store.version}), "
+          f"opened in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if not args.no_metadata_index:
+        index = MetadataIndex.build(store.metadata, store_version=store.version)
+        index_path = metadata_index_path_for(args.output)
+        index.save(index_path)
+        print(f"✓ Metadata index for fields {index.fields} -> {index_path}")
+
+    if not args.no_lexical_index:
+        start = time.perf_counter()
+        lexical = BM25Index().build(store.chunks, store_version=store.version)
+        lexical_path = lexical_index_path_for(args.output)
+        lexical.save(lexical_path)
+        print(f"✓ BM25 index with {len(lexical.vocabulary)} terms in "
+              f"{time.perf_counter() - start:.2f}s -> {lexical_path}")
+
+    if not args.no_token_index:
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        except Exception as e:
+            print(f"⚠️ Could not load tokenizer '{args.tokenizer}' ({e}); token counts will be built at load time")
+            return
+        start = time.perf_counter()
+        tokens = ChunkTokenIndex.build(store.chunks, tokenizer, tokenizer.name_or_path,
+                                       store_version=store.version)
+        tokens_path = token_index_path_for(args.output)
+        tokens.save(tokens_path)
+        print(f"✓ Token counts for {tokens.count} chunks ({int(tokens.token_counts.sum())} tokens, "
+              f"{args.tokenizer}) in {time.perf_counter() - start:.2f}s -> {tokens_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# ingest.py - Stream complaints.csv into a segmented vector store (resumable)
+import argparse
+import os
+import sys
+
+# Add src to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from bulk_encoder import BulkEncoder
+from embedding_cache import EmbeddingCache
+from ingestion import TARGET_PRODUCTS, ingest_complaints
+from segments import SegmentedVectorStore
+from token_budget import load_tokenizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream complaints.csv into a segmented vector store")
+    parser.add_argument("csv", nargs="?", default="data/raw/complaints.csv", help="CFPB complaints export")
+    parser.add_argument("--store", default="data/vector_store", help="Segmented store directory (created if missing)")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2", help="Embedding model")
+    parser.add_argument("--read-rows", type=int, default=10_000, help="CSV records per block (bounds memory)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Max characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=50, help="Characters shared by consecutive chunks")
+    parser.add_argument("--batch-size", type=int, default=64, help="Embedding batch size")
+    parser.add_argument("--products", nargs="+", default=list(TARGET_PRODUCTS),
+                        help="Products to keep ('all' keeps every product)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used for cleaning and chunking")
+    parser.add_argument("--encode-workers", type=int, default=1, help="Embedding worker processes")
+    parser.add_argument("--encode-threads", type=int, default=None,
+                        help="Torch threads per embedding worker (default: cores / workers)")
+    parser.add_argument("--embedding-cache", default="data/embedding_cache.sqlite",
+                        help="Embedding cache keyed by hash(model, text); 'none' disables it")
+    parser.add_argument("--cache-max-entries", type=int, default=2_000_000,
+                        help="Embedding cache size limit (least recently used builds evicted first)")
+    parser.add_argument("--tokenizer", default="gpt2",
+                        help="Generator tokenizer used to precompute chunk token counts per segment ('none' skips them)")
+    parser.add_argument("--max-blocks", type=int, default=None, help="Stop after this many blocks")
+    parser.add_argument("--compact", action="store_true", help="Merge segments into one when done")
+    parser.add_argument("--dedup", type=float, default=None, metavar="THRESHOLD",
+                        help="With --compact, fold near-duplicate chunks (MinHash Jaccard >= THRESHOLD)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv):
+        print(f"✗ Complaints CSV not found at {args.csv}")
+        sys.exit(1)
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        print("✗ sentence-transformers is required for ingestion. Run: pip install sentence-transformers")
+        sys.exit(1)
+
+    products = None if args.products == ["all"] else args.products
+    tokenizer = load_tokenizer(args.tokenizer)
+    with BulkEncoder(args.model, workers=args.encode_workers, threads_per_worker=args.encode_threads,
+                     batch_size=args.batch_size) as encoder:
+        encode = encoder.encode
+        cache = None
+        if args.embedding_cache != "none":
+            cache = EmbeddingCache(args.embedding_cache, args.model, max_entries=args.cache_max_entries)
+            encode = cache.wrap(encoder.encode)
+        summary = ingest_complaints(args.csv, args.store, encode, args.model,
+                                    read_rows=args.read_rows, chunk_size=args.chunk_size,
+                                    chunk_overlap=args.chunk_overlap, products=products,
+                                    max_blocks=args.max_blocks, workers=args.workers,
+                                    tokenizer=tokenizer)
+        print(encoder.report())
+        if cache is not None:
+            print(cache.report())
+            cache.close()
+    print(f"✓ Ingested {summary['rows_read']} records ({summary['rows_kept']} kept) into "
+          f"{summary['chunks']} chunks, {summary['segments']} new segments in {summary['seconds']:.1f}s; "
+          f"store has {summary['live_chunks']} live chunks")
+
+    if args.compact:
+        store = SegmentedVectorStore(args.store, tokenizer=tokenizer)
+        segments_before, dropped = store.compact(dedup_threshold=args.dedup)
+        print(f"✓ Compacted {segments_before} segments into one ({dropped} deleted or duplicate chunks dropped)")
+
+
+if __name__ == "__main__":
+    main()
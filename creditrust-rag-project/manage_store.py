@@ -0,0 +1,87 @@
+# manage_store.py - Maintain a segmented vector store (append, delete, compact)
+import argparse
+import os
+import sys
+import time
+
+# Add src to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from vector_store import load_vector_store
+from segments import SegmentedVectorStore
+from metadata_index import typed_values
+from token_budget import load_tokenizer
+
+
+def append_from(store, source):
+    """Append every chunk of a .vstore/.pkl file as one new segment"""
+    incoming = load_vector_store(source)
+    start = time.perf_counter()
+    ids = store.append(incoming.chunks, incoming.embeddings, incoming.metadata)
+    if len(ids):
+        print(f"✓ Appended {len(ids)} chunks from {source} as ids {ids[0]}..{ids[-1]} "
+              f"in {time.perf_counter() - start:.2f}s")
+    else:
+        print(f"⚠️ {source} has no chunks; nothing appended")
+
+
+def info(store):
+    print(f"Store: {store.directory} (version {store.version})")
+    print(f"  chunks: {len(store)} total, {store.live_count} live, {len(store.tombstones)} tombstoned")
+    print(f"  dims: {store.dim}, next id: {store.manifest['next_id']}")
+    for entry, segment, deleted in zip(store.manifest["segments"], store.segments, store.segment_deleted):
+        print(f"  {entry['file']}: {len(segment)} chunks, {int(deleted.sum())} deleted")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain a segmented vector store")
+    parser.add_argument("command", choices=["init", "append", "delete", "compact", "info"])
+    parser.add_argument("--store", default="data/vector_store", help="Segmented store directory")
+    parser.add_argument("--from", dest="source", help="Vector store (.vstore or .pkl) to append")
+    parser.add_argument("--ids", type=int, nargs="+", help="Stable chunk ids to delete")
+    parser.add_argument("--where", help="Delete chunks whose metadata matches field=value")
+    parser.add_argument("--tokenizer", default="gpt2",
+                        help="append/compact: generator tokenizer for per-segment chunk token counts ('none' skips them)")
+    parser.add_argument("--dedup", type=float, default=None, metavar="THRESHOLD",
+                        help="compact: also fold near-duplicate chunks (MinHash Jaccard >= THRESHOLD)")
+    args = parser.parse_args()
+
+    # Only commands that write segments need the tokenizer
+    tokenizer = load_tokenizer(args.tokenizer) if args.command in ("init", "append", "compact") else None
+    if args.command == "init":
+        store = SegmentedVectorStore.create(args.store, tokenizer=tokenizer)
+        print(f"✓ Created segmented store in {args.store}")
+        if args.source:
+            append_from(store, args.source)
+        return
+
+    if not SegmentedVectorStore.is_segmented_store(args.store):
+        print(f"✗ No segmented store at {args.store} (run 'init' first)")
+        sys.exit(1)
+    store = SegmentedVectorStore(args.store, tokenizer=tokenizer)
+
+    if args.command == "append":
+        if not args.source:
+            parser.error("append requires --from")
+        append_from(store, args.source)
+    elif args.command == "delete":
+        if args.ids:
+            removed = store.delete(args.ids)
+        elif args.where and "=" in args.where:
+            field, value = args.where.split("=", 1)
+            # Metadata keeps ints and bools typed, so "2023" must also match 2023
+            removed = store.delete_where(field, typed_values(value))
+        else:
+            parser.error("delete requires --ids or --where field=value")
+        print(f"✓ Tombstoned {removed} chunks ({store.live_count} live)")
+    elif args.command == "compact":
+        start = time.perf_counter()
+        segments_before, dropped = store.compact(dedup_threshold=args.dedup)
+        print(f"✓ Compacted {segments_before} segments into {len(store.segments)}, "
+              f"dropped {dropped} deleted or duplicate chunks in {time.perf_counter() - start:.2f}s")
+    else:
+        info(store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# serve.py - JSON query service (optionally with the Gradio chat UI in the same process)
+import argparse
+import os
+import sys
+
+# Add src to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from runtime import DEFAULT_VECTOR_STORE, get_runtime
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the RAG pipeline over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--store", default=DEFAULT_VECTOR_STORE,
+                        help="Vector store to serve (a .vstore path falls back to the .pkl next to it)")
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                        help="Requests answered at once; the rest wait for a slot")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="Requests allowed to wait for a slot before returning 429")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--max-batch-questions", type=int, default=32,
+                        help="Largest /query/batch request accepted")
+    parser.add_argument("--generator-workers", type=int, default=None,
+                        help="Forked generation workers sharing the model weights (default: $RAG_GENERATOR_WORKERS or 0)")
+    parser.add_argument("--inference-mode", choices=["fp32", "int8", "onnx"], default=None,
+                        help="Model precision/runtime (default: $RAG_INFERENCE_MODE or fp32)")
+    parser.add_argument("--generation-budget", type=float, default=None,
+                        help="Seconds of decoding per answer before it is cut short (default: $RAG_GENERATION_BUDGET or 30)")
+    parser.add_argument("--answer-cache", default=None, metavar="off|memory|PATH",
+                        help="Semantic answer cache; PATH keeps it in SQLite across restarts (default: $RAG_ANSWER_CACHE or off)")
+    parser.add_argument("--answer-cache-threshold", type=float, default=None,
+                        help="Question cosine similarity needed to reuse a cached answer (default: 0.95)")
+    parser.add_argument("--store-reload-seconds", type=float, default=None,
+                        help="How often to check a segmented store for new segments; 0 disables (default: $RAG_STORE_RELOAD_SECONDS or 30)")
+    parser.add_argument("--ui", action="store_true",
+                        help="Also mount the Gradio chat UI at /ui, sharing the same pipeline")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+        from http_service import create_service
+    except ImportError as e:
+        print(f"✗ {e}. Install the service dependencies: pip install fastapi uvicorn")
+        sys.exit(1)
+
+    options = {"vector_store_path": args.store}
+    if args.generator_workers is not None:
+        options["generator_workers"] = args.generator_workers
+    if args.inference_mode is not None:
+        options["inference_mode"] = args.inference_mode
+    if args.generation_budget is not None:
+        options["generation_budget"] = args.generation_budget
+    if args.answer_cache is not None:
+        options["answer_cache"] = args.answer_cache
+    if args.answer_cache_threshold is not None:
+        options["answer_cache_threshold"] = args.answer_cache_threshold
+    if args.store_reload_seconds is not None:
+        options["store_reload_seconds"] = args.store_reload_seconds
+    runtime = get_runtime(**options)
+    api = create_service(runtime, max_concurrency=args.max_concurrency, max_pending=args.max_pending,
+                         request_timeout=args.timeout, max_batch_questions=args.max_batch_questions)
+
+    if args.ui:
+        import gradio as gr
+        from app import create_interface
+        api = gr.mount_gradio_app(api, create_interface(), path="/ui")
+        print(f"✓ Chat UI at http://{args.host}:{args.port}/ui")
+
+    print(f"✓ Query service at http://{args.host}:{args.port} (models loading in the background)")
+    uvicorn.run(api, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# src/ann_index.py
+"""Nearest-neighbour search backends for the vector store.
+
+All backends index row-normalized float32 embeddings (so inner product is
+cosine similarity) and share one interface::
+
+    index.build(embeddings)
+    ids, scores = index.search(queries, k)   # (m, k) arrays, best first
+    index.save(path, store_version); load_index(path, embeddings, store_version)
+
+An index saved with the store's ``version`` refuses to load against a
+store whose contents changed since it was built.
+
+Rows that could not be filled (fewer than ``k`` candidates) are padded with
+id ``-1`` and score ``-inf``. Passing ``rows`` (sorted row ids, e.g. from a
+metadata filter) restricts the search to that subset.
+
+* ``ExactIndex`` - brute-force matrix product, the ground truth.
+* ``IVFIndex``   - inverted file over spherical k-means centroids, pure
+  NumPy. ``nprobe`` trades recall for speed.
+* ``HNSWIndex``  - graph index backed by ``hnswlib`` when it is installed.
+  ``ef_search`` trades recall for speed.
+* ``QuantizedIndex`` - int8 or float16 codes held in RAM for a first-pass
+  scan; the best ``rescore`` candidates are rescored exactly against the
+  (memory-mapped) float32 rows.
+"""
+import json
+import os
+from functools import partial
+from typing import Optional, Tuple
+
+import numpy as np
+
+from quantization import ScalarQuantizer
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+# Upper bound on scores materialized at once by exact search (64 MB of float32)
+SCORE_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def top_k_indices_from_scores(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return indices of the k highest scores, best first, without a full sort"""
+    n = scores.shape[-1]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _as_query_matrix(queries: np.ndarray) -> np.ndarray:
+    queries = np.asarray(queries, dtype=np.float32)
+    return queries.reshape(1, -1) if queries.ndim == 1 else queries
+
+
+def _pad(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    out_ids = np.full(k, -1, dtype=np.int64)
+    out_scores = np.full(k, -np.inf, dtype=np.float32)
+    out_ids[:len(ids)] = ids
+    out_scores[:len(scores)] = scores
+    return out_ids, out_scores
+
+
+def search_rows(embeddings: np.ndarray, queries: np.ndarray, k: int,
+                rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact top-k over all rows, or only over the given row ids"""
+    queries = _as_query_matrix(queries)
+    matrix = embeddings if rows is None else embeddings[rows]
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    # Score queries in blocks so the (block, n) score matrix stays bounded
+    block = max(1, SCORE_BUFFER_SIZE // max(1, len(matrix)))
+    for start in range(0, len(queries), block):
+        all_scores = queries[start:start + block] @ matrix.T
+        for i, row_scores in enumerate(all_scores, start):
+            top = top_k_indices_from_scores(row_scores, k)
+            found = top if rows is None else rows[top]
+            ids[i], scores[i] = _pad(found, row_scores[top], k)
+    return ids, scores
+
+
+class ExactIndex:
+    """Brute-force inner-product search over the full embedding matrix"""
+
+    kind = "exact"
+
+    def __init__(self, embeddings: Optional[np.ndarray] = None):
+        self.embeddings = embeddings
+
+    def build(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+        return self
+
+    def search(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None,
+               **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        return search_rows(self.embeddings, queries, k, rows=rows)
+
+    def save(self, path: str, store_version: Optional[str] = None):
+        _save_npz(path, {"kind": self.kind, "count": len(self.embeddings)}, {}, store_version)
+
+
+class IVFIndex:
+    """Inverted-file index: vectors are bucketed by their nearest centroid and
+    a query only scores the ``nprobe`` closest buckets."""
+
+    kind = "ivf"
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8,
+                 train_size: int = 100_000, iterations: int = 15, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.embeddings = None
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+
+    def build(self, embeddings: np.ndarray):
+        """Train centroids with spherical k-means and fill the inverted lists"""
+        self.embeddings = embeddings
+        n = len(embeddings)
+        if self.nlist is None:
+            self.nlist = max(1, int(4 * np.sqrt(n)))
+        self.nlist = min(self.nlist, n)
+
+        rng = np.random.default_rng(self.seed)
+        sample = embeddings[np.sort(rng.choice(n, min(n, self.train_size), replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=self.nlist)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+        self.centroids = centroids.astype(np.float32)
+
+        assignment = self._assign(embeddings, self.centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=self.nlist)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.list_ids = order.astype(np.int64)
+        return self
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65_536) -> np.ndarray:
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+            assignment[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+        return assignment
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+               rows: Optional[np.ndarray] = None, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_query_matrix(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        if rows is not None and len(rows) <= nprobe * len(self.list_ids) / self.nlist:
+            # A small filtered subset is cheaper to scan exactly than to probe
+            return search_rows(self.embeddings, queries, k, rows=rows)
+        probe_lists = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, lists in enumerate(probe_lists):
+            candidates = np.concatenate([
+                self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists
+            ])
+            candidates.sort()
+            if rows is not None:
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+                if len(candidates) < k:
+                    candidates = rows
+            if len(candidates) == 0:
+                continue
+            ids[i], scores[i] = search_rows(self.embeddings, queries[i], k, rows=candidates)
+        return ids, scores
+
+    def save(self, path: str, store_version: Optional[str] = None):
+        meta = {"kind": self.kind, "count": len(self.list_ids), "nlist": self.nlist,
+                "nprobe": self.nprobe}
+        _save_npz(path, meta, {"centroids": self.centroids, "list_offsets": self.list_offsets,
+                               "list_ids": self.list_ids}, store_version)
+
+    @classmethod
+    def _from_arrays(cls, meta, arrays, embeddings):
+        index = cls(nlist=meta["nlist"], nprobe=meta["nprobe"])
+        index.embeddings = embeddings
+        index.centroids = arrays["centroids"]
+        index.list_offsets = arrays["list_offsets"]
+        index.list_ids = arrays["list_ids"]
+        return index
+
+
+class HNSWIndex:
+    """Hierarchical navigable small-world graph backed by ``hnswlib``"""
+
+    kind = "hnsw"
+
+    def __init__(self, m: int = 16, ef_construction: int = 200, ef_search: int = 64,
+                 num_threads: int = -1):
+        if not HNSWLIB_AVAILABLE:
+            raise ImportError("HNSWIndex requires hnswlib. Run: pip install hnswlib")
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.num_threads = num_threads
+        self.graph = None
+        self.embeddings = None
+        self.count = 0
+
+    def build(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+        self.count, dim = embeddings.shape
+        self.graph = hnswlib.Index(space="ip", dim=dim)
+        self.graph.init_index(max_elements=self.count, ef_construction=self.ef_construction, M=self.m)
+        self.graph.add_items(np.asarray(embeddings, dtype=np.float32),
+                             np.arange(self.count), num_threads=self.num_threads)
+        return self
+
+    def search(self, queries: np.ndarray, k: int, ef_search: Optional[int] = None,
+               rows: Optional[np.ndarray] = None, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        if rows is not None:
+            # The graph cannot be restricted cheaply; score the subset exactly
+            return search_rows(self.embeddings, queries, k, rows=rows)
+        queries = _as_query_matrix(queries)
+        fetch = min(k, self.count)
+        self.graph.set_ef(max(ef_search or self.ef_search, fetch))
+        labels, distances = self.graph.knn_query(queries, k=fetch, num_threads=self.num_threads)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids[:, :fetch] = labels
+        # hnswlib reports inner-product distance as 1 - <q, x>
+        scores[:, :fetch] = 1.0 - distances
+        return ids, scores
+
+    def save(self, path: str, store_version: Optional[str] = None):
+        self.graph.save_index(f"{path}.hnsw")
+        meta = {"kind": self.kind, "count": self.count, "m": self.m,
+                "ef_construction": self.ef_construction, "ef_search": self.ef_search,
+                "dim": self.graph.dim}
+        _save_npz(path, meta, {}, store_version)
+
+    @classmethod
+    def _from_arrays(cls, meta, arrays, embeddings, path):
+        index = cls(m=meta["m"], ef_construction=meta["ef_construction"],
+                    ef_search=meta["ef_search"])
+        index.count = meta["count"]
+        index.embeddings = embeddings
+        index.graph = hnswlib.Index(space="ip", dim=meta["dim"])
+        index.graph.load_index(f"{path}.hnsw", max_elements=index.count)
+        return index
+
+
+class QuantizedIndex:
+    """Scan compact int8/float16 codes, then rescore the top candidates in float32"""
+
+    def __init__(self, mode: str = "int8", rescore: int = 256):
+        self.kind = mode
+        self.rescore = rescore
+        self.quantizer = ScalarQuantizer(mode)
+        self.embeddings = None
+        self.codes = None
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the codes and quantizer parameters"""
+        return int(self.codes.nbytes + sum(a.nbytes for a in self.quantizer.state().values()))
+
+    def build(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+        self.codes = self.quantizer.fit(embeddings).encode(embeddings)
+        return self
+
+    def search(self, queries: np.ndarray, k: int, rescore: Optional[int] = None,
+               rows: Optional[np.ndarray] = None, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_query_matrix(queries)
+        rescore = max(k, rescore or self.rescore)
+        codes = self.codes if rows is None else self.codes[rows]
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        block = max(1, SCORE_BUFFER_SIZE // max(1, len(codes)))
+        for start in range(0, len(queries), block):
+            approximate = self.quantizer.approximate_scores(codes, queries[start:start + block])
+            for i, column in enumerate(approximate.T, start):
+                top = top_k_indices_from_scores(column, rescore)
+                candidates = np.sort(top if rows is None else rows[top])
+                if len(candidates):
+                    ids[i], scores[i] = search_rows(self.embeddings, queries[i], k, rows=candidates)
+        return ids, scores
+
+    def save(self, path: str, store_version: Optional[str] = None):
+        meta = {"kind": self.kind, "count": len(self.codes), "rescore": self.rescore}
+        _save_npz(path, meta, {"codes": self.codes, **self.quantizer.state()}, store_version)
+
+    @classmethod
+    def _from_arrays(cls, meta, arrays, embeddings):
+        index = cls(mode=meta["kind"], rescore=meta["rescore"])
+        index.quantizer = ScalarQuantizer.from_state(meta["kind"], arrays)
+        index.codes = arrays["codes"]
+        index.embeddings = embeddings
+        return index
+
+
+INDEX_TYPES = {
+    "exact": ExactIndex,
+    "ivf": IVFIndex,
+    "hnsw": HNSWIndex,
+    "int8": partial(QuantizedIndex, mode="int8"),
+    "float16": partial(QuantizedIndex, mode="float16"),
+}
+
+
+def build_index(kind: str, embeddings: np.ndarray, **params):
+    """Build an index of the given kind ("exact", "ivf", "hnsw", "int8" or "float16")"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}'. Choose from {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](**params).build(embeddings)
+
+
+def _save_npz(path: str, meta, arrays, store_version: Optional[str] = None):
+    tmp_path = f"{path}.tmp.npz"
+    meta = dict(meta, store_version=store_version)
+    np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_index(path: str, embeddings: np.ndarray, store_version: Optional[str] = None):
+    """Load an index saved with ``index.save(path, store_version)`` over the matching embeddings
+
+    With ``store_version`` the index must have been saved for that version
+    of the store; otherwise only the vector count is checked.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        arrays = {name: data[name] for name in data.files if name != "meta"}
+    if meta["count"] != len(embeddings):
+        raise ValueError(
+            f"Index at {path} covers {meta['count']} vectors but the store has {len(embeddings)}; rebuild it"
+        )
+    if store_version is not None and meta.get("store_version") != store_version:
+        raise ValueError(
+            f"Index at {path} was built for store version {meta.get('store_version')} "
+            f"but the store is version {store_version}; rebuild it"
+        )
+    kind = meta["kind"]
+    if kind == "exact":
+        return ExactIndex(embeddings)
+    if kind == "ivf":
+        return IVFIndex._from_arrays(meta, arrays, embeddings)
+    if kind == "hnsw":
+        return HNSWIndex._from_arrays(meta, arrays, embeddings, path)
+    if kind in ("int8", "float16"):
+        return QuantizedIndex._from_arrays(meta, arrays, embeddings)
+    raise ValueError(f"Unknown index type '{kind}' in {path}")
@@ -0,0 +1,193 @@
+# src/answer_cache.py
+"""Semantic answer cache that lets near-duplicate questions skip generation.
+
+An entry holds the question embedding, the ids of the chunks retrieved for
+it and the generated answer. A new question hits the cache when its cosine
+similarity to a cached question is at least ``threshold`` *and* retrieval
+returned the same chunk ids, so a cached answer is only reused when it was
+grounded in exactly the same context.
+
+Entries expire after ``ttl_seconds`` and the least recently used entry is
+evicted beyond ``max_entries``. With ``db_path`` the cache is mirrored to a
+local SQLite file and reloaded on restart. Every entry is tagged with the
+vector store version; entries from another version are dropped.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class _Entry:
+    __slots__ = ("slot", "question", "chunk_ids", "answer", "created_at", "row_id")
+
+    def __init__(self, slot, question, chunk_ids, answer, created_at, row_id=None):
+        self.slot = slot
+        self.question = question
+        self.chunk_ids = chunk_ids
+        self.answer = answer
+        self.created_at = created_at
+        self.row_id = row_id
+
+
+class SemanticAnswerCache:
+    """Cosine-threshold answer cache with TTL, LRU eviction and optional SQLite persistence"""
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000,
+                 ttl_seconds: Optional[float] = 3600.0, db_path: Optional[str] = None,
+                 store_version: Optional[str] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.store_version = store_version
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY, store_version TEXT, question TEXT, embedding BLOB, "
+                "chunk_ids TEXT, answer TEXT, created_at REAL)"
+            )
+            self._db.commit()
+            if store_version is not None:
+                self._load()
+
+    # ------------------------------------------------------------------
+    # Versioning
+    # ------------------------------------------------------------------
+    def set_store_version(self, version: str):
+        """Bind the cache to a vector store version, invalidating other versions"""
+        with self._lock:
+            if version == self.store_version:
+                return
+            self.store_version = version
+            self._clear_memory()
+        if self._db is not None:
+            self._load()
+
+    def clear(self):
+        with self._lock:
+            self._clear_memory()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def _clear_memory(self):
+        self._entries.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._valid[:] = False
+
+    def _load(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers WHERE store_version IS NOT ?", (self.store_version,))
+            if self.ttl_seconds is not None:
+                self._db.execute("DELETE FROM answers WHERE created_at < ?",
+                                 (time.time() - self.ttl_seconds,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT id, question, embedding, chunk_ids, answer, created_at FROM answers "
+                "ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            for row_id, question, blob, chunk_ids, answer, created_at in reversed(rows):
+                self._insert(question, np.frombuffer(blob, dtype=np.float32),
+                             _parse_ids(chunk_ids), answer, created_at, row_id)
+
+    # ------------------------------------------------------------------
+    # Lookup and insert
+    # ------------------------------------------------------------------
+    def lookup(self, question_embedding: np.ndarray, chunk_ids: Sequence[int]) -> Optional[str]:
+        """Return a cached answer for a similar question with the same context, or None"""
+        chunk_ids = tuple(int(i) for i in chunk_ids)
+        with self._lock:
+            if self._matrix is None or not self._entries:
+                self.misses += 1
+                return None
+            scores = self._matrix @ np.asarray(question_embedding, dtype=np.float32)
+            scores[~self._valid] = -np.inf
+            now = time.time()
+            above = np.flatnonzero(scores >= self.threshold)
+            for slot in above[np.argsort(-scores[above])]:
+                entry = self._entries[int(slot)]
+                if self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds:
+                    self._remove(entry)
+                    continue
+                if entry.chunk_ids == chunk_ids:
+                    self._entries.move_to_end(entry.slot)
+                    self.hits += 1
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def store(self, question: str, question_embedding: np.ndarray, chunk_ids: Sequence[int],
+              answer: str):
+        """Cache a freshly generated answer"""
+        if self.max_entries == 0:
+            return
+        embedding = np.asarray(question_embedding, dtype=np.float32)
+        chunk_ids = tuple(int(i) for i in chunk_ids)
+        created_at = time.time()
+        with self._lock:
+            row_id = None
+            if self._db is not None:
+                cursor = self._db.execute(
+                    "INSERT INTO answers (store_version, question, embedding, chunk_ids, answer, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.store_version, question, embedding.tobytes(),
+                     ",".join(map(str, chunk_ids)), answer, created_at)
+                )
+                self._db.commit()
+                row_id = cursor.lastrowid
+            self._insert(question, embedding, chunk_ids, answer, created_at, row_id)
+
+    def _insert(self, question, embedding, chunk_ids, answer, created_at, row_id):
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+        if not self._free_slots:
+            self._remove(next(iter(self._entries.values())))
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._matrix[slot] = embedding
+        self._valid[slot] = True
+        self._entries[slot] = _Entry(slot, question, chunk_ids, answer, created_at, row_id)
+
+    def _remove(self, entry: _Entry):
+        del self._entries[entry.slot]
+        self._valid[entry.slot] = False
+        self._free_slots.append(entry.slot)
+        if self._db is not None and entry.row_id is not None:
+            self._db.execute("DELETE FROM answers WHERE id = ?", (entry.row_id,))
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "store_version": self.store_version,
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _parse_ids(text: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in text.split(",")) if text else ()
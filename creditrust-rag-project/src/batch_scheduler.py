@@ -0,0 +1,180 @@
+# src/batch_scheduler.py
+"""Micro-batching scheduler that coalesces concurrent queries into batched pipeline calls.
+
+Callers ``submit`` a question and get a Future. A single worker thread takes
+the first waiting request, keeps collecting until ``max_batch_size``
+requests are queued or ``max_wait_ms`` has passed since that first request,
+then answers the batch with ``RAGPipeline.query_batch`` (one encode, one
+score matrix, padded batched generation) and resolves every caller's Future.
+Requests with different ``k``/``filters`` in the same window are answered
+in one ``query_batch`` call per distinct setting.
+
+Streaming requests (``submit_stream``, used by the chat UI) are batched the
+same way through ``RAGPipeline.query_stream_batch``: retrieval and
+generation run once for the batch, and each Future resolves to
+``(retrieved_chunks, pieces)``, where ``pieces`` yields that caller's row of
+the batched ``generate`` as it is decoded.
+
+``run_exclusive`` runs a callable between batches; the runtime uses it to
+reload a segmented store while serving.
+
+The scheduler records batch sizes and how long requests waited in the
+queue before their batch started.
+"""
+import json
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+METRIC_WINDOW = 10_000
+
+
+class _Request:
+    __slots__ = ("question", "k", "filters", "streaming", "future", "submitted")
+
+    def __init__(self, question, k, filters, streaming=False):
+        self.question = question
+        self.k = k
+        self.filters = filters
+        self.streaming = streaming
+        self.future: Future = Future()
+        self.submitted = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """Coalesce ``query`` calls arriving within ``max_wait_ms`` into batches"""
+
+    def __init__(self, pipeline, max_batch_size: int = 8, max_wait_ms: float = 20.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        # Held while a batch runs; ``run_exclusive`` takes it to change the pipeline between batches
+        self._pipeline_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._queue_waits = deque(maxlen=METRIC_WINDOW)
+        self._batch_seconds = deque(maxlen=METRIC_WINDOW)
+        self.requests = 0
+        self.batches = 0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="rag-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None) -> Future:
+        """Queue a question; the Future resolves to the same dict ``RAGPipeline.query`` returns"""
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        request = _Request(question, k, filters)
+        self._queue.put(request)
+        return request.future
+
+    def query(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+              timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Blocking ``submit``"""
+        return self.submit(question, k, filters).result(timeout)
+
+    def submit_stream(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None) -> Future:
+        """Queue a streaming question; the Future resolves to ``RAGPipeline.query_stream``'s tuple"""
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        request = _Request(question, k, filters, streaming=True)
+        self._queue.put(request)
+        return request.future
+
+    def query_stream(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                     timeout: Optional[float] = None) -> Tuple[List[Dict[str, Any]], Iterator[str]]:
+        """Blocking ``submit_stream``: ``(retrieved_chunks, pieces)``"""
+        return self.submit_stream(question, k, filters).result(timeout)
+
+    def _collect(self) -> Optional[List[_Request]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.submitted + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # let the loop see the shutdown after this batch
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            groups: Dict[str, List[_Request]] = {}
+            for request in batch:
+                key = json.dumps([request.streaming, request.k, request.filters], sort_keys=True, default=str)
+                groups.setdefault(key, []).append(request)
+            with self._pipeline_lock:
+                for requests in groups.values():
+                    # Skip callers that cancelled while queued
+                    requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+                    if not requests:
+                        continue
+                    try:
+                        if requests[0].streaming:
+                            results = self.pipeline.query_stream_batch([r.question for r in requests],
+                                                                       k=requests[0].k,
+                                                                       filters=requests[0].filters)
+                        else:
+                            results = self.pipeline.query_batch([r.question for r in requests], k=requests[0].k,
+                                                                filters=requests[0].filters,
+                                                                batch_size=len(requests))
+                    except Exception as e:
+                        for request in requests:
+                            request.future.set_exception(e)
+                        continue
+                    for request, result in zip(requests, results):
+                        request.future.set_result(result)
+            with self._metrics_lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self._batch_sizes[len(batch)] += 1
+                self._queue_waits.extend(started - request.submitted for request in batch)
+                self._batch_seconds.append(time.perf_counter() - started)
+
+    def run_exclusive(self, fn: Callable[[], Any]) -> Any:
+        """Call ``fn`` between batches, so it never overlaps retrieval (e.g. a store reload)"""
+        with self._pipeline_lock:
+            return fn()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            waits = np.array(self._queue_waits) * 1000
+            seconds = np.array(self._batch_seconds)
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "queue_wait_ms_p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                "queue_wait_ms_p95": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                "batch_seconds_mean": float(seconds.mean()) if len(seconds) else 0.0,
+                "queued": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+            }
+
+    def close(self):
+        """Finish queued requests and stop the worker"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
@@ -0,0 +1,134 @@
+# src/bulk_encoder.py
+"""Length-bucketed, multi-process SentenceTransformer encoding for bulk store builds.
+
+``SentenceTransformer.encode`` pads every batch to its longest member, and
+complaint lengths are heavily skewed, so batches that mix a 20-word and a
+2,000-word narrative spend most of their time on padding. ``BulkEncoder``
+sorts each window of texts by length, cuts the sorted order into batches of
+similar length and hands them to a pool of worker processes. Each worker
+loads the model once and pins its torch intra-op thread count, so
+``workers * threads_per_worker`` matches the cores you want to use instead
+of every process fighting over all of them.
+
+Results are written back to their original positions, so ``encode``
+returns rows in input order and the store can be filled sequentially.
+"""
+import multiprocessing as mp
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int, device: Optional[str]):
+    """Pool initializer: pin thread counts before torch spins up, then load the model"""
+    global _worker_model
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set in this process
+    _worker_model = SentenceTransformer(model_name, device=device)
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                normalize_embeddings=True).astype(np.float32, copy=False)
+
+
+def length_sorted_batches(texts: Sequence[str], batch_size: int) -> List[np.ndarray]:
+    """Positions of ``texts`` grouped into batches of similar length (longest first)
+
+    Character length is used as a cheap proxy for token length.
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    order = np.argsort(-lengths, kind="stable")
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+class BulkEncoder:
+    """Encode large text collections with length bucketing and a process pool"""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 workers: int = 1, threads_per_worker: Optional[int] = None,
+                 batch_size: int = 64, device: Optional[str] = None):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        cores = os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker or max(1, cores // self.workers)
+        self.batch_size = batch_size
+        self.device = device
+        self.chunks = 0
+        self.seconds = 0.0
+        self._pool = None
+        if self.workers > 1:
+            # spawn: forked children would inherit the parent's torch thread pools
+            context = mp.get_context("spawn")
+            self._pool = context.Pool(self.workers, initializer=_init_worker,
+                                      initargs=(model_name, self.threads_per_worker, device))
+        else:
+            _init_worker(model_name, self.threads_per_worker, device)
+
+    @property
+    def cores(self) -> int:
+        return self.workers * self.threads_per_worker
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Row-normalized float32 embeddings of ``texts``, in input order"""
+        texts = list(texts)
+        start = time.perf_counter()
+        batches = length_sorted_batches(texts, self.batch_size)
+        out = None
+        if self._pool is not None:
+            results = self._pool.imap(_encode_batch, [[texts[i] for i in batch] for batch in batches])
+        else:
+            results = (_encode_batch([texts[i] for i in batch]) for batch in batches)
+        for batch, embeddings in zip(batches, results):
+            if out is None:
+                out = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+            out[batch] = embeddings
+        self.chunks += len(texts)
+        self.seconds += time.perf_counter() - start
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+    def encode_stream(self, windows: Iterable[Sequence[str]]) -> Iterator[np.ndarray]:
+        """Encode successive windows of texts, yielding each window's embeddings in order"""
+        for window in windows:
+            yield self.encode(window)
+
+    def stats(self) -> Dict[str, float]:
+        rate = self.chunks / self.seconds if self.seconds else 0.0
+        return {
+            "chunks": self.chunks,
+            "seconds": self.seconds,
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "chunks_per_sec": rate,
+            "chunks_per_sec_per_core": rate / self.cores,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"✓ Encoded {stats['chunks']} chunks in {stats['seconds']:.1f}s: "
+                f"{stats['chunks_per_sec']:.1f} chunks/s, {stats['chunks_per_sec_per_core']:.1f} "
+                f"chunks/s per core ({self.workers} workers x {self.threads_per_worker} threads)")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
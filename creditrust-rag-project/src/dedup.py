@@ -0,0 +1,182 @@
+# src/dedup.py
+"""Near-duplicate chunk detection with MinHash signatures and LSH banding.
+
+Each chunk is reduced to a set of word shingles (``shingle_size`` consecutive
+words). A MinHash signature of ``num_perm`` values estimates the Jaccard
+similarity of two shingle sets as the fraction of equal signature entries.
+Signatures are cut into ``bands`` bands; chunks that agree on a whole band
+land in the same bucket and become candidate pairs. Candidates are kept
+only if their estimated Jaccard similarity reaches ``threshold`` and are
+merged with union-find, so the cost is linear in the number of chunks
+instead of quadratic.
+
+Templated and resubmitted complaints collapse onto one representative (the
+first chunk of each cluster in store order).
+"""
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from text_processing import clean_text
+
+MERSENNE_PRIME = (1 << 31) - 1
+SHINGLE_BLOCK = 65_536
+
+
+def choose_bands(num_perm: int, threshold: float) -> int:
+    """Fewest bands whose LSH threshold ``(1/b)^(1/r)`` is at or below ``threshold``
+
+    Erring low favours recall; false candidates are removed by verification.
+    """
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands == 0 and (1 / bands) ** (bands / num_perm) <= threshold:
+            return bands
+    return num_perm
+
+
+class MinHasher:
+    """Word-shingle MinHash signatures computed in vectorized blocks"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 0):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._word_hashes: Dict[str, int] = {}
+
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        """31-bit hashes of the word shingles of a (cleaned) text"""
+        words = text.split()
+        if not words:
+            return np.empty(0, dtype=np.uint64)
+        cache = self._word_hashes
+        ids = np.fromiter((cache[w] if w in cache else cache.setdefault(w, zlib.crc32(w.encode("utf-8")))
+                           for w in words), dtype=np.uint64, count=len(words))
+        size = min(self.shingle_size, len(ids))
+        shingles = np.zeros(len(ids) - size + 1, dtype=np.uint64)
+        for offset in range(size):
+            shingles = shingles * np.uint64(1_000_003) ^ ids[offset:offset + len(shingles)]
+        return np.unique(shingles % np.uint64(MERSENNE_PRIME))
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), num_perm) uint32 signatures; texts without words get all-max rows"""
+        out = np.full((len(texts), self.num_perm), MERSENNE_PRIME, dtype=np.uint32)
+        pending: List[np.ndarray] = []
+        rows: List[int] = []
+        size = 0
+        for row, text in enumerate(texts):
+            shingles = self.shingle_hashes(clean_text(text))
+            if len(shingles) == 0:
+                continue
+            pending.append(shingles)
+            rows.append(row)
+            size += len(shingles)
+            if size >= SHINGLE_BLOCK:
+                self._fill(out, rows, pending)
+                pending, rows, size = [], [], 0
+        if pending:
+            self._fill(out, rows, pending)
+        return out
+
+    def _fill(self, out: np.ndarray, rows: List[int], shingles: List[np.ndarray]):
+        starts = np.cumsum([0] + [len(s) for s in shingles[:-1]])
+        hashed = (self._a * np.concatenate(shingles)[None, :] + self._b) % np.uint64(MERSENNE_PRIME)
+        out[rows] = np.minimum.reduceat(hashed, starts, axis=1).T
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = np.arange(size)
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x: int, y: int):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            # Lower row wins so the representative is the earliest chunk
+            self.parent[max(x, y)] = min(x, y)
+
+
+def find_near_duplicates(texts: Sequence[str], threshold: float = 0.8, num_perm: int = 64,
+                         bands: Optional[int] = None, shingle_size: int = 3,
+                         signatures: Optional[np.ndarray] = None) -> np.ndarray:
+    """Cluster near-duplicate texts; returns each text's representative row (itself if unique)"""
+    if signatures is None:
+        signatures = MinHasher(num_perm, shingle_size).signatures(texts)
+    count, num_perm = signatures.shape
+    bands = bands or choose_bands(num_perm, threshold)
+    rows_per_band = num_perm // bands
+    has_words = signatures[:, 0] != MERSENNE_PRIME
+    union = _UnionFind(count)
+    minimum_agreement = int(np.ceil(threshold * num_perm))
+
+    for band in range(bands):
+        block = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+        keys = np.zeros(count, dtype=np.uint64)
+        for column in block.T:
+            keys = keys * np.uint64(0x100000001B3) ^ column
+        candidates = np.flatnonzero(has_words)
+        order = candidates[np.argsort(keys[candidates], kind="stable")]
+        sorted_keys = keys[order]
+        same = np.flatnonzero(sorted_keys[1:] == sorted_keys[:-1]) + 1
+        if len(same) == 0:
+            continue
+        # Compare each bucket member with the bucket's first (lowest) row
+        group_start = np.maximum.accumulate(np.where(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]],
+                                                     np.arange(len(order)), 0))
+        for position in same:
+            row, head = int(order[position]), int(order[group_start[position]])
+            if union.find(row) == union.find(head):
+                continue
+            if int((signatures[row] == signatures[head]).sum()) >= minimum_agreement:
+                union.union(row, head)
+
+    return np.array([union.find(row) for row in range(count)], dtype=np.int64)
+
+
+def deduplicate(chunks: Sequence[str], metadata: Optional[Sequence[Dict]] = None,
+                threshold: float = 0.8, num_perm: int = 64, bands: Optional[int] = None,
+                dim: int = 0) -> Tuple[np.ndarray, List[Dict], Dict[str, float]]:
+    """Keep one representative per near-duplicate cluster.
+
+    Returns ``(kept_rows, kept_metadata, report)``; callers keep the
+    embeddings of ``kept_rows``. Each representative's metadata gets
+    ``duplicate_count``: the number of chunks folded into it (counts from an
+    earlier deduplication are carried over). ``dim`` sizes the report's
+    saved-bytes figure.
+    """
+    representatives = find_near_duplicates(chunks, threshold, num_perm, bands)
+    metadata = list(metadata) if metadata is not None else [{} for _ in range(len(chunks))]
+    previous = np.array([(m or {}).get("duplicate_count", 0) for m in metadata], dtype=np.int64)
+    members = np.bincount(representatives, weights=previous + 1, minlength=len(chunks)).astype(np.int64)
+    kept = np.flatnonzero(representatives == np.arange(len(chunks)))
+    kept_metadata = []
+    for row in kept:
+        record = dict(metadata[row] or {})
+        if members[row] > 1:
+            record["duplicate_count"] = int(members[row] - 1)
+        kept_metadata.append(record)
+
+    report = {
+        "chunks_before": len(chunks),
+        "chunks_after": len(kept),
+        "clusters_merged": int((members[kept] > previous[kept] + 1).sum()),
+        "shrink": 1 - len(kept) / len(chunks) if len(chunks) else 0.0,
+        "bytes_saved": (len(chunks) - len(kept)) * dim * 4,
+    }
+    return kept, kept_metadata, report
+
+
+def format_report(report: Dict[str, float]) -> str:
+    return (f"✓ Deduplicated {report['chunks_before']} -> {report['chunks_after']} chunks "
+            f"({report['shrink']:.1%} smaller, {report['clusters_merged']} clusters merged, "
+            f"{report['bytes_saved'] / 2**20:.1f} MB of float32 embeddings saved)")
@@ -0,0 +1,147 @@
+# src/embedding_cache.py
+"""Persistent, content-addressed cache of chunk embeddings for store rebuilds.
+
+Entries are keyed by ``blake2b(model name, chunk text)``, so changing the
+chunking parameters or rebuilding a store only embeds the chunks whose text
+actually changed. Vectors are stored as raw float32 bytes in a local SQLite
+file. Every entry a build reads or writes is stamped with that build's start
+time; beyond ``max_entries`` the entries with the oldest stamps (those no
+recent build needed) are evicted first. The entry count is read once when
+the cache opens and then tracked in memory, so one build should write to a
+cache file at a time.
+
+Wrap any ``encode(texts) -> embeddings`` callable with ``encode`` or
+``wrap``; hit/miss counters are kept per build.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+LOOKUP_BATCH = 500
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store keyed by hash(model, text) with LRU eviction"""
+
+    def __init__(self, path: str, model_name: str, max_entries: Optional[int] = 2_000_000):
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, dim INTEGER, vector BLOB, last_used REAL) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.commit()
+        (self._count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self.start_build()
+
+    def start_build(self):
+        """Reset the per-build counters and usage stamp"""
+        self.build_started = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        """Cached vectors for the keys that are present"""
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = list(keys[start:start + LOOKUP_BATCH])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                     [(self.build_started, key) for key in found])
+                self._db.commit()
+        return found
+
+    def store(self, keys: Sequence[bytes], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            # Same key means same model and text, so an existing vector is kept as is
+            cursor = self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, vectors.shape[1], vector.tobytes(), self.build_started)
+                 for key, vector in zip(keys, vectors)]
+            )
+            self._count += cursor.rowcount
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        excess = self._count - self.max_entries
+        if excess > 0:
+            cursor = self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self._count -= cursor.rowcount
+            self.evictions += cursor.rowcount
+
+    def encode(self, texts: Sequence[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings for ``texts`` in order, calling ``encode`` only for cache misses"""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        keys = [embedding_key(self.model_name, text) for text in texts]
+        found = self.lookup(keys)
+        missing: Dict[bytes, int] = {}
+        for position, key in enumerate(keys):
+            if key not in found and key not in missing:
+                missing[key] = position
+        misses = sum(1 for key in keys if key not in found)
+        self.hits += len(keys) - misses
+        self.misses += misses
+        if missing:
+            computed = encode([texts[position] for position in missing.values()])
+            self.store(list(missing), computed)
+            found.update(zip(missing, np.asarray(computed, dtype=np.float32)))
+        return np.stack([found[key] for key in keys])
+
+    def wrap(self, encode: Callable[[List[str]], np.ndarray]) -> Callable[[List[str]], np.ndarray]:
+        return lambda texts: self.encode(texts, encode)
+
+    def stats(self) -> Dict[str, float]:
+        size = self._count
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "capacity": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"✓ Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evicted, "
+                f"{stats['size']} entries in {self.path}")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -4,12 +4,16 @@ def evaluate_rag_pipeline(rag_pipeline, questions, k=5):
     print(f"\nEvaluating {len(questions)} questions...")
     print("=" * 60)
     
+    # One batched encode/search/generate pass when the pipeline supports it
+    if hasattr(rag_pipeline, "query_batch"):
+        answers = rag_pipeline.query_batch(questions, k)
+    else:
+        answers = [rag_pipeline.query(question, k) for question in questions]
+    
     results = []
-    for i, question in enumerate(questions, 1):
+    for i, (question, result) in enumerate(zip(questions, answers), 1):
         print(f"\nQ{i}: {question}")
         
-        result = rag_pipeline.query(question, k)
-        
         eval_result = {
             "question": question,
             "generated_answer": result["answer"],
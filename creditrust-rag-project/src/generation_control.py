@@ -0,0 +1,259 @@
+# src/generation_control.py
+"""Latency-budgeted generation with stop sequences.
+
+``GenerationController`` wraps ``model.generate`` (through a
+``PrefixCachedGenerator``, so the preamble KV-cache still applies) with a
+stopping criterion that ends decoding when:
+
+* the request's wall-clock budget runs out, in which case the partial
+  answer is returned with ``truncated=True`` instead of blocking the caller
+  (in a batch, only for the rows still decoding at that point);
+* the model starts a new turn ("Question:", "Context:") or leaves a blank
+  line after some answer text.
+
+Only the newly generated token ids are decoded; the prompt is never
+decoded and sliced off. The stop sequence itself is cut from the answer,
+and ``filter_stream`` does the same for streamed text pieces.
+``AnswerStream`` carries the streamed pieces together with the generation
+result, so callers can tell a truncated stream from a finished one.
+``BatchStreamer`` streams every row of one batched ``generate`` call to its
+own consumer.
+"""
+import queue
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+STOP_SEQUENCES = ("Question:", "Context:", "\n\n")
+_STREAM_END = object()
+
+
+def find_stop(text: str, stop_sequences: Sequence[str]) -> int:
+    """Offset of the earliest stop sequence in ``text`` (-1 if none)
+
+    Whitespace-only stops (a blank line) only count after some answer text.
+    """
+    content_start = len(text) - len(text.lstrip())
+    earliest = -1
+    for stop in stop_sequences:
+        start = content_start if stop.strip() else content_start + 1
+        offset = text.find(stop, start)
+        if offset >= 0 and (earliest < 0 or offset < earliest):
+            earliest = offset
+    return earliest
+
+
+def cut_at_stop(text: str, stop_sequences: Sequence[str]) -> str:
+    offset = find_stop(text, stop_sequences)
+    return text if offset < 0 else text[:offset]
+
+
+def filter_stream(pieces: Iterable[str], stop_sequences: Sequence[str] = STOP_SEQUENCES) -> Iterator[str]:
+    """Yield streamed text up to the first stop sequence
+
+    The tail that could still grow into a stop sequence is held back until
+    the next piece shows whether it does.
+    """
+    hold = max((len(stop) for stop in stop_sequences), default=1) - 1
+    text = ""
+    emitted = 0
+    for piece in pieces:
+        text += piece
+        offset = find_stop(text, stop_sequences)
+        if offset >= 0:
+            if offset > emitted:
+                yield text[emitted:offset]
+            return
+        safe = len(text) - hold
+        if safe > emitted:
+            yield text[emitted:safe]
+            emitted = safe
+    if len(text) > emitted:
+        yield text[emitted:]
+
+
+class AnswerStream:
+    """Streamed answer pieces; ``result`` holds the generation outcome once they run out"""
+
+    def __init__(self, pieces: Iterable[str], result: Optional[Dict[str, Any]] = None):
+        self._pieces = iter(pieces)
+        self.result: Dict[str, Any] = {} if result is None else result
+
+    def __iter__(self) -> "AnswerStream":
+        return self
+
+    def __next__(self) -> str:
+        return next(self._pieces)
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.result.get("truncated", False))
+
+
+class BatchStreamer:
+    """``generate`` streamer for a padded batch: each row's new text goes to its own queue
+
+    ``generate`` hands over the prompt ids first, then one token per row per
+    step; the padding a finished row keeps receiving decodes to nothing.
+    Rows end once ``close`` is called, after ``generate`` has returned.
+    """
+
+    def __init__(self, tokenizer, rows: int):
+        self.tokenizer = tokenizer
+        self._queues: List["queue.Queue"] = [queue.Queue() for _ in range(rows)]
+        self._ids: List[List[int]] = [[] for _ in range(rows)]
+        self._emitted = [0] * rows
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for row, token in enumerate(value.reshape(-1).tolist()):
+            self._ids[row].append(token)
+            self._emit(row, final=False)
+
+    def end(self):
+        for row in range(len(self._queues)):
+            self._emit(row, final=True)
+
+    def close(self):
+        """End every row's stream (also when ``generate`` failed)"""
+        for pieces in self._queues:
+            pieces.put(_STREAM_END)
+
+    def row(self, index: int) -> Iterator[str]:
+        """Text pieces of row ``index`` as they are decoded"""
+        pieces = self._queues[index]
+        while True:
+            piece = pieces.get()
+            if piece is _STREAM_END:
+                return
+            yield piece
+
+    def _emit(self, row: int, final: bool):
+        text = self.tokenizer.decode(self._ids[row], skip_special_tokens=True)
+        # Hold back a multi-byte character until its last token arrives
+        if not final and text.endswith("\ufffd"):
+            return
+        if len(text) > self._emitted[row]:
+            self._queues[row].put(text[self._emitted[row]:])
+            self._emitted[row] = len(text)
+
+
+def _stopping_criteria(tokenizer, deadline: Optional[float], stop_sequences: Sequence[str],
+                       state: Dict[str, Any]):
+    from transformers import StoppingCriteria, StoppingCriteriaList
+    import torch
+
+    class BudgetAndStops(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            # Called after each new token, so the first call shows where the prompt ends
+            prompt_length = state.setdefault("prompt_length", input_ids.shape[1] - 1)
+            texts = tokenizer.batch_decode(input_ids[:, prompt_length:], skip_special_tokens=True)
+            stops = torch.tensor([find_stop(text, stop_sequences) >= 0 for text in texts],
+                                 dtype=torch.bool, device=input_ids.device)
+            done = stops.clone()
+            if tokenizer.eos_token_id is not None:
+                done |= input_ids[:, -1] == tokenizer.eos_token_id
+            # Rows that finished keep receiving padding (often the EOS token), so record
+            # why and after how many tokens each row ended when it first does
+            previous = state.get("finished")
+            newly = done if previous is None else done & ~previous
+            for row in newly.nonzero().flatten().tolist():
+                state.setdefault("finish", {})[row] = ("stop_sequence" if stops[row] else "eos",
+                                                       input_ids.shape[1] - prompt_length)
+            finished = state["finished"] = done if previous is None else done | previous
+            if deadline is not None and time.perf_counter() >= deadline:
+                state["budget_exceeded"] = True
+                state["running"] = (~finished).tolist()
+                return torch.ones_like(done)
+            return done
+
+    return StoppingCriteriaList([BudgetAndStops()])
+
+
+class GenerationController:
+    """Generate answers within a wall-clock budget, stopping at stop sequences"""
+
+    def __init__(self, generator, budget_seconds: Optional[float] = None,
+                 stop_sequences: Sequence[str] = STOP_SEQUENCES):
+        """
+        Args:
+            generator: PrefixCachedGenerator over the loaded model and tokenizer
+            budget_seconds: Default wall-clock budget per request (None: no limit)
+            stop_sequences: Text that ends the answer when the model produces it
+        """
+        self.generator = generator
+        self.tokenizer = generator.tokenizer
+        self.budget_seconds = budget_seconds
+        self.stop_sequences = tuple(stop_sequences)
+        self.requests = 0
+        self.truncated = 0
+
+    def _deadline(self, started: float, budget: Optional[float]) -> Optional[float]:
+        budget = self.budget_seconds if budget is None else budget
+        return None if budget is None else started + budget
+
+    def _result(self, new_ids, state: Dict[str, Any], started: float, row: int = 0) -> Dict[str, Any]:
+        raw = self.tokenizer.decode(new_ids, skip_special_tokens=True)
+        answer = cut_at_stop(raw, self.stop_sequences)
+        truncated = state.get("budget_exceeded", False) and state["running"][row] and answer == raw
+        if truncated:
+            reason = "budget"
+        elif row in state.get("finish", {}):
+            reason = state["finish"][row][0]
+        else:
+            reason = "length"
+        self.requests += 1
+        self.truncated += truncated
+        return {
+            "answer": answer.strip(),
+            "truncated": truncated,
+            "stop_reason": reason,
+            "new_tokens": int(len(new_ids)),
+            "seconds": time.perf_counter() - started,
+        }
+
+    def generate(self, prompt: str, budget: Optional[float] = None, streamer=None) -> Dict[str, Any]:
+        """Answer ``prompt``: ``{"answer", "truncated", "stop_reason", "new_tokens", "seconds"}``"""
+        started = time.perf_counter()
+        state: Dict[str, Any] = {}
+        criteria = _stopping_criteria(self.tokenizer, self._deadline(started, budget),
+                                      self.stop_sequences, state)
+        input_ids, output = self.generator.generate_ids(prompt, streamer=streamer, stopping_criteria=criteria)
+        return self._result(output[0, input_ids.shape[1]:], state, started)
+
+    def generate_batch(self, prompts: List[str], budget: Optional[float] = None,
+                       streamer: Optional[BatchStreamer] = None) -> List[Dict[str, Any]]:
+        """Answer ``prompts`` in one left-padded batch sharing one budget
+
+        When the budget runs out, only the rows that had not yet finished are
+        marked ``truncated``. ``streamer`` receives each row's text as it is
+        decoded.
+        """
+        import torch
+        started = time.perf_counter()
+        state: Dict[str, Any] = {}
+        model = self.generator.model
+        inputs = self.tokenizer(list(prompts), return_tensors="pt", padding=True).to(model.device)
+        prompt_length = inputs["input_ids"].shape[1]
+        criteria = _stopping_criteria(self.tokenizer, self._deadline(started, budget),
+                                      self.stop_sequences, state)
+        with torch.no_grad():
+            output = model.generate(**inputs, stopping_criteria=criteria, streamer=streamer,
+                                    **self.generator.generation_kwargs)
+        results = []
+        finish = state.get("finish", {})
+        for index, row in enumerate(output[:, prompt_length:]):
+            # Rows that finished early are padded out to the longest one
+            keep = finish[index][1] if index in finish else len(row)
+            results.append(self._result(row[:keep], state, started, row=index))
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "truncated": self.truncated,
+            "budget_seconds": self.budget_seconds,
+            "stop_sequences": list(self.stop_sequences),
+        }
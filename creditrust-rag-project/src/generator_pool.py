@@ -0,0 +1,393 @@
+# src/generator_pool.py
+"""Forked generation workers sharing one copy of the model weights.
+
+A single in-process ``transformers`` pipeline serializes concurrent
+requests (or oversubscribes its intra-op threads when called from several
+threads at once). ``GeneratorPool`` is created after the model is loaded and
+forks ``workers`` processes that inherit the loaded weights copy-on-write,
+since inference never writes to them. Each worker is pinned to its own
+subset of the available cores and runs ``torch.set_num_threads`` with that
+subset's size, so N workers decode N prompts in parallel without competing
+for cores.
+
+Prompts wait in the parent and are handed to whichever worker is idle
+over that worker's own pipe, so the parent knows which prompt every worker
+is running. Answers (or streamed text pieces) come back on the same pipe
+and resolve the caller's Future or stream iterator. If a worker dies
+(OOM kill, crash), its prompt fails with a RuntimeError and a replacement
+worker is started.
+
+Fork requires a POSIX platform. Create the pool before the parent runs
+any torch inference, because forked children cannot reuse a parent's
+OpenMP thread pool. By the time a worker dies the parent has usually run
+inference (the embedding model, at least), so replacements are not forked
+from it: a template process, forked together with the first workers,
+forks them instead and never runs inference itself. The parent watches
+those workers through a pidfd (Linux); elsewhere replacements are forked
+from the parent as a fallback.
+"""
+import gc
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import select
+import threading
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import connection as mp_connection
+from multiprocessing import reduction
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STREAM_END = object()
+
+
+def core_subsets(workers: int, threads_per_worker: Optional[int] = None) -> List[List[int]]:
+    """Split the cores this process may use into one disjoint subset per worker
+
+    Subsets wrap around when ``workers * threads_per_worker`` exceeds the cores available.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    threads = threads_per_worker or max(1, len(cores) // workers)
+    return [[cores[(w * threads + t) % len(cores)] for t in range(threads)] for w in range(workers)]
+
+
+def _worker_main(cores: List[int], connection, generate: Callable[[str], Dict[str, Any]],
+                 stream: Optional[Callable[[str, Dict[str, Any]], Iterable[str]]]):
+    """Worker loop: pin to ``cores``, then answer prompts until the stop sentinel"""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    try:
+        import torch
+        torch.set_num_threads(len(cores))
+    except ImportError:
+        pass
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        task_id, prompt, streaming = task
+        try:
+            if streaming:
+                outcome: Dict[str, Any] = {}
+                for piece in stream(prompt, outcome):
+                    connection.send((task_id, "piece", piece))
+                connection.send((task_id, "done", outcome))
+            else:
+                connection.send((task_id, "done", generate(prompt)))
+        except Exception as e:
+            connection.send((task_id, "error", f"{type(e).__name__}: {e}"))
+
+
+def _template_main(connection, core_sets: List[List[int]], generate: Callable[[str], Dict[str, Any]],
+                   stream: Optional[Callable[[str, Dict[str, Any]], Iterable[str]]]):
+    """Template loop: fork workers on request from a process that never runs inference
+
+    ``("fork", index)`` is followed by the worker's pipe end (a file
+    descriptor) and answered with the new worker's pid; ``("reap", pid)``
+    waits for an exited worker and answers with its exit code.
+    """
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        kind, value = request
+        if kind == "reap":
+            _, status = os.waitpid(value, 0)
+            connection.send(os.waitstatus_to_exitcode(status))
+            continue
+        fd = reduction.recv_handle(connection)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                connection.close()
+                _worker_main(core_sets[value], mp_connection.Connection(fd), generate, stream)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(fd)
+        connection.send(pid)
+
+
+class _Template:
+    """The parent's handle on the template process"""
+
+    def __init__(self, context, core_sets: List[List[int]], generate, stream):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_template_main, name="rag-generator-template",
+                                       args=(child, core_sets, generate, stream), daemon=True)
+        self.process.start()
+        child.close()
+        self._lock = threading.Lock()
+
+    def fork_worker(self, index: int, connection) -> "_TemplateChild":
+        """Fork worker ``index`` around ``connection`` (the worker's pipe end)"""
+        with self._lock:
+            self.connection.send(("fork", index))
+            reduction.send_handle(self.connection, connection.fileno(), self.process.pid)
+            pid = self.connection.recv()
+        return _TemplateChild(pid, self)
+
+    def reap(self, pid: int) -> int:
+        with self._lock:
+            self.connection.send(("reap", pid))
+            return self.connection.recv()
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.connection.close()
+
+
+class _TemplateChild:
+    """A worker forked by the template, with the ``multiprocessing.Process`` calls the pool uses"""
+
+    def __init__(self, pid: int, template: _Template):
+        self.pid = pid
+        self.sentinel = os.pidfd_open(pid)
+        self.exitcode: Optional[int] = None
+        self._template = template
+
+    def is_alive(self) -> bool:
+        if self.exitcode is not None:
+            return False
+        readable, _, _ = select.select([self.sentinel], [], [], 0)
+        return not readable
+
+    def join(self):
+        if self.exitcode is None:
+            mp_connection.wait([self.sentinel])
+            self.exitcode = self._template.reap(self.pid)
+            os.close(self.sentinel)
+
+
+class _Stream:
+    """Iterator over pieces a worker streams back for one prompt"""
+
+    def __init__(self, result: Optional[Dict[str, Any]] = None):
+        self.pieces: "queue.Queue" = queue.Queue()
+        self.result: Dict[str, Any] = {} if result is None else result
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            piece = self.pieces.get()
+            if piece is _STREAM_END:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+
+class _Worker:
+    """One forked process, its end of the task pipe and the task it is running"""
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.task: Optional[int] = None
+        self.stopping = False
+
+
+class GeneratorPool:
+    """Forked generation workers, each handed one prompt at a time"""
+
+    def __init__(self, generate: Callable[[str], Dict[str, Any]], workers: int = 2,
+                 threads_per_worker: Optional[int] = None,
+                 stream: Optional[Callable[[str, Dict[str, Any]], Iterable[str]]] = None):
+        """
+        Args:
+            generate: ``prompt -> result dict`` using the already-loaded model; runs in the workers
+            workers: Number of forked processes
+            threads_per_worker: Cores (and torch threads) per worker; defaults to an even split
+            stream: Optional ``(prompt, result) -> pieces`` used by ``stream``; it fills
+                ``result`` with the generation outcome before it finishes
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self._context = mp.get_context("fork")
+        self._generate = generate
+        self._stream = stream
+        self.core_sets = core_subsets(workers, threads_per_worker)
+        self._backlog: "deque" = deque()
+        self._pending: Dict[int, object] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._closed = False
+        self.restarts = 0
+        # Before the workers, so the template holds none of their pipes
+        self._template = (_Template(self._context, self.core_sets, generate, stream)
+                          if hasattr(os, "pidfd_open") else None)
+        self._workers = [self._spawn(index) for index in range(workers)]
+        self._collector = threading.Thread(target=self._collect, name="rag-generator-results", daemon=True)
+        self._collector.start()
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    def _spawn(self, index: int, replacement: bool = False) -> _Worker:
+        parent, child = self._context.Pipe()
+        if replacement and self._template is not None:
+            process = self._template.fork_worker(index, child)
+            child.close()
+            return _Worker(process, parent)
+        # Keep the parent's existing objects out of the cyclic GC so collections in the
+        # children do not write to (and un-share) the pages that hold them
+        gc.collect()
+        gc.freeze()
+        try:
+            process = self._context.Process(target=_worker_main, name=f"rag-generator-{index}",
+                                            args=(self.core_sets[index], child, self._generate, self._stream),
+                                            daemon=True)
+            process.start()
+        finally:
+            gc.unfreeze()
+        # Once the child holds the only copy, its death shows up as EOF on ``parent``
+        child.close()
+        return _Worker(process, parent)
+
+    def _dispatch(self):
+        """Hand queued prompts to idle workers, or stop them once closed (caller holds the lock)"""
+        for worker in self._workers:
+            if worker.task is not None or worker.stopping or not worker.process.is_alive():
+                continue
+            if self._backlog:
+                task = self._backlog.popleft()
+                worker.task = task[0]
+                worker.connection.send(task)
+            elif self._closed:
+                worker.stopping = True
+                worker.connection.send(None)
+
+    def _submit(self, prompt: str, handle, streaming: bool):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("generator pool is closed")
+            task_id = next(self._ids)
+            self._pending[task_id] = handle
+            self._backlog.append((task_id, prompt, streaming))
+            self._dispatch()
+        return handle
+
+    def submit(self, prompt: str) -> Future:
+        """Queue a prompt; the Future resolves to the worker's result dict"""
+        return self._submit(prompt, Future(), streaming=False)
+
+    def generate(self, prompt: str) -> Dict[str, Any]:
+        return self.submit(prompt).result()
+
+    def generate_many(self, prompts: List[str]) -> List[Dict[str, Any]]:
+        """Results for ``prompts`` in order, decoded in parallel across the workers"""
+        futures = [self.submit(prompt) for prompt in prompts]
+        return [future.result() for future in futures]
+
+    def stream(self, prompt: str, result: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Yield answer pieces as a worker decodes them; ``result`` receives the outcome at the end"""
+        return iter(self._submit(prompt, _Stream(result), streaming=True))
+
+    def _resolve(self, task_id: int, kind: str, payload):
+        with self._lock:
+            handle = self._pending.get(task_id) if kind == "piece" else self._pending.pop(task_id, None)
+        if handle is None:
+            return
+        if isinstance(handle, Future):
+            if handle.cancelled():
+                return
+            if kind == "done":
+                handle.set_result(payload)
+            else:
+                handle.set_exception(RuntimeError(payload))
+        elif kind == "piece":
+            handle.pieces.put(payload)
+        else:
+            if kind == "done":
+                handle.result.update(payload or {})
+            else:
+                handle.pieces.put(RuntimeError(payload))
+            handle.pieces.put(_STREAM_END)
+
+    def _collect(self):
+        """Route worker messages to their callers and replace workers that die"""
+        while True:
+            with self._lock:
+                waitables = {}
+                for worker in self._workers:
+                    if worker.stopping and worker.task is None and not worker.process.is_alive():
+                        continue
+                    waitables[worker.connection] = worker
+                    waitables[worker.process.sentinel] = worker
+                if self._closed and not waitables:
+                    return
+            for ready in mp_connection.wait(list(waitables), timeout=1.0):
+                worker = waitables[ready]
+                if ready is worker.connection:
+                    self._receive(worker)
+                else:
+                    self._worker_exited(worker)
+
+    def _receive(self, worker: _Worker) -> bool:
+        """Handle every message waiting on ``worker``'s pipe; False once the pipe is gone"""
+        try:
+            while worker.connection.poll():
+                task_id, kind, payload = worker.connection.recv()
+                if kind != "piece":
+                    with self._lock:
+                        worker.task = None
+                        self._dispatch()
+                self._resolve(task_id, kind, payload)
+        except (EOFError, OSError):
+            return False  # the process sentinel reports the exit
+        return True
+
+    def _worker_exited(self, worker: _Worker):
+        """Fail the prompt a dead worker was running and, unless closing, start a replacement"""
+        if worker.connection.closed:
+            return
+        worker.process.join()
+        # Answers sent just before the exit are still in the pipe
+        self._receive(worker)
+        worker.connection.close()
+        index = self._workers.index(worker)
+        message = f"generator worker {index} exited with code {worker.process.exitcode}"
+        with self._lock:
+            task, worker.task = worker.task, None
+        if task is not None:
+            self._resolve(task, "error", message)
+        with self._lock:
+            if worker.stopping or self._closed:
+                worker.stopping = True
+                return
+            logger.warning("%s; starting a replacement", message)
+            self._workers[index] = self._spawn(index, replacement=True)
+            self.restarts += 1
+            self._dispatch()
+
+    def close(self):
+        """Stop the workers once the prompts already queued are answered"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._dispatch()
+        self._collector.join()
+        for worker in self._workers:
+            worker.process.join()
+        if self._template is not None:
+            self._template.close()
@@ -0,0 +1,215 @@
+# src/http_service.py
+"""Headless JSON API over the shared RAG pipeline.
+
+Endpoints:
+    POST /query        {"question", "k", "filters"} -> the dict RAGPipeline.query returns
+    POST /query/batch  {"questions", "k", "filters"} -> {"results": [...]}
+    GET  /health       liveness; always 200 while the process is up
+    GET  /ready        200 once the pipeline is serving, 503 while loading or in demo mode
+    GET  /metrics      request counts, latency percentiles, batching and cache stats
+    POST /admin/reload load segments appended, deleted or compacted since the store was loaded
+
+The event loop never runs pipeline work: questions are handed to the
+runtime's ``MicroBatchScheduler`` (whose worker thread does the encoding,
+retrieval and generation) and awaited as futures, and responses are
+serialized on a thread pool. At most ``max_concurrency`` requests are
+answered at once and ``max_pending`` more may wait for a slot; beyond that
+requests get 429. Each request has ``request_timeout`` seconds end to end
+(504 when exceeded; questions still queued for a batch are cancelled).
+Filters on unknown fields or with malformed conditions get 400.
+"""
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field
+
+from metadata_index import FilterError
+from runtime import PipelineRuntime
+
+METRIC_WINDOW = 10_000
+
+
+class QueryRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    k: int = Field(5, ge=1, le=50)
+    filters: Optional[Dict[str, Any]] = None
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1)
+    k: int = Field(5, ge=1, le=50)
+    filters: Optional[Dict[str, Any]] = None
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _dumps(payload) -> bytes:
+    return json.dumps(payload, default=_json_default, ensure_ascii=False).encode("utf-8")
+
+
+class QueryService:
+    """Admission control, timeouts and metrics around a ``PipelineRuntime``"""
+
+    def __init__(self, runtime: PipelineRuntime, max_concurrency: int = 4, max_pending: int = 64,
+                 request_timeout: float = 60.0, max_batch_questions: int = 32,
+                 serialize_workers: int = 2):
+        self.runtime = runtime
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.max_batch_questions = max_batch_questions
+        self.executor = ThreadPoolExecutor(serialize_workers, thread_name_prefix="rag-http")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.status_counts: Counter = Counter()
+        self.endpoint_counts: Counter = Counter()
+        self._latencies = deque(maxlen=METRIC_WINDOW)
+
+    async def respond(self, payload, status: int = 200) -> Response:
+        body = await asyncio.get_running_loop().run_in_executor(self.executor, _dumps, payload)
+        return Response(content=body, status_code=status, media_type="application/json")
+
+    def _record(self, endpoint: str, status: int, started: float):
+        self.endpoint_counts[endpoint] += 1
+        self.status_counts[status] += 1
+        self._latencies.append(time.perf_counter() - started)
+
+    async def _answer(self, questions: List[str], k: int, filters: Optional[Dict[str, Any]]):
+        scheduler = self.runtime.scheduler
+        futures = [scheduler.submit(question, k, filters) for question in questions]
+        try:
+            return await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        finally:
+            for future in futures:
+                future.cancel()  # no-op once answered; drops questions still waiting for a batch
+
+    async def handle(self, endpoint: str, questions: List[str], k: int,
+                     filters: Optional[Dict[str, Any]]) -> Response:
+        started = time.perf_counter()
+        status, payload = 200, None
+        if not self.runtime.is_ready:
+            status, payload = 503, {"error": "pipeline not ready", "state": self.runtime.state}
+        elif len(questions) > self.max_batch_questions:
+            status, payload = 413, {"error": f"at most {self.max_batch_questions} questions per batch"}
+        elif self.waiting >= self.max_pending:
+            status, payload = 429, {"error": "too many pending requests"}
+        else:
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(self.max_concurrency)
+            deadline = started + self.request_timeout
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.request_timeout)
+            except asyncio.TimeoutError:
+                status, payload = 504, {"error": "timed out waiting for a free slot"}
+            finally:
+                self.waiting -= 1
+            if payload is None:
+                self.in_flight += 1
+                try:
+                    results = await asyncio.wait_for(self._answer(questions, k, filters),
+                                                     timeout=max(0.0, deadline - time.perf_counter()))
+                    payload = results[0] if endpoint == "query" else {"results": results}
+                except asyncio.TimeoutError:
+                    status, payload = 504, {"error": f"request exceeded {self.request_timeout:.0f}s"}
+                except FilterError as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    print(f"✗ {endpoint} failed: {e}")
+                    status, payload = 500, {"error": str(e)}
+                finally:
+                    self.in_flight -= 1
+                    self._slots.release()
+        self._record(endpoint, status, started)
+        return await self.respond(payload, status)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.array(self._latencies) * 1000
+        rag = self.runtime.rag_system
+        stats: Dict[str, Any] = {
+            "state": self.runtime.state,
+            "uptime_seconds": time.time() - self.runtime.started_at,
+            "startup_seconds": dict(self.runtime.timings),
+            "requests": dict(self.endpoint_counts),
+            "responses": {str(status): count for status, count in sorted(self.status_counts.items())},
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+            "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "latency_ms_p95": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        }
+        if self.runtime.scheduler is not None:
+            stats["batching"] = self.runtime.scheduler.stats()
+        if rag is not None:
+            stats["question_cache"] = rag.question_cache.stats()
+            if rag.answer_cache is not None:
+                stats["answer_cache"] = rag.answer_cache.stats()
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def create_service(runtime: PipelineRuntime, **options) -> FastAPI:
+    """FastAPI app serving ``runtime``; ``options`` are passed to ``QueryService``"""
+    service = QueryService(runtime, **options)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        service.close()
+
+    app = FastAPI(title="CrediTrust RAG query service", lifespan=lifespan)
+    app.state.service = service
+
+    @app.post("/query")
+    async def query(request: QueryRequest):
+        return await service.handle("query", [request.question], request.k, request.filters)
+
+    @app.post("/query/batch")
+    async def query_batch(request: BatchQueryRequest):
+        return await service.handle("batch", request.questions, request.k, request.filters)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "state": runtime.state}
+
+    @app.get("/ready")
+    async def ready():
+        body = {"ready": runtime.is_ready, "state": runtime.state}
+        if runtime.error:
+            body["error"] = runtime.error
+        return JSONResponse(body, status_code=200 if runtime.is_ready else 503)
+
+    @app.post("/admin/reload")
+    async def reload_store():
+        if not runtime.is_ready:
+            return JSONResponse({"error": "pipeline not ready", "state": runtime.state}, status_code=503)
+        try:
+            reloaded = await asyncio.to_thread(runtime.reload_store)
+        except Exception as e:
+            print(f"✗ Store reload failed: {e}")
+            return JSONResponse({"error": str(e)}, status_code=500)
+        return {"reloaded": reloaded, "store_version": runtime.rag_system.vector_store.version}
+
+    @app.get("/metrics")
+    async def metrics():
+        return await service.respond(service.stats())
+
+    return app
@@ -0,0 +1,177 @@
+# src/ingestion.py
+"""Streaming, resumable ingestion of the CFPB complaints CSV into a segmented store.
+
+The CSV is read ``read_rows`` records at a time; each block is filtered to
+the target products, cleaned, chunked and embedded in batches, then appended
+to the store as one segment. Memory therefore depends on the block size,
+not on the size of the file.
+
+Progress (records consumed, the byte offset they end at, chunks written)
+is saved in the store manifest in the same atomic swap that publishes each
+segment. After a crash, re-running the same command seeks past the records
+already ingested and continues with the next block, so resuming costs the
+same however far the previous run got.
+"""
+import io
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from segments import SegmentedVectorStore
+from text_processing import clean_and_chunk
+
+TARGET_PRODUCTS = ("Credit card", "Personal loan", "Savings account", "Money transfer")
+NARRATIVE_COLUMN = "Consumer complaint narrative"
+METADATA_COLUMNS = {
+    "Complaint ID": "complaint_id",
+    "Product": "product",
+    "Sub-product": "sub_product",
+    "Issue": "issue",
+    "Company": "company",
+    "State": "state",
+    "Date received": "date_received",
+}
+SOURCE_NAME = "ingest"
+
+
+def _iter_records(f, read_rows: int) -> Iterator[Tuple[bytes, int]]:
+    """Yield ``(raw_records, count)`` for up to ``read_rows`` CSV records at a time from binary ``f``
+
+    A record ends at the first newline with an even number of quotes since
+    its start, so quoted narratives may span lines. Blank lines are dropped,
+    as ``pd.read_csv`` does.
+    """
+    lines: List[bytes] = []
+    count = quotes = 0
+    for line in iter(f.readline, b""):
+        if not lines and not line.strip():
+            continue
+        lines.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            count += 1
+            quotes = 0
+            if count == read_rows:
+                yield b"".join(lines), count
+                lines, count = [], 0
+    if lines:
+        # A final record without a closing quote still counts once
+        yield b"".join(lines), count + (1 if quotes else 0)
+
+
+def iter_complaint_blocks(csv_path: str, read_rows: int = 10_000, offset: int = 0, records_done: int = 0,
+                          products: Optional[Sequence[str]] = TARGET_PRODUCTS
+                          ) -> Iterator[Tuple[int, int, pd.DataFrame]]:
+    """Yield ``(records_consumed, byte_offset, filtered_block)`` for successive CSV blocks.
+
+    Only the narrative and metadata columns are parsed. ``records_consumed``
+    counts every CSV record read so far (kept or not, starting from
+    ``records_done``) and ``byte_offset`` is where the next block starts;
+    a resume passes both back. ``offset=0`` starts after the header.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [c for c in [NARRATIVE_COLUMN, *METADATA_COLUMNS] if c in header]
+    if NARRATIVE_COLUMN not in usecols:
+        raise ValueError(f"{csv_path} has no '{NARRATIVE_COLUMN}' column")
+    consumed = records_done
+    with open(csv_path, "rb") as f:
+        if offset:
+            f.seek(offset)
+        else:
+            next(_iter_records(f, 1), None)
+        for raw, count in _iter_records(f, read_rows):
+            consumed += count
+            block = pd.read_csv(io.BytesIO(raw), header=None, names=header, usecols=usecols, dtype=str)
+            block = block[block[NARRATIVE_COLUMN].notna()]
+            if products is not None and "Product" in block:
+                block = block[block["Product"].isin(products)]
+            yield consumed, f.tell(), block
+
+
+def chunk_block(block: pd.DataFrame, chunk_size: int = 500, chunk_overlap: int = 50,
+                executor: Optional[Executor] = None) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Clean and chunk the narratives of one block, carrying complaint metadata"""
+    chunks: List[str] = []
+    metadata: List[Dict[str, Any]] = []
+    columns = [c for c in METADATA_COLUMNS if c in block]
+    records = block[columns].to_dict("records")
+    pieces_per_row = clean_and_chunk(block[NARRATIVE_COLUMN].tolist(), chunk_size, chunk_overlap,
+                                     executor=executor)
+    for pieces, record in zip(pieces_per_row, records):
+        base = {METADATA_COLUMNS[c]: v for c, v in record.items() if pd.notna(v)}
+        for position, piece in enumerate(pieces):
+            chunks.append(piece)
+            metadata.append(dict(base, chunk_index=position, chunk_count=len(pieces)))
+    return chunks, metadata
+
+
+def ingest_complaints(csv_path: str, store_dir: str, encode: Callable[[List[str]], np.ndarray],
+                      model_name: str, read_rows: int = 10_000, chunk_size: int = 500,
+                      chunk_overlap: int = 50, products: Optional[Sequence[str]] = TARGET_PRODUCTS,
+                      max_blocks: Optional[int] = None, workers: int = 1,
+                      tokenizer=None) -> Dict[str, Any]:
+    """Stream ``csv_path`` into the segmented store at ``store_dir``, resuming if possible.
+
+    ``encode`` maps a list of chunk texts to row-normalized float32
+    embeddings. With ``workers > 1`` cleaning and chunking run on a process
+    pool. With the generator's ``tokenizer`` each segment also gets its
+    chunk token counts. Returns a summary of the run.
+    """
+    settings = {"csv": os.path.abspath(csv_path), "model": model_name, "read_rows": read_rows,
+                "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                "products": list(products) if products is not None else None}
+    if SegmentedVectorStore.is_segmented_store(store_dir):
+        store = SegmentedVectorStore(store_dir, tokenizer=tokenizer)
+    else:
+        store = SegmentedVectorStore.create(store_dir, tokenizer=tokenizer)
+
+    checkpoint = store.source_record(SOURCE_NAME)
+    skip_rows = offset = 0
+    if checkpoint is not None:
+        changed = {key for key, value in settings.items() if checkpoint.get(key) != value}
+        if changed:
+            raise ValueError(f"Store at {store_dir} was ingested with different settings "
+                             f"({', '.join(sorted(changed))}); use a new store directory")
+        skip_rows, offset = checkpoint["rows_done"], checkpoint.get("byte_offset")
+        if offset is None:
+            # Checkpoint from before byte offsets were recorded: find it by counting records once
+            with open(csv_path, "rb") as f:
+                for _ in _iter_records(f, skip_rows + 1):
+                    offset = f.tell()
+                    break
+        print(f"✓ Resuming after {skip_rows} CSV records ({checkpoint['chunks_done']} chunks already stored)")
+
+    summary = {"rows_read": 0, "rows_kept": 0, "chunks": 0, "segments": 0, "seconds": 0.0}
+    chunks_done = checkpoint["chunks_done"] if checkpoint else 0
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    start = time.perf_counter()
+    try:
+        for blocks, (consumed, offset, block) in enumerate(
+                iter_complaint_blocks(csv_path, read_rows, offset, skip_rows, products), 1):
+            chunks, metadata = chunk_block(block, chunk_size, chunk_overlap, executor)
+            chunks_done += len(chunks)
+            record = dict(settings, rows_done=consumed, byte_offset=offset, chunks_done=chunks_done)
+            if chunks:
+                store.append(chunks, encode(chunks), metadata, source={SOURCE_NAME: record})
+                summary["segments"] += 1
+            else:
+                store.record_source(SOURCE_NAME, record)
+
+            summary["rows_read"] = consumed - skip_rows
+            summary["rows_kept"] += len(block)
+            summary["chunks"] += len(chunks)
+            elapsed = time.perf_counter() - start
+            print(f"  {consumed} records read, {summary['rows_kept']} kept, {summary['chunks']} chunks "
+                  f"({summary['rows_read'] / max(elapsed, 1e-9):.0f} records/s)")
+            if max_blocks is not None and blocks >= max_blocks:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    summary["seconds"] = time.perf_counter() - start
+    summary["live_chunks"] = store.live_count
+    return summary
@@ -0,0 +1,192 @@
+# src/lexical_index.py
+"""BM25 inverted index over chunk text, plus rank fusion with dense scores.
+
+Postings are stored CSR-style as flat arrays: ``term_offsets`` slices
+``doc_ids`` and ``impacts`` per term. Impacts are the full per-posting BM25
+contribution (idf and length normalization folded in at build time), so a
+query only sums a few postings with ``np.bincount``. Raw term frequencies
+and document lengths are kept as well, so per-segment indexes can be
+merged (``concatenate``) without tokenizing the text again.
+
+The tokenizer keeps the tokens dense embeddings tend to blur: product names
+("zelle"), fee words ("overdraft") and amounts ("$2,345" -> "2345").
+"""
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann_index import top_k_indices_from_scores
+
+_TOKEN = re.compile(r"\d[\d,]*(?:\.\d+)?|[a-z][a-z0-9']*")
+STOPWORDS = frozenset(
+    "a an and are as at be been but by for from had has have he her his i if in into is it its "
+    "me my no not of on or our she so that the their them then there they this to was we were "
+    "what when which who will with would you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word and number tokens, stopwords removed, thousands separators dropped"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token[0].isdigit():
+            token = token.replace(",", "")
+        elif token in STOPWORDS:
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def lexical_index_path_for(store_path: str) -> str:
+    """Sidecar path used for a store's BM25 index"""
+    return f"{store_path}.bm25.npz"
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of documents"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.term_offsets = None
+        self.doc_ids = None
+        self.impacts = None
+        self.frequencies = None
+        self.lengths = None
+        self.count = 0
+        self.store_version = None
+
+    def build(self, texts: Iterable[str], store_version: Optional[str] = None) -> "BM25Index":
+        term_ids: List[np.ndarray] = []
+        doc_ids: List[np.ndarray] = []
+        frequencies: List[np.ndarray] = []
+        lengths = []
+        for doc, text in enumerate(texts):
+            counts = Counter(self.vocabulary.setdefault(token, len(self.vocabulary))
+                             for token in tokenize(text))
+            lengths.append(sum(counts.values()))
+            if counts:
+                term_ids.append(np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)))
+                frequencies.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+                doc_ids.append(np.full(len(counts), doc, dtype=np.int32))
+        terms = np.concatenate(term_ids) if term_ids else np.empty(0, dtype=np.int64)
+        docs = np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.int32)
+        tf = np.concatenate(frequencies) if frequencies else np.empty(0, dtype=np.float32)
+        return self._finish(terms, docs, tf, np.asarray(lengths, dtype=np.float32), store_version)
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["BM25Index"], offsets: Sequence[int],
+                    store_version: Optional[str] = None) -> "BM25Index":
+        """Merge per-segment indexes into one over the concatenated rows
+
+        Part ``i``'s documents are shifted by ``offsets[i]``. Document
+        frequencies and the average length are recomputed over all parts,
+        so scores equal those of a single build over every text.
+        """
+        index = cls(k1=parts[0].k1, b=parts[0].b) if parts else cls()
+        terms, docs, frequencies, lengths = [], [], [], []
+        for part, offset in zip(parts, offsets):
+            local_terms = sorted(part.vocabulary, key=part.vocabulary.get)
+            mapping = np.fromiter((index.vocabulary.setdefault(term, len(index.vocabulary))
+                                   for term in local_terms), dtype=np.int64, count=len(local_terms))
+            terms.append(mapping[np.repeat(np.arange(len(local_terms)), np.diff(part.term_offsets))])
+            docs.append((part.doc_ids + offset).astype(np.int32))
+            frequencies.append(part.frequencies)
+            lengths.append(part.lengths)
+        return index._finish(
+            np.concatenate(terms) if terms else np.empty(0, dtype=np.int64),
+            np.concatenate(docs) if docs else np.empty(0, dtype=np.int32),
+            np.concatenate(frequencies) if frequencies else np.empty(0, dtype=np.float32),
+            np.concatenate(lengths) if lengths else np.empty(0, dtype=np.float32),
+            store_version,
+        )
+
+    def _finish(self, terms: np.ndarray, docs: np.ndarray, tf: np.ndarray, lengths: np.ndarray,
+                store_version: Optional[str]) -> "BM25Index":
+        """Sort postings by term and fold idf and length normalization into the impacts"""
+        self.count = len(lengths)
+        self.store_version = store_version
+        order = np.argsort(terms, kind="stable")
+        terms, docs, tf = terms[order], docs[order], tf[order]
+
+        df = np.bincount(terms, minlength=len(self.vocabulary))
+        self.term_offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+        idf = np.log1p((self.count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        average = lengths.mean() if self.count else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths[docs] / max(average, 1e-9))
+        self.impacts = (idf[terms] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+        self.doc_ids = docs
+        self.frequencies = tf
+        self.lengths = lengths
+        return self
+
+    def scores(self, query: str) -> np.ndarray:
+        """Dense array of BM25 scores for every document (zero where no term matches)"""
+        postings = [self.vocabulary[token] for token in set(tokenize(query)) if token in self.vocabulary]
+        if not postings:
+            return np.zeros(self.count, dtype=np.float32)
+        slices = [slice(self.term_offsets[t], self.term_offsets[t + 1]) for t in postings]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.impacts[s] for s in slices])
+        return np.bincount(docs, weights=weights, minlength=self.count).astype(np.float32)
+
+    def search(self, query: str, k: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k documents with a positive BM25 score, best first"""
+        scores = self.scores(query)
+        if rows is not None:
+            restricted = np.zeros_like(scores)
+            restricted[rows] = scores[rows]
+            scores = restricted
+        top = top_k_indices_from_scores(scores, k)
+        top = top[scores[top] > 0]
+        return top, scores[top]
+
+    def save(self, path: str):
+        meta = {"k1": self.k1, "b": self.b, "count": self.count, "store_version": self.store_version}
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), vocabulary=np.array(json.dumps(vocabulary)),
+                 term_offsets=self.term_offsets, doc_ids=self.doc_ids, impacts=self.impacts,
+                 frequencies=self.frequencies, lengths=self.lengths)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(k1=meta["k1"], b=meta["b"])
+            index.vocabulary = {term: i for i, term in enumerate(json.loads(str(data["vocabulary"])))}
+            index.term_offsets = data["term_offsets"]
+            index.doc_ids = data["doc_ids"]
+            index.impacts = data["impacts"]
+            # Indexes written before merging was supported lack the raw statistics
+            if "frequencies" in data.files:
+                index.frequencies = data["frequencies"]
+                index.lengths = data["lengths"]
+        index.count = meta["count"]
+        index.store_version = meta["store_version"]
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], k: int = 60) -> Dict[int, float]:
+    """Sum of 1 / (k + rank) over every ranking a document appears in"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            fused[int(doc)] = fused.get(int(doc), 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def weighted_fusion(dense: Dict[int, float], lexical: Dict[int, float], alpha: float = 0.5) -> Dict[int, float]:
+    """alpha * cosine + (1 - alpha) * BM25 scaled to [0, 1] by the best lexical hit"""
+    top = max(lexical.values()) if lexical else 0.0
+    docs = set(dense) | set(lexical)
+    return {
+        doc: alpha * dense.get(doc, 0.0) + (1 - alpha) * (lexical.get(doc, 0.0) / top if top else 0.0)
+        for doc in docs
+    }
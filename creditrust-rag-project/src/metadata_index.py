@@ -0,0 +1,249 @@
+# src/metadata_index.py
+"""Precomputed inverted indexes over chunk metadata for filtered retrieval.
+
+Categorical fields (product, issue, ...) map each value to a sorted int64
+array of row ids. Date fields keep the row ids ordered by date next to the
+sorted dates, so a range resolves with two binary searches.
+
+Filters are a dict of field -> condition, combined with AND::
+
+    {"product": "Credit card"}                              # equality
+    {"product": ["Credit card", "Personal loan"]}           # set (OR)
+    {"date_received": ("2023-01-01", "2023-06-30")}         # inclusive range
+    {"date_received": {"from": "2023-01-01"}}               # open range
+
+A list works as a range on date fields (JSON has no tuples), and a single
+date matches that day. ``resolve`` returns the sorted candidate row ids, which the retrieval
+backends score directly instead of scanning the whole store.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_DATE_FIELDS = ("date_received",)
+MAX_CARDINALITY = 10_000
+_DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d")
+
+
+class FilterError(ValueError):
+    """Raised for filters on unknown fields or with malformed conditions"""
+
+
+def parse_date(value) -> Optional[int]:
+    """Parse a date value to days since the epoch, or None if it is not a date"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    text = str(value).strip()[:10]
+    for fmt in _DATE_FORMATS:
+        try:
+            return (datetime.strptime(text, fmt).date() - datetime(1970, 1, 1).date()).days
+        except ValueError:
+            continue
+    return None
+
+
+def typed_values(text: str) -> List[Any]:
+    """Values a command-line string may stand for in typed metadata (str, int or bool)"""
+    values: List[Any] = [text]
+    try:
+        values.append(int(text))
+    except ValueError:
+        pass
+    if text.lower() in ("true", "false"):
+        values.append(text.lower() == "true")
+    return values
+
+
+def metadata_index_path_for(store_path: str) -> str:
+    """Sidecar path used for a store's precomputed metadata index"""
+    return f"{store_path}.meta.npz"
+
+
+class MetadataIndex:
+    """Field -> value -> row-id postings, plus sorted date columns"""
+
+    def __init__(self, count: int, postings: Dict[str, Dict[Any, np.ndarray]],
+                 dates: Dict[str, Dict[str, np.ndarray]], store_version: Optional[str] = None,
+                 skipped: Iterable[str] = ()):
+        self.count = count
+        self.postings = postings
+        self.dates = dates
+        self.store_version = store_version
+        # Fields left out for exceeding MAX_CARDINALITY
+        self.skipped = set(skipped)
+
+    @property
+    def fields(self):
+        return sorted(set(self.postings) | set(self.dates))
+
+    @classmethod
+    def build(cls, metadata: Sequence[Dict[str, Any]], fields: Optional[Iterable[str]] = None,
+              date_fields: Iterable[str] = DEFAULT_DATE_FIELDS,
+              store_version: Optional[str] = None) -> "MetadataIndex":
+        """Build postings in one pass over the metadata.
+
+        With ``fields=None`` every scalar field is indexed unless it has more
+        than ``MAX_CARDINALITY`` distinct values (ids, free text).
+        """
+        date_fields = set(date_fields)
+        wanted = set(fields) if fields is not None else None
+        values: Dict[str, Dict[Any, list]] = {}
+        date_rows: Dict[str, list] = {name: [] for name in date_fields}
+        skipped = set()
+        for row, record in enumerate(metadata):
+            for field, value in (record or {}).items():
+                if field in date_fields:
+                    day = parse_date(value)
+                    if day is not None:
+                        date_rows[field].append((day, row))
+                    continue
+                if (wanted is not None and field not in wanted) or field in skipped:
+                    continue
+                if not isinstance(value, (str, int, bool)):
+                    continue
+                field_values = values.setdefault(field, {})
+                field_values.setdefault(value, []).append(row)
+                if wanted is None and len(field_values) > MAX_CARDINALITY:
+                    skipped.add(field)
+                    del values[field]
+
+        postings = {
+            field: {value: np.asarray(rows, dtype=np.int64) for value, rows in field_values.items()}
+            for field, field_values in values.items()
+        }
+        dates = {}
+        for field, pairs in date_rows.items():
+            if not pairs:
+                continue
+            pairs.sort()
+            dates[field] = {
+                "days": np.asarray([day for day, _ in pairs], dtype=np.int64),
+                "rows": np.asarray([row for _, row in pairs], dtype=np.int64),
+            }
+        return cls(len(metadata), postings, dates, store_version, skipped)
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["MetadataIndex"], offsets: Sequence[int],
+                    store_version: Optional[str] = None) -> "MetadataIndex":
+        """Merge per-segment indexes into one over the concatenated rows
+
+        Part ``i``'s row ids are shifted by ``offsets[i]``, so postings stay
+        sorted and equal those of a single build. Fields skipped in any part
+        are left out.
+        """
+        skipped = set().union(*(part.skipped for part in parts))
+        merged: Dict[str, Dict[Any, list]] = {}
+        date_parts: Dict[str, list] = {}
+        for part, offset in zip(parts, offsets):
+            for field, postings in part.postings.items():
+                if field in skipped:
+                    continue
+                field_values = merged.setdefault(field, {})
+                for value, rows in postings.items():
+                    field_values.setdefault(value, []).append(rows + offset)
+            for field, column in part.dates.items():
+                date_parts.setdefault(field, []).append((column["days"], column["rows"] + offset))
+        postings = {
+            field: {value: np.concatenate(rows) for value, rows in field_values.items()}
+            for field, field_values in merged.items()
+        }
+        dates = {}
+        for field, columns in date_parts.items():
+            days = np.concatenate([days for days, _ in columns])
+            rows = np.concatenate([rows for _, rows in columns])
+            # Stable, so equal days keep ascending rows as in a single build
+            order = np.argsort(days, kind="stable")
+            dates[field] = {"days": days[order], "rows": rows[order]}
+        count = int(offsets[len(parts)]) if parts else 0
+        return cls(count, postings, dates, store_version, skipped)
+
+    def resolve(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Return sorted row ids matching every filter, or None for no filtering"""
+        if not filters:
+            return None
+        result = None
+        for field, condition in filters.items():
+            if field in self.dates:
+                if not isinstance(condition, (tuple, list, dict)):
+                    condition = (condition, condition)
+                rows = self._resolve_range(field, condition)
+            elif field in self.postings:
+                rows = self._resolve_values(field, condition)
+            else:
+                raise FilterError(f"Cannot filter on '{field}'; indexed fields: {self.fields}")
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+    def _resolve_values(self, field: str, condition) -> np.ndarray:
+        postings = self.postings[field]
+        try:
+            if isinstance(condition, (list, tuple, set, frozenset)):
+                parts = [postings[value] for value in condition if value in postings]
+                if not parts:
+                    return np.empty(0, dtype=np.int64)
+                # Postings of different values are disjoint, so a sort is a union
+                return np.sort(np.concatenate(parts)) if len(parts) > 1 else parts[0]
+            return postings.get(condition, np.empty(0, dtype=np.int64))
+        except TypeError:
+            raise FilterError(f"'{field}' takes a value or a list of values, got {condition!r}")
+
+    def _resolve_range(self, field: str, condition) -> np.ndarray:
+        if isinstance(condition, dict) and set(condition) <= {"from", "to"}:
+            start, end = condition.get("from"), condition.get("to")
+        elif isinstance(condition, (tuple, list)) and len(condition) == 2:
+            start, end = condition
+        else:
+            raise FilterError(f"'{field}' takes a date, (from, to) or {{'from': ..., 'to': ...}}, got {condition!r}")
+        bounds = []
+        for bound in (start, end):
+            day = None if bound is None else parse_date(bound)
+            if bound is not None and day is None:
+                raise FilterError(f"'{field}': cannot parse date {bound!r}")
+            bounds.append(day)
+        column = self.dates[field]
+        lo = 0 if bounds[0] is None else np.searchsorted(column["days"], bounds[0], side="left")
+        hi = len(column["days"]) if bounds[1] is None else np.searchsorted(column["days"], bounds[1], side="right")
+        return np.sort(column["rows"][lo:hi])
+
+    def save(self, path: str):
+        """Write the postings as flat arrays to an ``.npz`` file"""
+        meta = {"count": self.count, "store_version": self.store_version,
+                "fields": {}, "date_fields": sorted(self.dates), "skipped": sorted(self.skipped)}
+        arrays = {}
+        for i, (field, postings) in enumerate(self.postings.items()):
+            keys = list(postings)
+            lengths = [len(postings[key]) for key in keys]
+            meta["fields"][field] = {"slot": i, "values": keys}
+            arrays[f"f{i}_offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+            arrays[f"f{i}_rows"] = (np.concatenate([postings[key] for key in keys])
+                                    if keys else np.empty(0, dtype=np.int64))
+        for i, field in enumerate(meta["date_fields"]):
+            arrays[f"d{i}_days"] = self.dates[field]["days"]
+            arrays[f"d{i}_rows"] = self.dates[field]["rows"]
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataIndex":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            postings = {}
+            for field, info in meta["fields"].items():
+                offsets = data[f"f{info['slot']}_offsets"]
+                rows = data[f"f{info['slot']}_rows"]
+                postings[field] = {
+                    value: rows[offsets[j]:offsets[j + 1]] for j, value in enumerate(info["values"])
+                }
+            dates = {
+                field: {"days": data[f"d{i}_days"], "rows": data[f"d{i}_rows"]}
+                for i, field in enumerate(meta["date_fields"])
+            }
+        return cls(meta["count"], postings, dates, meta["store_version"], meta.get("skipped", ()))
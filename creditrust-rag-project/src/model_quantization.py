@@ -0,0 +1,195 @@
+# src/model_quantization.py
+"""Opt-in reduced-precision CPU inference for the embedder and generator.
+
+Inference modes:
+    "fp32"  full-precision weights (default)
+    "int8"  ``torch.ao.quantization.quantize_dynamic`` on every Linear layer:
+            int8 weights, activations quantized on the fly
+    "onnx"  an exported ONNX graph run by ONNX Runtime (sentence-transformers'
+            ``backend="onnx"`` and optimum's ``ORTModelForCausalLM``); falls
+            back to "int8" when onnxruntime/optimum are not installed
+
+GPT-2 implements its projections with transformers' ``Conv1D`` (a Linear
+with transposed weights), which dynamic quantization does not recognise,
+so those layers are converted to ``nn.Linear`` first.
+
+The embedding vectors in the store were computed in fp32, so a quantized
+embedder shifts question vectors relative to them. Use ``check_inference_mode``
+(or check_quantization.py) to measure the speedup, cosine drift and top-k
+retrieval overlap before adopting a mode. (Compressed storage of the
+embedding matrix itself is handled separately by quantization.py.)
+"""
+import importlib.util
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+INFERENCE_MODES = ("fp32", "int8", "onnx")
+
+
+def onnx_available(generator: bool = False) -> bool:
+    """ONNX Runtime is installed (and optimum, which the generator export needs)"""
+    names = ("onnxruntime", "optimum") if generator else ("onnxruntime",)
+    return all(importlib.util.find_spec(name) is not None for name in names)
+
+
+def resolve_mode(mode: str, generator: bool = False) -> str:
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown inference mode '{mode}' (choose from {', '.join(INFERENCE_MODES)})")
+    if mode == "onnx" and not onnx_available(generator):
+        print("⚠️ ONNX Runtime (and optimum for the generator) not installed; using int8 dynamic quantization")
+        return "int8"
+    return mode
+
+
+def _conv1d_to_linear(model):
+    """Replace transformers ``Conv1D`` layers (GPT-2) with equivalent ``nn.Linear`` layers"""
+    import torch
+    try:
+        from transformers.pytorch_utils import Conv1D
+    except ImportError:
+        return model
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+    return model
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of the Linear layers of ``model`` (in place, CPU)"""
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+    model = _conv1d_to_linear(model).to("cpu").eval()
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_embedder(model_name: str, mode: str = "fp32"):
+    """SentenceTransformer in the requested inference mode"""
+    from sentence_transformers import SentenceTransformer
+    mode = resolve_mode(mode)
+    if mode == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    model = SentenceTransformer(model_name, device="cpu" if mode == "int8" else None)
+    if mode == "int8":
+        quantize_int8(model)
+    return model
+
+
+def quantize_generator(generator, model_name: str, mode: str, **generation_kwargs):
+    """Swap the text-generation pipeline's model for its int8 or ONNX Runtime version
+
+    ``generation_kwargs`` are the options ``generator`` was built with; the
+    ONNX Runtime pipeline is rebuilt with the same ones.
+    """
+    mode = resolve_mode(mode, generator=True)
+    if mode == "int8":
+        quantize_int8(generator.model)
+    elif mode == "onnx":
+        from optimum.onnxruntime import ORTModelForCausalLM
+        from transformers import pipeline
+        model = ORTModelForCausalLM.from_pretrained(model_name, export=True)
+        generator = pipeline("text-generation", model=model, tokenizer=generator.tokenizer,
+                             **generation_kwargs)
+    return generator
+
+
+def _timed(fn, repeats: int) -> float:
+    fn()  # first call pays one-off costs
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def check_embedder(model_name: str, mode: str, texts: Sequence[str], store_embeddings: np.ndarray,
+                   questions: Sequence[str], k: int = 5, repeats: int = 3) -> Dict[str, float]:
+    """Latency, cosine drift and top-k retrieval overlap of ``mode`` against fp32"""
+    from ann_index import top_k_indices_from_scores
+    texts, questions = list(texts), list(questions)
+    reference, candidate = load_embedder(model_name, "fp32"), load_embedder(model_name, mode)
+
+    def encode(model, batch):
+        return model.encode(batch, batch_size=32, convert_to_numpy=True,
+                            normalize_embeddings=True).astype(np.float32)
+
+    fp32_seconds = _timed(lambda: encode(reference, texts), repeats)
+    mode_seconds = _timed(lambda: encode(candidate, texts), repeats)
+    cosine = np.sum(encode(reference, texts) * encode(candidate, texts), axis=1)
+
+    overlaps = []
+    fp32_questions, mode_questions = encode(reference, questions), encode(candidate, questions)
+    for expected, actual in zip(fp32_questions, mode_questions):
+        top_expected = top_k_indices_from_scores(store_embeddings @ expected, k)
+        top_actual = top_k_indices_from_scores(store_embeddings @ actual, k)
+        overlaps.append(len(set(top_expected.tolist()) & set(top_actual.tolist())) / max(len(top_expected), 1))
+    return {
+        "fp32_ms_per_text": fp32_seconds / len(texts) * 1000,
+        "ms_per_text": mode_seconds / len(texts) * 1000,
+        "speedup": fp32_seconds / mode_seconds,
+        "cosine_drift_mean": float(1 - cosine.mean()),
+        "cosine_drift_max": float(1 - cosine.min()),
+        "retrieval_overlap_at_k": float(np.mean(overlaps)),
+        "k": k,
+    }
+
+
+def check_generator(model_name: str, mode: str, prompts: Sequence[str], max_new_tokens: int = 32,
+                    repeats: int = 1) -> Dict[str, float]:
+    """Latency and greedy-output agreement of ``mode`` against fp32"""
+    from transformers import pipeline
+    options = {"max_new_tokens": max_new_tokens, "do_sample": False}
+    reference = pipeline("text-generation", model=model_name, device="cpu", **options)
+    candidate = quantize_generator(pipeline("text-generation", model=model_name, device="cpu", **options),
+                                   model_name, mode, **options)
+
+    def answers(generator) -> List[str]:
+        return [output[0]["generated_text"][len(prompt):] for prompt, output in
+                zip(prompts, (generator(prompt) for prompt in prompts))]
+
+    fp32_seconds = _timed(lambda: answers(reference), repeats)
+    mode_seconds = _timed(lambda: answers(candidate), repeats)
+    same = sum(a == b for a, b in zip(answers(reference), answers(candidate)))
+    return {
+        "fp32_ms_per_prompt": fp32_seconds / len(prompts) * 1000,
+        "ms_per_prompt": mode_seconds / len(prompts) * 1000,
+        "speedup": fp32_seconds / mode_seconds,
+        "identical_answers": same / len(prompts),
+    }
+
+
+def check_inference_mode(mode: str, store, questions: Sequence[str], embedder_name: str,
+                         generator_name: Optional[str] = None, sample_chunks: int = 256,
+                         k: int = 5, prompts: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Compare ``mode`` with fp32 on a store: embedder always, generator when named"""
+    rows = np.linspace(0, len(store) - 1, num=min(sample_chunks, len(store)), dtype=np.int64)
+    texts = [store.chunks[int(row)] for row in np.unique(rows)]
+    report: Dict[str, Any] = {
+        "mode": resolve_mode(mode),
+        "embedder": check_embedder(embedder_name, mode, texts, np.asarray(store.embeddings), questions, k=k),
+    }
+    if generator_name:
+        report["generator"] = check_generator(generator_name, mode, prompts or questions)
+    return report
+
+
+def format_check(report: Dict[str, Any]) -> str:
+    embedder = report["embedder"]
+    lines = [
+        f"Inference mode: {report['mode']} vs fp32",
+        f"  Embedder: {embedder['ms_per_text']:.2f} ms/text vs {embedder['fp32_ms_per_text']:.2f} "
+        f"({embedder['speedup']:.2f}x), cosine drift mean {embedder['cosine_drift_mean']:.4f} "
+        f"/ max {embedder['cosine_drift_max']:.4f}, top-{embedder['k']} overlap "
+        f"{embedder['retrieval_overlap_at_k']:.1%}",
+    ]
+    if "generator" in report:
+        generator = report["generator"]
+        lines.append(f"  Generator: {generator['ms_per_prompt']:.0f} ms/prompt vs "
+                     f"{generator['fp32_ms_per_prompt']:.0f} ({generator['speedup']:.2f}x), "
+                     f"{generator['identical_answers']:.0%} identical greedy answers")
+    return "\n".join(lines)
@@ -0,0 +1,89 @@
+# src/prefix_cache.py
+"""Generation that reuses the KV-cache of a fixed prompt preamble.
+
+Every prompt starts with the same instruction preamble, and a causal LM's
+keys/values for that preamble are identical on every request.
+``PrefixCachedGenerator`` runs the preamble through the model once (lazily,
+per process, so forked generator workers each build their own), then for
+each prompt hands ``model.generate`` a copy of that cache so only the
+context + question suffix is prefilled.
+
+Each prompt is still tokenized whole (tokenizing is cheap; prefill is
+not), and the cache is used only when its ids start with the cached
+preamble ids. The preamble's last token is left out of the cache because it
+may merge with the text that follows. This makes the reuse exact for any
+tokenizer, and prompts that do not start with the preamble are generated
+without the cache. With ``prefix=None`` nothing is cached and this is a
+plain ``model.generate`` that returns only the new text.
+"""
+import copy
+import threading
+from typing import Any, Dict, Optional
+
+
+class PrefixCachedGenerator:
+    """``model.generate`` with the preamble's past-key-values computed once and reused"""
+
+    def __init__(self, model, tokenizer, prefix: Optional[str], **generation_kwargs):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.generation_kwargs: Dict[str, Any] = generation_kwargs
+        if tokenizer.pad_token_id is not None:
+            self.generation_kwargs.setdefault("pad_token_id", tokenizer.pad_token_id)
+        else:
+            self.generation_kwargs.setdefault("pad_token_id", tokenizer.eos_token_id)
+        self._prefix_ids = None
+        self._past = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def prefix_tokens(self) -> int:
+        return 0 if self._prefix_ids is None else self._prefix_ids.shape[1]
+
+    def _prefix_cache(self):
+        """Past-key-values for the preamble, computed on first use"""
+        if self._past is None:
+            with self._lock:
+                if self._past is None:
+                    import torch
+                    ids = self._encode(self.prefix)[:, :-1]
+                    with torch.no_grad():
+                        past = self.model(input_ids=ids, use_cache=True).past_key_values
+                    self._prefix_ids = ids
+                    self._past = past
+        return self._past
+
+    def _encode(self, text: str):
+        # Special tokens as the text-generation pipeline adds them (e.g. Mistral's BOS)
+        return self.tokenizer(text, return_tensors="pt")["input_ids"].to(self.model.device)
+
+    def generate_ids(self, prompt: str, streamer=None, **kwargs):
+        """``(prompt_ids, output_ids)`` for ``prompt``; output includes the prompt ids"""
+        import torch
+        options = dict(self.generation_kwargs, **kwargs)
+        if streamer is not None:
+            options["streamer"] = streamer
+        input_ids = self._encode(prompt)
+        past = self._prefix_cache() if self.prefix and prompt.startswith(self.prefix) else None
+        cached = self.prefix_tokens
+        if past is not None and input_ids.shape[1] > cached and torch.equal(input_ids[:, :cached], self._prefix_ids):
+            # generate extends the cache in place, so every request gets its own copy
+            options["past_key_values"] = copy.deepcopy(past)
+            self.hits += 1
+        else:
+            self.misses += 1
+        with torch.no_grad():
+            output = self.model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                         **options)
+        return input_ids, output
+
+    def __call__(self, prompt: str, streamer=None, **kwargs) -> str:
+        """Decoded text of the newly generated tokens only"""
+        input_ids, output = self.generate_ids(prompt, streamer=streamer, **kwargs)
+        return self.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {"prefix_tokens": self.prefix_tokens, "hits": self.hits, "misses": self.misses}
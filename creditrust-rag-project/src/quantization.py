@@ -0,0 +1,86 @@
+# src/quantization.py
+"""Scalar quantization of the embedding matrix.
+
+* ``int8``    - each dimension is mapped linearly onto 256 levels using a
+  per-dimension offset (the minimum) and scale, 1 byte per value.
+* ``float16`` - plain half precision, 2 bytes per value.
+
+Approximate inner products are computed directly from the codes in row
+blocks, so the full float32 matrix never has to be materialized::
+
+    q . x  ~=  q . offset + (q * scale) . code
+"""
+from typing import Dict
+
+import numpy as np
+
+QUANTIZATION_MODES = ("int8", "float16")
+BLOCK_ROWS = 16_384
+
+
+class ScalarQuantizer:
+    """Per-dimension int8 or float16 codec for row-normalized embeddings"""
+
+    def __init__(self, mode: str = "int8"):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode '{mode}'. Choose from {QUANTIZATION_MODES}")
+        self.mode = mode
+        self.offset = None
+        self.scale = None
+
+    def fit(self, embeddings: np.ndarray) -> "ScalarQuantizer":
+        if self.mode == "float16":
+            return self
+        low = np.full(embeddings.shape[1], np.inf, dtype=np.float32)
+        high = np.full(embeddings.shape[1], -np.inf, dtype=np.float32)
+        for start in range(0, len(embeddings), BLOCK_ROWS):
+            block = embeddings[start:start + BLOCK_ROWS]
+            low = np.minimum(low, block.min(axis=0))
+            high = np.maximum(high, block.max(axis=0))
+        self.offset = low
+        self.scale = np.where(high > low, (high - low) / 255.0, 1.0).astype(np.float32)
+        return self
+
+    def encode(self, embeddings: np.ndarray) -> np.ndarray:
+        if self.mode == "float16":
+            return np.asarray(embeddings, dtype=np.float16)
+        codes = np.empty(embeddings.shape, dtype=np.uint8)
+        for start in range(0, len(embeddings), BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + BLOCK_ROWS], dtype=np.float32)
+            codes[start:start + BLOCK_ROWS] = np.clip(
+                np.rint((block - self.offset) / self.scale), 0, 255
+            )
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        if self.mode == "float16":
+            return codes.astype(np.float32)
+        return codes.astype(np.float32) * self.scale + self.offset
+
+    def approximate_scores(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """(len(codes), len(queries)) approximate inner products, computed in row blocks"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.mode == "int8":
+            weights = (queries * self.scale).T
+            bias = queries @ self.offset
+        else:
+            weights = queries.T
+            bias = 0.0
+        scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            block = codes[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ weights + bias
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        if self.mode == "float16":
+            return {}
+        return {"offset": self.offset, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, mode: str, arrays: Dict[str, np.ndarray]) -> "ScalarQuantizer":
+        quantizer = cls(mode)
+        if mode == "int8":
+            quantizer.offset = arrays["offset"]
+            quantizer.scale = arrays["scale"]
+        return quantizer
@@ -0,0 +1,118 @@
+# src/question_cache.py
+"""Bounded, thread-safe LRU cache of question embeddings.
+
+Questions are keyed by a normalized form (lower-case, punctuation dropped,
+whitespace collapsed), so "What are common credit card complaints?" and
+"what are common credit card complaints" share one entry. One cache is
+safe to share across Gradio worker threads.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Canonical cache key for a question"""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class LRUCache:
+    """Least-recently-used mapping with hit/miss/eviction counters"""
+
+    def __init__(self, capacity: int = 1024):
+        if capacity < 0:
+            raise ValueError("capacity must be >= 0")
+        self.capacity = capacity
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable):
+        """Return the cached value (marking it recently used) or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value):
+        if self.capacity == 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for monitoring; hit_rate is over all lookups so far"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class QuestionEmbeddingCache(LRUCache):
+    """LRU cache of read-only question embeddings keyed by normalized text"""
+
+    def get_or_compute(self, question: str, encode: Callable[[str], np.ndarray]) -> np.ndarray:
+        key = normalize_question(question)
+        embedding = self.get(key)
+        if embedding is None:
+            # Encode outside the lock; a concurrent miss on the same key only
+            # costs a duplicate encode, never a wrong result
+            embedding = _freeze(encode(question))
+            self.put(key, embedding)
+        return embedding
+
+    def get_or_compute_many(self, questions: Iterable[str],
+                            encode_many: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Look up every question and encode all misses in one batch"""
+        questions = list(questions)
+        keys = [normalize_question(question) for question in questions]
+        embeddings: List[Optional[np.ndarray]] = [self.get(key) for key in keys]
+        missing: Dict[str, List[int]] = {}
+        for i, (key, embedding) in enumerate(zip(keys, embeddings)):
+            if embedding is None:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            encoded = encode_many([questions[positions[0]] for positions in missing.values()])
+            for (key, positions), embedding in zip(missing.items(), encoded):
+                embedding = _freeze(embedding)
+                self.put(key, embedding)
+                for i in positions:
+                    embeddings[i] = embedding
+        return np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+
+
+def _freeze(embedding: np.ndarray) -> np.ndarray:
+    embedding = np.array(embedding, dtype=np.float32)
+    embedding.setflags(write=False)
+    return embedding
@@ -1,131 +1,799 @@
 ﻿# src/rag_pipeline.py
-import torch
-import pickle
+import importlib.util
+import os
+import threading
+import time
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sequence, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
-try:
-    from sentence_transformers import SentenceTransformer
-    from transformers import pipeline
-    IMPORT_SUCCESS = True
-except ImportError:
-    IMPORT_SUCCESS = False
+# torch, transformers and sentence-transformers are only imported when the
+# models are loaded, so importing this module (and starting a UI) stays fast
+IMPORT_SUCCESS = all(importlib.util.find_spec(name) is not None
+                     for name in ("torch", "sentence_transformers", "transformers"))
+if not IMPORT_SUCCESS:
     print("Warning: Some libraries not installed. Run: pip install sentence-transformers transformers")
 
+from vector_store import load_vector_store
+from ann_index import ExactIndex, load_index, search_rows
+from metadata_index import MetadataIndex, metadata_index_path_for
+from question_cache import QuestionEmbeddingCache
+from answer_cache import SemanticAnswerCache
+from lexical_index import BM25Index, lexical_index_path_for, reciprocal_rank_fusion, weighted_fusion
+from segments import SegmentedIndex, SegmentedVectorStore
+from token_budget import WORDS_PER_SPAN, ChunkTokenIndex, pack_context, token_index_path_for
+from prefix_cache import PrefixCachedGenerator
+from generation_control import AnswerStream, BatchStreamer, GenerationController, filter_stream
+from model_quantization import INFERENCE_MODES
+
+FALLBACK_ANSWER = "Based on the context, customers report various complaints including billing errors, unauthorized transactions, and poor customer service."
+SAMPLE_ANSWER = "Sample answer: Customers experience issues with billing disputes and unauthorized transactions."
+GENERATOR_MODEL = "gpt2"
+MAX_NEW_TOKENS = 150  # answer tokens reserved out of the model's context window
+GENERATION_BUDGET_SECONDS = 30.0
+
+PROMPT_TEMPLATE = """You are a financial analyst assistant for CrediTrust. Your task is to answer questions about customer complaints. Use the following retrieved complaint excerpts to formulate your answer. If the context doesn't contain the answer, state that you don't have enough information.
+
+Context: {context}
+
+Question: {question}
+
+Answer:"""
+# Identical on every request, so its KV-cache is computed once and reused
+PROMPT_PREAMBLE = PROMPT_TEMPLATE[:PROMPT_TEMPLATE.index("{context}")]
+
 class RAGPipeline:
-    def __init__(self, vector_store_path: str, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        """Initialize RAG Pipeline"""
+    def __init__(self, vector_store_path: str, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 index_path: Optional[str] = None, search_params: Optional[Dict[str, Any]] = None,
+                 metadata_index_path: Optional[str] = None, question_cache_size: int = 1024,
+                 answer_cache: Optional[SemanticAnswerCache] = None,
+                 retrieval_mode: str = "dense", fusion: str = "rrf", fusion_alpha: float = 0.5,
+                 hybrid_candidates: int = 2000, lexical_index_path: Optional[str] = None,
+                 hybrid_dense_join: bool = False,
+                 load_models: bool = True, generator_workers: int = 0,
+                 generator_threads: Optional[int] = None, token_index_path: Optional[str] = None,
+                 reuse_prefix_cache: bool = True, inference_mode: str = "fp32",
+                 generation_budget: Optional[float] = GENERATION_BUDGET_SECONDS):
+        """Initialize RAG Pipeline
+        
+        Args:
+            vector_store_path: Path to a .vstore file, a segmented store directory
+                or a legacy vector_store.pkl
+            model_name: SentenceTransformer used to embed questions
+            index_path: Optional ANN index built with ann_tool.py; exact search if omitted
+            search_params: Recall knobs passed to the index (e.g. nprobe, ef_search)
+            metadata_index_path: Precomputed metadata index used by ``filters``;
+                defaults to the store's ``.meta.npz`` sidecar when present
+            question_cache_size: Capacity of the LRU question-embedding cache (0 disables it)
+            answer_cache: Optional SemanticAnswerCache; near-duplicate questions that
+                retrieve the same chunks reuse its answers instead of generating
+            retrieval_mode: "dense" or "hybrid" (BM25 candidates fused with dense scores)
+            fusion: "rrf" (reciprocal rank fusion) or "weighted" (alpha * cosine + (1 - alpha) * BM25)
+            fusion_alpha: Dense weight for weighted fusion
+            hybrid_candidates: Lexical candidates passed to dense rescoring in hybrid mode
+            lexical_index_path: BM25 index; defaults to the store's ``.bm25.npz`` sidecar
+            hybrid_dense_join: In hybrid mode also add the dense top-k over the whole index
+                to the candidates; only cheap with an ANN index, so off by default
+            load_models: Load the embedding model and generator now; pass False
+                to defer them to ``load_models()`` (e.g. on a background thread)
+            generator_workers: Fork this many generation worker processes that share
+                the generator's weights copy-on-write (0 generates in-process)
+            generator_threads: Cores (torch threads) per generation worker;
+                defaults to an even split of the available cores
+            token_index_path: Precomputed chunk token counts used to pack the prompt
+                context; defaults to the store's ``.tokens.npz`` sidecar
+            reuse_prefix_cache: Compute the prompt preamble's KV-cache once and
+                prefill only the context and question of each prompt
+            inference_mode: "fp32", "int8" (dynamic int8 Linear layers on CPU) or
+                "onnx" (ONNX Runtime, falling back to int8) for both models;
+                check the drift first with check_quantization.py
+            generation_budget: Wall-clock seconds per answer; when they run out the
+                partial answer is returned with ``truncated`` set (None: no limit)
+        """
         try:
+            self.model_name = model_name
+            self.startup_timings: Dict[str, float] = {}
+            self.embedding_model = None
+            self.generator = None
+            self.generator_pool = None
+            self.generator_workers = generator_workers
+            self.generator_threads = generator_threads
+            self.token_index_path = token_index_path or token_index_path_for(vector_store_path)
+            self.token_index: Optional[ChunkTokenIndex] = None
+            self.context_budget: Optional[int] = None
+            self._excerpt_overhead = 0
+            self.reuse_prefix_cache = reuse_prefix_cache
+            if inference_mode not in INFERENCE_MODES:
+                raise ValueError(f"Unknown inference_mode '{inference_mode}'")
+            self.inference_mode = inference_mode
+            self.prefix_generator: Optional[PrefixCachedGenerator] = None
+            self.generation_controller: Optional[GenerationController] = None
+            self.generation_budget = generation_budget
+            start = time.perf_counter()
             print(f"Loading vector store from {vector_store_path}...")
-            with open(vector_store_path, "rb") as f:
-                self.vector_store = pickle.load(f)
-            
-            print(f"✓ Loaded {len(self.vector_store['chunks'])} chunks")
+            self.vector_store = load_vector_store(vector_store_path)
+            self.startup_timings["vector_store"] = time.perf_counter() - start
             
-            if IMPORT_SUCCESS:
-                self.embedding_model = SentenceTransformer(model_name)
-                self.generator = self._initialize_generator()
+            print(f"✓ Loaded {len(self.vector_store)} chunks")
+            self.embeddings = self.vector_store.embeddings
+            self.search_params = search_params or {}
+            if isinstance(self.vector_store, SegmentedVectorStore):
+                if index_path:
+                    print("⚠️ ANN indexes apply to single-file stores; compact and convert first. Using exact search")
+                self.index = SegmentedIndex(self.vector_store)
+            elif index_path:
+                self.index = load_index(index_path, self.embeddings, self.vector_store.version)
+                print(f"✓ Loaded {self.index.kind} index from {index_path}")
             else:
-                self.embedding_model = None
-                self.generator = DummyGenerator()
+                self.index = ExactIndex(self.embeddings)
+            self.question_cache = QuestionEmbeddingCache(question_cache_size)
+            self.answer_cache = answer_cache
+            if answer_cache is not None:
+                answer_cache.set_store_version(self.vector_store.version)
+            self._metadata_index = self._load_metadata_index(
+                metadata_index_path or metadata_index_path_for(vector_store_path)
+            )
+            if retrieval_mode not in ("dense", "hybrid"):
+                raise ValueError(f"Unknown retrieval_mode '{retrieval_mode}'")
+            if fusion not in ("rrf", "weighted"):
+                raise ValueError(f"Unknown fusion '{fusion}'")
+            self.retrieval_mode = retrieval_mode
+            self.fusion = fusion
+            self.fusion_alpha = fusion_alpha
+            self.hybrid_candidates = hybrid_candidates
+            self.hybrid_dense_join = hybrid_dense_join
+            self._lexical_index = None
+            if retrieval_mode == "hybrid":
+                self._lexical_index = self._load_lexical_index(
+                    lexical_index_path or lexical_index_path_for(vector_store_path)
+                )
+            self.startup_timings["indexes"] = time.perf_counter() - start - self.startup_timings["vector_store"]
+            
+            if load_models:
+                self.load_models()
                 
         except FileNotFoundError:
             print(f"Error: Vector store not found at {vector_store_path}")
-            print("Please place your vector_store.pkl in the 'data/' folder")
+            print("Please place your vector_store.pkl (or a converted vector_store.vstore) in the 'data/' folder")
             raise
         except Exception as e:
             print(f"Error initializing pipeline: {e}")
             raise
     
+    @property
+    def models_loaded(self) -> bool:
+        return self.generator is not None
+    
+    def load_models(self):
+        """Load the embedding model and generator, recording per-stage timings"""
+        if not IMPORT_SUCCESS:
+            self.embedding_model = None
+            self.generator = DummyGenerator()
+            return
+        start = time.perf_counter()
+        from model_quantization import load_embedder
+        self.startup_timings["import_libraries"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        self.embedding_model = load_embedder(self.model_name, self.inference_mode)
+        self.startup_timings["embedding_model"] = time.perf_counter() - start
+        print(f"✓ Embedding model ({self.inference_mode}) loaded in {self.startup_timings['embedding_model']:.1f}s")
+        
+        start = time.perf_counter()
+        self.generator = self._initialize_generator()
+        self.startup_timings["generator"] = time.perf_counter() - start
+        print(f"✓ Generator loaded in {self.startup_timings['generator']:.1f}s")
+        
+        self._prepare_context_budget()
+        if getattr(self.generator, "model", None) is not None:
+            # ONNX Runtime models do not take a torch KV-cache
+            prefix = PROMPT_PREAMBLE if self.reuse_prefix_cache and self._generator_is_torch() else None
+            self.prefix_generator = PrefixCachedGenerator(self.generator.model, self.generator.tokenizer,
+                                                          prefix, max_new_tokens=MAX_NEW_TOKENS)
+            self.generation_controller = GenerationController(self.prefix_generator,
+                                                              budget_seconds=self.generation_budget)
+        
+        if self.generator_workers > 0 and getattr(self.generator, "model", None) is not None:
+            # Fork before this process runs any inference (see generator_pool)
+            from generator_pool import GeneratorPool
+            start = time.perf_counter()
+            self.generator_pool = GeneratorPool(self._generate_local, workers=self.generator_workers,
+                                                threads_per_worker=self.generator_threads,
+                                                stream=self._generate_stream_local)
+            self.startup_timings["generator_pool"] = time.perf_counter() - start
+            print(f"✓ Forked {self.generator_pool.workers} generator workers on cores "
+                  f"{self.generator_pool.core_sets}")
+    
+    def warm_up(self, questions: Sequence[str], k: int = 5):
+        """Answer ``questions`` once so caches are filled and first-call overheads are paid"""
+        start = time.perf_counter()
+        for question in questions:
+            self.query(question, k=k)
+        self.startup_timings["warm_up"] = time.perf_counter() - start
+        print(f"✓ Warm-up over {len(questions)} questions in {self.startup_timings['warm_up']:.1f}s")
+    
     def _initialize_generator(self):
         """Initialize the text generation model"""
         try:
-            return pipeline(
+            import torch
+            from transformers import pipeline
+            # Quantized modes are CPU-only
+            use_cuda = torch.cuda.is_available() and self.inference_mode == "fp32"
+            generation_kwargs = {"max_new_tokens": MAX_NEW_TOKENS, "temperature": 0.1}
+            generator = pipeline(
                 "text-generation",
-                model="gpt2",
-                device="cuda" if torch.cuda.is_available() else "cpu",
-                max_new_tokens=150,
-                temperature=0.1
+                model=GENERATOR_MODEL,
+                device="cuda" if use_cuda else "cpu",
+                **generation_kwargs
             )
+            # Batched generation pads prompts; gpt2 has no pad token and, being
+            # decoder-only, must be padded on the left
+            if generator.tokenizer.pad_token is None:
+                generator.tokenizer.pad_token = generator.tokenizer.eos_token
+            generator.tokenizer.padding_side = "left"
+            if self.inference_mode != "fp32":
+                from model_quantization import quantize_generator
+                generator = quantize_generator(generator, GENERATOR_MODEL, self.inference_mode,
+                                               **generation_kwargs)
+            return generator
         except:
             return DummyGenerator()
     
+    def _generator_is_torch(self) -> bool:
+        model = getattr(self.generator, "model", None)
+        return model is not None and hasattr(model, "named_modules")
+    
+    def _prepare_context_budget(self):
+        """Work out the context token budget and load (or build) the chunk token counts
+        
+        budget = model context window - prompt template - answer reservation;
+        the question's own tokens are subtracted per query.
+        """
+        tokenizer = getattr(self.generator, "tokenizer", None)
+        if getattr(self.generator, "model", None) is None or not callable(tokenizer):
+            return
+        config = self.generator.model.config
+        window = (getattr(config, "n_positions", None) or getattr(config, "max_position_embeddings", None)
+                  or tokenizer.model_max_length)
+        template = len(tokenizer(PROMPT_TEMPLATE.format(context="", question=""),
+                                 add_special_tokens=False)["input_ids"])
+        self.context_budget = window - template - MAX_NEW_TOKENS
+        # Upper bound on the framing around each excerpt, plus one token for merges at the seams
+        self._excerpt_overhead = len(tokenizer("\n\nExcerpt 99: ", add_special_tokens=False)["input_ids"]) + 1
+        self.token_index = self._load_token_index(self.token_index_path, tokenizer)
+        print(f"✓ Context budget: {self.context_budget} tokens ({window} window - {template} template "
+              f"- {MAX_NEW_TOKENS} answer)")
+    
+    def _load_token_index(self, path: str, tokenizer) -> ChunkTokenIndex:
+        """Load the token-count sidecar, or build it from the chunk text if missing or stale"""
+        name = tokenizer.name_or_path
+        if isinstance(self.vector_store, SegmentedVectorStore):
+            # Per-segment sidecars; a segment missing one is counted once and saved
+            start = time.perf_counter()
+            index = self.vector_store.token_index(tokenizer)
+            print(f"✓ Merged chunk token counts for {name} from {len(self.vector_store.segments)} "
+                  f"segments in {time.perf_counter() - start:.1f}s")
+            return index
+        if os.path.exists(path):
+            index = ChunkTokenIndex.load(path)
+            if (index.tokenizer_name == name and index.store_version == self.vector_store.version
+                    and index.count == len(self.vector_store) and index.words_per_span == WORDS_PER_SPAN):
+                print(f"✓ Loaded chunk token counts for {name}")
+                return index
+            print(f"⚠️ Token counts at {path} are stale or for another tokenizer; rebuilding in memory")
+        start = time.perf_counter()
+        index = ChunkTokenIndex.build(self.vector_store.chunks, tokenizer, name,
+                                      store_version=self.vector_store.version)
+        print(f"✓ Counted chunk tokens in {time.perf_counter() - start:.1f}s")
+        return index
+    
+    def _load_metadata_index(self, path: str):
+        """Load a precomputed metadata index if it matches the loaded store"""
+        if isinstance(self.vector_store, SegmentedVectorStore) or not os.path.exists(path):
+            # Segmented stores merge per-segment sidecars on first filtered query
+            return None
+        index = MetadataIndex.load(path)
+        if index.store_version != self.vector_store.version or index.count != len(self.vector_store):
+            print(f"⚠️ Metadata index at {path} is stale; it will be rebuilt on first filtered query")
+            return None
+        print(f"✓ Loaded metadata index ({', '.join(index.fields)})")
+        return index
+    
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """Metadata postings used to resolve filters, built on first use if not precomputed"""
+        if self._metadata_index is None:
+            if isinstance(self.vector_store, SegmentedVectorStore):
+                self._metadata_index = self.vector_store.metadata_index()
+            else:
+                self._metadata_index = MetadataIndex.build(
+                    self.vector_store.metadata, store_version=self.vector_store.version
+                )
+        return self._metadata_index
+    
+    def _encode(self, questions):
+        return self.embedding_model.encode(
+            questions, batch_size=64, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+    
+    def _load_lexical_index(self, path: str):
+        """Load the BM25 sidecar, or build it from the chunk text if missing or stale"""
+        if isinstance(self.vector_store, SegmentedVectorStore):
+            return self.vector_store.lexical_index()
+        if os.path.exists(path):
+            index = BM25Index.load(path)
+            if index.store_version == self.vector_store.version and index.count == len(self.vector_store):
+                print(f"✓ Loaded BM25 index ({len(index.vocabulary)} terms)")
+                return index
+            print(f"⚠️ BM25 index at {path} is stale; rebuilding in memory")
+        return BM25Index().build(self.vector_store.chunks, store_version=self.vector_store.version)
+    
+    @property
+    def lexical_index(self) -> BM25Index:
+        if self._lexical_index is None:
+            if isinstance(self.vector_store, SegmentedVectorStore):
+                self._lexical_index = self.vector_store.lexical_index()
+            else:
+                self._lexical_index = BM25Index().build(self.vector_store.chunks,
+                                                        store_version=self.vector_store.version)
+        return self._lexical_index
+    
     def embed_question(self, question: str):
-        """Embed the question"""
+        """Embed the question as a unit-length float32 vector (cached)"""
         if self.embedding_model:
-            return self.embedding_model.encode(question, convert_to_tensor=True)
-        return np.random.rand(384)
+            return self.question_cache.get_or_compute(question, self._encode)
+        return np.random.rand(384).astype(np.float32)
     
-    def retrieve_chunks(self, question: str, k: int = 5):
-        """Retrieve top-k relevant chunks"""
+    def embed_questions(self, questions: List[str]) -> np.ndarray:
+        """Embed many questions, encoding all cache misses in one batched call"""
         if self.embedding_model:
-            question_embedding = self.embed_question(question)
-            
-            similarities = []
-            for i, chunk_embedding in enumerate(self.vector_store['embeddings']):
-                similarity = torch.cosine_similarity(
-                    question_embedding.unsqueeze(0),
-                    torch.tensor(chunk_embedding).unsqueeze(0)
-                ).item()
-                similarities.append((i, similarity))
-            
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            top_k_indices = [idx for idx, _ in similarities[:k]]
-        else:
-            top_k_indices = list(range(min(k, len(self.vector_store['chunks']))))
+            return self.question_cache.get_or_compute_many(questions, self._encode)
+        return np.random.rand(len(questions), 384).astype(np.float32)
+    
+    def reload_store(self) -> bool:
+        """Pick up segments appended or deleted since load (segmented stores only)
+        
+        Returns False without touching anything when the store's manifest is
+        unchanged. The metadata and BM25 indexes are re-merged from
+        per-segment sidecars, so only the new segments' sidecars are read.
+        """
+        if not isinstance(self.vector_store, SegmentedVectorStore) or not self.vector_store.is_stale():
+            return False
+        self.vector_store.reload()
+        self.embeddings = self.vector_store.embeddings
+        self._metadata_index = None
+        self._lexical_index = self.vector_store.lexical_index() if self.retrieval_mode == "hybrid" else None
+        if self.token_index is not None:
+            self.token_index = self._load_token_index(self.token_index_path, self.generator.tokenizer)
+        if self.answer_cache is not None:
+            self.answer_cache.set_store_version(self.vector_store.version)
+        print(f"✓ Reloaded store: {self.vector_store.live_count} live chunks "
+              f"in {len(self.vector_store.segments)} segments")
+        return True
+    
+    def _live_mask(self, rows: np.ndarray) -> np.ndarray:
+        """False for rows tombstoned in a segmented store"""
+        deleted = getattr(self.vector_store, "deleted", None)
+        if deleted is None or len(rows) == 0:
+            return np.ones(len(rows), dtype=bool)
+        return ~deleted[rows]
+    
+    def _resolve_filters(self, filters: Optional[Dict[str, Any]]):
+        if not filters:
+            return None
+        rows = self.metadata_index.resolve(filters)
+        return rows[self._live_mask(rows)]
+    
+    def _chunks_for_embeddings(self, question_embeddings: Optional[np.ndarray], k: int,
+                               candidates: Optional[np.ndarray],
+                               questions: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Search the index for a (m, d) block of question embeddings"""
+        if self.retrieval_mode == "hybrid" and questions is not None:
+            if question_embeddings is None:
+                question_embeddings = [None] * len(questions)
+            return [
+                self._chunk_records(*self._hybrid_search(question, embedding, k, candidates))
+                for question, embedding in zip(questions, question_embeddings)
+            ]
+        
+        if question_embeddings is None:
+            rows = candidates if candidates is not None else np.arange(len(self.vector_store))
+            rows = rows[self._live_mask(rows)]
+            return [self._chunk_records(rows[:k], np.zeros(min(k, len(rows)), dtype=np.float32))]
+        
+        ids, scores = self.index.search(question_embeddings, k, rows=candidates, **self.search_params)
+        results = []
+        for row_ids, row_scores in zip(ids, scores):
+            found = row_ids >= 0
+            results.append(self._chunk_records(row_ids[found], row_scores[found]))
+        return results
+    
+    def _hybrid_search(self, question: str, question_embedding: Optional[np.ndarray], k: int,
+                       candidates: Optional[np.ndarray]):
+        """BM25 candidates rescored exactly against the dense embeddings and rank-fused
         
+        Only the lexical candidate rows are scored densely. The dense top-k over
+        the whole index joins the pool with ``hybrid_dense_join``, and whenever
+        fewer than ``k`` chunks share a term with the question, so the result
+        is still filled up to ``k``.
+        """
+        lexical_ids, lexical_scores = self.lexical_index.search(
+            question, self.hybrid_candidates, rows=candidates
+        )
+        live = self._live_mask(lexical_ids)
+        lexical_ids, lexical_scores = lexical_ids[live], lexical_scores[live]
+        if question_embedding is None:
+            # No embedding model: fall back to lexical ranking alone
+            return lexical_ids[:k], np.zeros(min(k, len(lexical_ids)), dtype=np.float32)
+        
+        pool = np.sort(lexical_ids)  # ascending rows read the embeddings in file order
+        if self.hybrid_dense_join or len(pool) < k:
+            dense_ids, _ = self.index.search(question_embedding, k, rows=candidates, **self.search_params)
+            pool = np.union1d(lexical_ids, dense_ids[0][dense_ids[0] >= 0])
+        if len(pool) == 0:
+            return [], []
+        pool_ids, pool_scores = search_rows(self.embeddings, question_embedding, len(pool), rows=pool)
+        dense = {int(doc): float(score) for doc, score in zip(pool_ids[0], pool_scores[0])}
+        if self.fusion == "rrf":
+            fused = reciprocal_rank_fusion([pool_ids[0], lexical_ids])
+        else:
+            lexical = {int(doc): float(score) for doc, score in zip(lexical_ids, lexical_scores)}
+            fused = weighted_fusion(dense, lexical, self.fusion_alpha)
+        best = sorted(fused, key=fused.get, reverse=True)[:k]
+        return best, [dense[doc] for doc in best]
+    
+    def _chunk_records(self, indices, scores) -> List[Dict[str, Any]]:
         retrieved_chunks = []
-        for idx in top_k_indices:
+        for idx, score in zip(indices, scores):
             chunk_data = {
-                "text": self.vector_store['chunks'][idx],
-                "similarity": 0.85,
-                "metadata": self.vector_store.get('metadata', [{}] * len(self.vector_store['chunks']))[idx]
+                "id": int(idx),
+                "text": self.vector_store.chunks[idx],
+                "similarity": float(score),
+                "metadata": self.vector_store.metadata[idx]
             }
             retrieved_chunks.append(chunk_data)
-        
         return retrieved_chunks
     
+    def retrieve_chunks(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None):
+        """Retrieve top-k relevant chunks, optionally restricted by metadata filters
+        
+        Filters take equality, set and date-range conditions, e.g.
+        ``{"product": ["Credit card", "Personal loan"], "date_received": ("2023-01-01", None)}``.
+        Only the rows matching the filters are scored.
+        """
+        candidates = self._resolve_filters(filters)
+        if candidates is not None and len(candidates) == 0:
+            return []
+        question_embedding = self.embed_question(question) if self.embedding_model else None
+        if question_embedding is not None:
+            question_embedding = question_embedding.reshape(1, -1)
+        return self._chunks_for_embeddings(question_embedding, k, candidates, [question])[0]
+    
+    def retrieve_chunks_batch(self, questions: List[str], k: int = 5,
+                              filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Retrieve top-k chunks for many questions with one encode and one matrix product"""
+        candidates = self._resolve_filters(filters)
+        if candidates is not None and len(candidates) == 0:
+            return [[] for _ in questions]
+        if not self.embedding_model:
+            return [self._chunks_for_embeddings(None, k, candidates, [question])[0] for question in questions]
+        return self._chunks_for_embeddings(self.embed_questions(questions), k, candidates, questions)
+    
     def format_prompt(self, question: str, context_chunks: List[Dict[str, Any]]):
-        """Format prompt with context"""
+        """Format prompt with context
+        
+        Once the generator is loaded, chunks are packed in score order into
+        the context budget (see token_budget.pack_context), so the prompt
+        plus the answer reservation fits the model's context window.
+        """
+        if self.token_index is not None:
+            question_tokens = len(self.generator.tokenizer(question, add_special_tokens=False)["input_ids"])
+            context_chunks = pack_context(context_chunks, self.token_index,
+                                          self.context_budget - question_tokens, self._excerpt_overhead)
         context_text = "\n\n".join([
             f"Excerpt {i+1}: {chunk['text']}" 
             for i, chunk in enumerate(context_chunks)
         ])
         
-        prompt_template = """You are a financial analyst assistant for CrediTrust. Your task is to answer questions about customer complaints. Use the following retrieved complaint excerpts to formulate your answer. If the context doesn't contain the answer, state that you don't have enough information.
-
-Context: {context}
-
-Question: {question}
-
-Answer:"""
-        
-        return prompt_template.format(context=context_text, question=question)
+        return PROMPT_TEMPLATE.format(context=context_text, question=question)
     
     def generate_answer(self, prompt: str):
         """Generate answer using LLM"""
+        return self.generate_answer_result(prompt)["answer"]
+    
+    def generate_answer_result(self, prompt: str) -> Dict[str, Any]:
+        """Generate an answer with its ``truncated`` flag and ``stop_reason``
+        
+        Decoding ends at a stop sequence, at MAX_NEW_TOKENS, or when the
+        generation budget runs out (partial answer, ``truncated=True``).
+        """
+        if self.generator_pool is not None:
+            return _pool_result(self.generator_pool.submit(prompt))
+        return self._generate_local(prompt)
+    
+    def _generate_local(self, prompt: str) -> Dict[str, Any]:
+        if self.generation_controller is not None:
+            try:
+                return self.generation_controller.generate(prompt)
+            except Exception:
+                return _answer_result(FALLBACK_ANSWER, "error")
         if hasattr(self.generator, '__call__'):
             try:
-                response = self.generator(prompt, max_length=400)[0]['generated_text']
-                return response[len(prompt):].strip()
+                # DummyGenerator echoes the prompt like a text-generation pipeline
+                response = self.generator(prompt)[0]['generated_text']
+                return _answer_result(response[len(prompt):].strip(), "length")
             except:
-                return "Based on the context, customers report various complaints including billing errors, unauthorized transactions, and poor customer service."
-        return "Sample answer: Customers experience issues with billing disputes and unauthorized transactions."
+                return _answer_result(FALLBACK_ANSWER, "error")
+        return _answer_result(SAMPLE_ANSWER, "error")
+    
+    def generate_answer_stream(self, prompt: str, result: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Yield the answer as text pieces while the model decodes.
+        
+        Generation runs on a worker thread with a TextIteratorStreamer (same
+        controller, budget and stop sequences as ``generate_answer``), or in a
+        generator pool worker when one is running; generators without a
+        model (DummyGenerator) yield the whole answer once. Once the pieces
+        run out, ``result`` holds ``generate_answer_result``'s fields
+        (``truncated``, ``stop_reason``, ...).
+        """
+        result = {} if result is None else result
+        if self.generator_pool is not None:
+            started = False
+            try:
+                for piece in self.generator_pool.stream(prompt, result):
+                    started = True
+                    yield piece
+            except RuntimeError:
+                result.update(_failed_stream_result(started))
+                if not started:
+                    yield FALLBACK_ANSWER
+            return
+        yield from self._generate_stream_local(prompt, result)
+    
+    def _generate_stream_local(self, prompt: str, result: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        result = {} if result is None else result
+        if self.generation_controller is None:
+            result.update(self._generate_local(prompt))
+            yield result["answer"]
+            return
+        from transformers import TextIteratorStreamer
+        streamer = TextIteratorStreamer(self.generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        failed = []
+        
+        def decode():
+            try:
+                result.update(self.generation_controller.generate(prompt, streamer=streamer))
+            except Exception as e:
+                failed.append(e)
+                streamer.end()
+        
+        worker = threading.Thread(target=decode, name="rag-generate", daemon=True)
+        worker.start()
+        started = False
+        for piece in _answer_pieces(streamer, self.generation_controller.stop_sequences):
+            started = True
+            yield piece
+        worker.join()
+        if failed:
+            result.update(_failed_stream_result(started))
+            if not started:
+                yield FALLBACK_ANSWER
     
-    def query(self, question: str, k: int = 5):
+    def generate_answer_streams(self, prompts: List[str]) -> List[AnswerStream]:
+        """``generate_answer_stream`` for many prompts, decoded in one left-padded batch
+        
+        One ``generate`` call runs on a worker thread and a BatchStreamer
+        hands each row's text to its own stream; the rows share one budget,
+        as in ``generate_answer_results``. With a generator pool, without a
+        model, or for a single prompt (which keeps the preamble KV-cache),
+        each prompt streams on its own when its iterator is consumed.
+        """
+        prompts = list(prompts)
+        if self.generator_pool is not None or self.generation_controller is None or len(prompts) < 2:
+            streams = []
+            for prompt in prompts:
+                outcome: Dict[str, Any] = {}
+                streams.append(AnswerStream(self.generate_answer_stream(prompt, outcome), outcome))
+            return streams
+        controller = self.generation_controller
+        streamer = BatchStreamer(self.generator.tokenizer, len(prompts))
+        outcomes: List[Dict[str, Any]] = [{} for _ in prompts]
+        
+        def decode():
+            try:
+                for outcome, result in zip(outcomes, controller.generate_batch(prompts, streamer=streamer)):
+                    outcome.update(result)
+            except Exception as e:
+                print(f"✗ Batched generation failed: {e}")
+            streamer.close()
+        
+        def pieces(row: int):
+            started = False
+            for piece in _answer_pieces(streamer.row(row), controller.stop_sequences):
+                started = True
+                yield piece
+            if not outcomes[row]:
+                outcomes[row].update(_failed_stream_result(started))
+                if not started:
+                    yield FALLBACK_ANSWER
+        
+        threading.Thread(target=decode, name="rag-generate-batch", daemon=True).start()
+        return [AnswerStream(pieces(row), outcomes[row]) for row in range(len(prompts))]
+    
+    def generate_answers(self, prompts: List[str], batch_size: int = 8) -> List[str]:
+        """Generate answers for many prompts in padded batches"""
+        return [result["answer"] for result in self.generate_answer_results(prompts, batch_size)]
+    
+    def generate_answer_results(self, prompts: List[str], batch_size: int = 8) -> List[Dict[str, Any]]:
+        """``generate_answer_result`` for many prompts, in left-padded batches
+        
+        With a generator pool the prompts are spread across its workers instead.
+        Padded batches do not use the preamble KV-cache (left padding shifts
+        the preamble's positions differently in every row), and each batch
+        shares one generation budget.
+        """
+        prompts = list(prompts)
+        if self.generator_pool is not None:
+            futures = [self.generator_pool.submit(prompt) for prompt in prompts]
+            return [_pool_result(future) for future in futures]
+        if self.generation_controller is None:
+            return [self._generate_local(prompt) for prompt in prompts]
+        results = []
+        for start in range(0, len(prompts), batch_size):
+            batch = prompts[start:start + batch_size]
+            try:
+                results.extend(self.generation_controller.generate_batch(batch))
+            except Exception:
+                # Fall back to one-by-one generation so one bad batch does not fail the rest
+                results.extend(self._generate_local(prompt) for prompt in batch)
+        return results
+    
+    def _cached_answer(self, question: str, retrieved: List[Dict[str, Any]]) -> Optional[str]:
+        if self.answer_cache is None or not self.embedding_model:
+            return None
+        chunk_ids = [chunk["id"] for chunk in retrieved]
+        return self.answer_cache.lookup(self.embed_question(question), chunk_ids)
+    
+    def _remember_answer(self, question: str, retrieved: List[Dict[str, Any]], answer: str):
+        if self.answer_cache is None or not self.embedding_model or answer in (FALLBACK_ANSWER, SAMPLE_ANSWER):
+            return
+        chunk_ids = [chunk["id"] for chunk in retrieved]
+        self.answer_cache.store(question, self.embed_question(question), chunk_ids, answer)
+    
+    def query(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None):
         """Complete RAG query"""
-        retrieved = self.retrieve_chunks(question, k)
-        prompt = self.format_prompt(question, retrieved)
-        answer = self.generate_answer(prompt)
+        retrieved = self.retrieve_chunks(question, k, filters=filters)
+        answer = self._cached_answer(question, retrieved)
+        cached = answer is not None
+        truncated = False
+        if not cached:
+            prompt = self.format_prompt(question, retrieved)
+            result = self.generate_answer_result(prompt)
+            answer, truncated = result["answer"], result["truncated"]
+            if not truncated:
+                self._remember_answer(question, retrieved, answer)
         
         return {
             "question": question,
             "answer": answer,
             "retrieved_chunks": retrieved,
-            "num_chunks": len(retrieved)
+            "num_chunks": len(retrieved),
+            "cached": cached,
+            "truncated": truncated
         }
+    
+    def query_stream(self, question: str, k: int = 5, filters: Optional[Dict[str, Any]] = None
+                     ) -> Tuple[List[Dict[str, Any]], AnswerStream]:
+        """RAG query that streams the answer.
+        
+        Retrieval runs immediately and returns ``(retrieved_chunks, pieces)``;
+        ``pieces`` yields answer text as it is decoded (a cached answer arrives
+        in one piece), so sources can be shown before generation starts. It is
+        an ``AnswerStream``: once exhausted, ``pieces.truncated`` tells whether
+        the generation budget cut the answer short.
+        """
+        retrieved = self.retrieve_chunks(question, k, filters=filters)
+        return retrieved, self._answer_streams([question], [retrieved])[0]
+    
+    def query_stream_batch(self, questions: List[str], k: int = 5, filters: Optional[Dict[str, Any]] = None
+                           ) -> List[Tuple[List[Dict[str, Any]], AnswerStream]]:
+        """``query_stream`` for many questions: one encode, then one batched generation
+        
+        The answers that are not cached are decoded together (see
+        ``generate_answer_streams``) while each caller consumes its own stream.
+        """
+        questions = list(questions)
+        retrieved_batch = self.retrieve_chunks_batch(questions, k, filters=filters)
+        return list(zip(retrieved_batch, self._answer_streams(questions, retrieved_batch)))
+    
+    def _answer_streams(self, questions: List[str], retrieved_batch: List[List[Dict[str, Any]]]
+                        ) -> List[AnswerStream]:
+        streams: List[Optional[AnswerStream]] = []
+        pending = []
+        for i, (question, retrieved) in enumerate(zip(questions, retrieved_batch)):
+            cached = self._cached_answer(question, retrieved)
+            if cached is None:
+                pending.append(i)
+            streams.append(None if cached is None else
+                           AnswerStream([cached], {"truncated": False, "stop_reason": "cached"}))
+        prompts = [self.format_prompt(questions[i], retrieved_batch[i]) for i in pending]
+        for i, stream in zip(pending, self.generate_answer_streams(prompts)):
+            streams[i] = AnswerStream(self._remembered(questions[i], retrieved_batch[i], stream), stream.result)
+        return streams
+    
+    def _remembered(self, question: str, retrieved: List[Dict[str, Any]], stream: AnswerStream) -> Iterator[str]:
+        """Pass ``stream`` through, caching the answer once it is complete"""
+        answer = []
+        for piece in stream:
+            answer.append(piece)
+            yield piece
+        # Like query(): a partial answer must not be served to later questions
+        if not stream.truncated:
+            self._remember_answer(question, retrieved, "".join(answer).strip())
+    
+    def query_batch(self, questions: List[str], k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                    batch_size: int = 8) -> List[Dict[str, Any]]:
+        """Answer many questions at once; results match calling query() per question"""
+        questions = list(questions)
+        retrieved_batch = self.retrieve_chunks_batch(questions, k, filters=filters)
+        answers = [
+            self._cached_answer(question, retrieved)
+            for question, retrieved in zip(questions, retrieved_batch)
+        ]
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        prompts = [self.format_prompt(questions[i], retrieved_batch[i]) for i in pending]
+        truncated = set()
+        for i, result in zip(pending, self.generate_answer_results(prompts, batch_size=batch_size)):
+            answers[i] = result["answer"]
+            if result["truncated"]:
+                truncated.add(i)
+            else:
+                self._remember_answer(questions[i], retrieved_batch[i], answers[i])
+        
+        generated = set(pending)
+        return [
+            {
+                "question": question,
+                "answer": answer,
+                "retrieved_chunks": retrieved,
+                "num_chunks": len(retrieved),
+                "cached": i not in generated,
+                "truncated": i in truncated
+            }
+            for i, (question, answer, retrieved) in enumerate(zip(questions, answers, retrieved_batch))
+        ]
+    
+    def close(self):
+        """Stop the generator pool workers, if any"""
+        if self.generator_pool is not None:
+            self.generator_pool.close()
+            self.generator_pool = None
+
+def _answer_result(answer: str, stop_reason: str) -> Dict[str, Any]:
+    return {"answer": answer, "truncated": False, "stop_reason": stop_reason}
+
+def _answer_pieces(pieces: Iterable[str], stop_sequences: Sequence[str]) -> Iterator[str]:
+    """Streamed text up to the first stop sequence, without leading whitespace (like generate_answer)"""
+    started = False
+    for piece in filter_stream(pieces, stop_sequences):
+        if not started:
+            piece = piece.lstrip()
+            started = bool(piece)
+        if piece:
+            yield piece
+
+def _failed_stream_result(started: bool) -> Dict[str, Any]:
+    """Outcome of a stream whose generation failed; partial text counts as truncated"""
+    return {"truncated": started, "stop_reason": "error"}
+
+def _pool_result(future) -> Dict[str, Any]:
+    """A generator pool worker's result, or the fallback answer if the worker failed or died"""
+    try:
+        return future.result()
+    except RuntimeError as e:
+        print(f"✗ Generation failed: {e}")
+        return _answer_result(FALLBACK_ANSWER, "error")
 
 class DummyGenerator:
     """Dummy generator for testing"""
@@ -133,4 +801,6 @@ class DummyGenerator:
         self.tokenizer = type('obj', (object,), {'eos_token_id': 0})()
     
     def __call__(self, prompt, **kwargs):
+        if isinstance(prompt, list):
+            return [self(p, **kwargs) for p in prompt]
         return [{'generated_text': prompt + "\nBased on context: Customers report issues with billing, unauthorized transactions, and poor customer service experiences."}]
@@ -0,0 +1,186 @@
+# src/runtime.py
+"""One RAG pipeline per process, shared by the Gradio app and the HTTP service.
+
+``get_runtime()`` returns the process-wide ``PipelineRuntime``. It loads the
+vector store and models once (on a background thread by default), warms
+them up, and puts a ``MicroBatchScheduler`` in front of the pipeline so
+chat users and API clients are coalesced into the same batches.
+
+A segmented store is checked every ``store_reload_seconds`` for segments
+appended, deleted or compacted by another process; changes are loaded
+between batches, without a restart.
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+DEFAULT_VECTOR_STORE = "data/vector_store.vstore"  # falls back to vector_store.pkl if not converted
+BATCH_MAX_SIZE = int(os.environ.get("RAG_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("RAG_BATCH_MAX_WAIT_MS", "20"))
+GENERATOR_WORKERS = int(os.environ.get("RAG_GENERATOR_WORKERS", "0"))
+INFERENCE_MODE = os.environ.get("RAG_INFERENCE_MODE", "fp32")
+GENERATION_BUDGET = float(os.environ.get("RAG_GENERATION_BUDGET", "30"))
+# "off", "memory", or the path of a SQLite file that keeps answers across restarts
+ANSWER_CACHE = os.environ.get("RAG_ANSWER_CACHE", "off")
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+# Seconds between checks of a segmented store's manifest; 0 turns the check off
+STORE_RELOAD_SECONDS = float(os.environ.get("RAG_STORE_RELOAD_SECONDS", "30"))
+
+
+class PipelineRuntime:
+    """Cold start, readiness and batching for a single shared ``RAGPipeline``
+
+    ``state`` moves through the loading stages to "ready", "demo" (no vector
+    store or RAG modules) or "failed"; ``ready`` is set once it settles.
+    """
+
+    def __init__(self, vector_store_path: str = DEFAULT_VECTOR_STORE,
+                 warm_up_questions: Sequence[str] = (), max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS, generator_workers: int = GENERATOR_WORKERS,
+                 inference_mode: str = INFERENCE_MODE, generation_budget: Optional[float] = GENERATION_BUDGET,
+                 answer_cache: str = ANSWER_CACHE, answer_cache_threshold: float = ANSWER_CACHE_THRESHOLD,
+                 store_reload_seconds: float = STORE_RELOAD_SECONDS):
+        self.vector_store_path = vector_store_path
+        self.warm_up_questions = list(warm_up_questions)
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.generator_workers = generator_workers
+        self.inference_mode = inference_mode
+        self.generation_budget = generation_budget
+        self.answer_cache = answer_cache
+        self.answer_cache_threshold = answer_cache_threshold
+        self.store_reload_seconds = store_reload_seconds
+        self.rag_system = None
+        self.scheduler = None
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.ready = threading.Event()
+        self.started_at = time.time()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._closing = threading.Event()
+
+    def start(self, background: bool = True):
+        """Begin loading (once); later calls are no-ops"""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        if background:
+            # Serve requests now; models load and warm up on a daemon thread
+            threading.Thread(target=self.initialize, name="rag-warmup", daemon=True).start()
+        else:
+            self.initialize()
+
+    def _stage(self, name, fn):
+        """Run one cold-start stage, logging how long it took"""
+        self.state = name
+        start = time.perf_counter()
+        result = fn()
+        self.timings[name] = time.perf_counter() - start
+        print(f"✓ {name} in {self.timings[name]:.1f}s")
+        return result
+
+    def initialize(self):
+        """Load the vector store and models, warm up, and start the batch scheduler"""
+        start = time.perf_counter()
+        try:
+            RAGPipeline = self._stage("importing modules", lambda: __import__("rag_pipeline").RAGPipeline)
+
+            from vector_store import resolve_store_path
+            store_path = resolve_store_path(self.vector_store_path)
+            if os.path.exists(store_path):
+                print(f"✓ Found vector store at {store_path}")
+                rag = self._stage("loading vector store",
+                                  lambda: RAGPipeline(store_path, load_models=False,
+                                                      generator_workers=self.generator_workers,
+                                                      inference_mode=self.inference_mode,
+                                                      generation_budget=self.generation_budget,
+                                                      answer_cache=self._answer_cache()))
+                self._stage("loading models", rag.load_models)
+                if self.warm_up_questions:
+                    self._stage("warming up", lambda: rag.warm_up(self.warm_up_questions, k=3))
+                from batch_scheduler import MicroBatchScheduler
+                self.scheduler = MicroBatchScheduler(rag, max_batch_size=self.max_batch_size,
+                                                     max_wait_ms=self.max_wait_ms)
+                self.rag_system = rag
+                self.state = "ready"
+                print("✓ RAG system initialized")
+                from segments import SegmentedVectorStore
+                if self.store_reload_seconds > 0 and isinstance(rag.vector_store, SegmentedVectorStore):
+                    threading.Thread(target=self._watch_store, name="rag-store-reload", daemon=True).start()
+            else:
+                print("⚠️ Vector store not found. Using demo mode.")
+                self.state = "demo"
+
+        except ImportError as e:
+            print(f"⚠️ Could not import RAG modules: {e}")
+            print("Using demonstration mode")
+            self.state = "demo"
+        except Exception as e:
+            print(f"✗ RAG initialization failed during '{self.state}': {e}")
+            self.error = str(e)
+            self.state = "failed"
+        finally:
+            self.timings["total"] = time.perf_counter() - start
+            print(f"✓ Cold start finished in {self.timings['total']:.1f}s ({self.state})")
+            self.ready.set()
+
+    def _answer_cache(self):
+        """SemanticAnswerCache configured by ``answer_cache``, or None when it is off"""
+        if not self.answer_cache or self.answer_cache.lower() in ("off", "none"):
+            return None
+        from answer_cache import SemanticAnswerCache
+        db_path = None if self.answer_cache.lower() == "memory" else self.answer_cache
+        print(f"✓ Semantic answer cache ({db_path or 'in memory'}, threshold {self.answer_cache_threshold})")
+        return SemanticAnswerCache(threshold=self.answer_cache_threshold, db_path=db_path)
+
+    def reload_store(self) -> bool:
+        """Load store changes made since the last (re)load, between batches; True if there were any"""
+        if not self.is_ready:
+            return False
+        return self.scheduler.run_exclusive(self.rag_system.reload_store)
+
+    def _watch_store(self):
+        while not self._closing.wait(self.store_reload_seconds):
+            try:
+                self.reload_store()
+            except Exception as e:
+                print(f"⚠️ Store reload failed: {e}")
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until loading settles; True if the pipeline is serving"""
+        self.ready.wait(timeout)
+        return self.is_ready
+
+    def close(self):
+        self._closing.set()
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self.rag_system is not None:
+            self.rag_system.close()
+            if self.rag_system.answer_cache is not None:
+                self.rag_system.answer_cache.close()
+
+
+_runtime: Optional[PipelineRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime(background: bool = True, **kwargs) -> PipelineRuntime:
+    """The process-wide runtime, created and started on first call
+
+    Keyword arguments configure the runtime on first call and are ignored afterwards.
+    """
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = PipelineRuntime(**kwargs)
+    _runtime.start(background)
+    return _runtime
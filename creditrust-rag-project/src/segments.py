@@ -0,0 +1,447 @@
+# src/segments.py
+"""Append-only segmented vector store with tombstones and offline compaction.
+
+A segmented store is a directory::
+
+    manifest.json          segment list, tombstone file, id counter
+    seg-000001.vstore      immutable segments in the .vstore format
+    seg-000002.vstore
+    tombstones-000003.npy  sorted stable ids of deleted chunks
+
+Every appended chunk gets a stable id (stored in the segment's ``ids``
+section) that survives compaction. Appending writes one new segment and
+swaps the manifest atomically, so a daily ingest costs time proportional
+to the new data. Deletions only add ids to the tombstone set; ``compact``
+rewrites the live rows of all segments into a single segment.
+
+For querying, the segments are presented as one row space (segment rows
+concatenated in manifest order) and ``SegmentedIndex`` searches each
+segment, masks tombstoned rows and merges the per-segment top-k.
+
+Each segment gets its own metadata-index and BM25 sidecars
+(``seg-000001.vstore.meta.npz``, ``.bm25.npz``), written when the segment
+is, plus chunk token counts (``.tokens.npz``) when the store is opened with
+the generator's tokenizer. The store-wide indexes are merged from them, so
+picking up an append loads one new sidecar instead of re-indexing the
+whole corpus.
+"""
+import bisect
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_store import VectorStore, normalize_rows, write_vector_store
+from ann_index import _as_query_matrix, _pad, search_rows, top_k_indices_from_scores, SCORE_BUFFER_SIZE
+from metadata_index import MetadataIndex, metadata_index_path_for, parse_date
+from lexical_index import BM25Index, lexical_index_path_for
+from token_budget import WORDS_PER_SPAN, ChunkTokenIndex, token_index_path_for
+
+MANIFEST = "manifest.json"
+SEGMENT_FORMAT = 1
+
+
+class ConcatSequence(Sequence):
+    """Read-only view over several sequences laid end to end"""
+
+    def __init__(self, parts: List[Sequence], offsets: List[int]):
+        self._parts = parts
+        self._offsets = offsets
+
+    def __len__(self):
+        return self._offsets[-1] if self._offsets else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row out of range")
+        part = bisect.bisect_right(self._offsets, index) - 1
+        return self._parts[part][index - self._offsets[part]]
+
+
+class ConcatenatedRows:
+    """Row-gather view over several embedding matrices (no full concatenation)"""
+
+    ndim = 2
+    dtype = np.float32
+
+    def __init__(self, parts: List[np.ndarray], offsets: List[int], dim: int):
+        self._parts = parts
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self.shape = (int(self._offsets[-1]) if len(self._offsets) else 0, dim)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        out = np.empty((len(rows), self.shape[1]), dtype=np.float32)
+        parts = np.searchsorted(self._offsets, rows, side="right") - 1
+        for part in np.unique(parts):
+            mask = parts == part
+            out[mask] = self._parts[part][rows[mask] - self._offsets[part]]
+        return out
+
+
+class SegmentedVectorStore:
+    """Directory of immutable ``.vstore`` segments plus a tombstone set"""
+
+    def __init__(self, directory: str, tokenizer=None):
+        """
+        Args:
+            directory: Store directory
+            tokenizer: Optional generator tokenizer; appends and compaction then
+                also write per-segment chunk token counts
+        """
+        self.directory = directory
+        self.path = directory
+        self.tokenizer = tokenizer
+        # Per-segment sidecars already loaded, by (segment path, sidecar path); segments are immutable
+        self._sidecars: Dict[Tuple[str, str], Any] = {}
+        self.reload()
+
+    # ------------------------------------------------------------------
+    # Manifest handling
+    # ------------------------------------------------------------------
+    @classmethod
+    def create(cls, directory: str, dim: Optional[int] = None, tokenizer=None) -> "SegmentedVectorStore":
+        """Create an empty segmented store"""
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, MANIFEST)):
+            raise FileExistsError(f"A segmented store already exists in {directory}")
+        _write_manifest(directory, {"format": SEGMENT_FORMAT, "generation": 0, "next_id": 0,
+                                    "dim": dim, "segments": [], "tombstones": None})
+        return cls(directory, tokenizer=tokenizer)
+
+    @staticmethod
+    def is_segmented_store(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, MANIFEST))
+
+    def reload(self):
+        """Re-read the manifest and reopen segments (picks up appends and deletions)"""
+        with open(os.path.join(self.directory, MANIFEST), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.segments = [VectorStore.open(os.path.join(self.directory, entry["file"]))
+                         for entry in self.manifest["segments"]]
+        tombstones = self.manifest.get("tombstones")
+        self.tombstones = (np.load(os.path.join(self.directory, tombstones))
+                           if tombstones else np.empty(0, dtype=np.int64))
+
+        self.offsets = [0]
+        for segment in self.segments:
+            self.offsets.append(self.offsets[-1] + len(segment))
+        dim = self.manifest.get("dim") or (self.segments[0].dim if self.segments else 0)
+        self.chunks = ConcatSequence([s.chunks for s in self.segments], self.offsets)
+        self.metadata = ConcatSequence([s.metadata for s in self.segments], self.offsets)
+        self.embeddings = ConcatenatedRows([s.embeddings for s in self.segments], self.offsets, dim)
+        self.ids = (np.concatenate([np.asarray(s.ids) for s in self.segments])
+                    if self.segments else np.empty(0, dtype=np.int64))
+        self.deleted = np.isin(self.ids, self.tombstones, assume_unique=False)
+        self.segment_deleted = [self.deleted[a:b] for a, b in zip(self.offsets, self.offsets[1:])]
+
+        digest = hashlib.sha1()
+        for segment in self.segments:
+            digest.update(segment.version.encode("utf-8"))
+        digest.update(self.tombstones.tobytes())
+        self.version = digest.hexdigest()[:16]
+
+        current = {segment.path for segment in self.segments}
+        self._sidecars = {key: index for key, index in self._sidecars.items() if key[0] in current}
+
+    def is_stale(self) -> bool:
+        """True once another writer has committed a manifest generation this instance has not loaded"""
+        with open(os.path.join(self.directory, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)["generation"] != self.manifest["generation"]
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+
+    @property
+    def live_count(self) -> int:
+        return int(len(self) - self.deleted.sum())
+
+    def live_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Drop tombstoned rows from a sorted row-id array"""
+        if not self.deleted.any():
+            return rows
+        return rows[~self.deleted[rows]]
+
+    # ------------------------------------------------------------------
+    # Per-segment sidecars
+    # ------------------------------------------------------------------
+    def _segment_sidecar(self, part: int, path_for: Callable[[str], str], load: Callable,
+                         build: Callable[[VectorStore], Any], usable: Callable[[Any], bool] = lambda index: True):
+        """One segment's sidecar: cached, loaded from disk, or built and saved once if missing or stale"""
+        segment = self.segments[part]
+        path = path_for(segment.path)
+        index = self._sidecars.get((segment.path, path))
+        if index is not None and usable(index):
+            return index
+        index = load(path) if os.path.exists(path) else None
+        if index is None or index.store_version != segment.version or index.count != len(segment) \
+                or not usable(index):
+            index = build(segment)
+            try:
+                index.save(path)
+            except OSError as e:
+                print(f"⚠️ Could not save {path} ({e}); it will be rebuilt on the next load")
+        self._sidecars[(segment.path, path)] = index
+        return index
+
+    def metadata_index(self) -> MetadataIndex:
+        """Metadata postings over all segments, merged from the per-segment sidecars"""
+        parts = [self._segment_sidecar(part, metadata_index_path_for, MetadataIndex.load, _build_metadata_index)
+                 for part in range(len(self.segments))]
+        return MetadataIndex.concatenate(parts, self.offsets, store_version=self.version)
+
+    def lexical_index(self) -> BM25Index:
+        """BM25 over all segments, merged from the per-segment sidecars"""
+        parts = [self._segment_sidecar(part, lexical_index_path_for, BM25Index.load, _build_lexical_index,
+                                       usable=lambda index: index.frequencies is not None)
+                 for part in range(len(self.segments))]
+        return BM25Index.concatenate(parts, self.offsets, store_version=self.version)
+
+    def token_index(self, tokenizer) -> ChunkTokenIndex:
+        """Chunk token counts for ``tokenizer``, merged from the per-segment sidecars"""
+        name = tokenizer.name_or_path
+        parts = [self._segment_sidecar(part, token_index_path_for, ChunkTokenIndex.load,
+                                       lambda segment: _build_token_index(segment, tokenizer),
+                                       usable=lambda index: index.tokenizer_name == name
+                                       and index.words_per_span == WORDS_PER_SPAN)
+                 for part in range(len(self.segments))]
+        return ChunkTokenIndex.concatenate(parts, name, store_version=self.version)
+
+    def _write_segment(self, name: str, chunks: Sequence[str], embeddings: np.ndarray,
+                       metadata: Optional[Sequence[Dict[str, Any]]], ids: np.ndarray):
+        """Write a segment file and its sidecars (before the manifest references it)"""
+        path = os.path.join(self.directory, name)
+        write_vector_store(path, chunks, embeddings, metadata, ids=ids)
+        segment = VectorStore.open(path)
+        for path_for, build in _SIDECAR_BUILDERS:
+            build(segment).save(path_for(path))
+        if self.tokenizer is not None:
+            _build_token_index(segment, self.tokenizer).save(token_index_path_for(path))
+
+    def _commit(self, manifest: Dict[str, Any]):
+        manifest["generation"] += 1
+        _write_manifest(self.directory, manifest)
+        self.reload()
+
+    # ------------------------------------------------------------------
+    # Mutations
+    # ------------------------------------------------------------------
+    def append(self, chunks: Sequence[str], embeddings: np.ndarray,
+               metadata: Optional[Sequence[Dict[str, Any]]] = None,
+               source: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Write a new segment and return the stable ids assigned to its chunks.
+
+        ``source`` maps a writer name to a progress record saved in the same
+        manifest swap, so writers such as the ingestion pipeline checkpoint
+        atomically with the data they appended.
+        """
+        if len(chunks) == 0:
+            return np.empty(0, dtype=np.int64)
+        manifest = dict(self.manifest)
+        embeddings = normalize_rows(embeddings)
+        if manifest.get("dim") not in (None, embeddings.shape[1]):
+            raise ValueError(f"Segment has {embeddings.shape[1]} dims, store has {manifest['dim']}")
+        ids = np.arange(manifest["next_id"], manifest["next_id"] + len(chunks), dtype=np.int64)
+        name = f"seg-{manifest['generation'] + 1:06d}.vstore"
+        self._write_segment(name, chunks, embeddings, metadata, ids)
+        manifest["dim"] = int(embeddings.shape[1])
+        manifest["next_id"] = int(ids[-1]) + 1
+        manifest["segments"] = manifest["segments"] + [{"file": name, "count": len(chunks)}]
+        if source:
+            manifest["sources"] = dict(manifest.get("sources", {}), **source)
+        self._commit(manifest)
+        return ids
+
+    def source_record(self, name: str) -> Optional[Dict[str, Any]]:
+        """Latest progress record written under ``name`` (see ``append``)"""
+        return self.manifest.get("sources", {}).get(name)
+
+    def record_source(self, name: str, record: Dict[str, Any]):
+        """Save a progress record without appending data"""
+        manifest = dict(self.manifest)
+        manifest["sources"] = dict(manifest.get("sources", {}), **{name: record})
+        self._commit(manifest)
+
+    def delete(self, ids: Iterable[int]) -> int:
+        """Tombstone chunks by stable id; returns how many live chunks were removed"""
+        ids = np.unique(np.asarray(list(ids), dtype=np.int64))
+        before = self.live_count
+        manifest = dict(self.manifest)
+        name = f"tombstones-{manifest['generation'] + 1:06d}.npy"
+        np.save(os.path.join(self.directory, name), np.union1d(self.tombstones, ids))
+        old = manifest.get("tombstones")
+        manifest["tombstones"] = name
+        self._commit(manifest)
+        if old:
+            _remove_quietly(os.path.join(self.directory, old))
+        return before - self.live_count
+
+    def delete_where(self, field: str, values: Iterable[Any]) -> int:
+        """Tombstone every chunk whose metadata ``field`` is one of ``values``
+
+        Rows are looked up in the metadata index, so date fields compare as
+        days ("2023-01-05" also matches "01/05/2023"). Fields the index leaves
+        out for exceeding ``MAX_CARDINALITY`` values are matched by a scan.
+        """
+        values = list(values)
+        index = self.metadata_index()
+        if field in index.dates:
+            parts = [index.resolve({field: value}) for value in values if parse_date(value) is not None]
+            rows = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        elif field in index.postings:
+            rows = index.resolve({field: values})
+        elif field in index.skipped:
+            wanted = set(values)
+            rows = np.asarray([row for row in range(len(self))
+                               if (self.metadata[row] or {}).get(field) in wanted], dtype=np.int64)
+        else:
+            return 0
+        rows = rows[~self.deleted[rows]]
+        return self.delete(self.ids[rows]) if len(rows) else 0
+
+    def compact(self, dedup_threshold: Optional[float] = None) -> Tuple[int, int]:
+        """Merge all live rows into one segment; returns (segments before, rows dropped).
+
+        With ``dedup_threshold`` near-duplicate chunks are folded into one
+        representative as well (see ``dedup.deduplicate``).
+        """
+        segments_before = len(self.segments)
+        dropped = int(self.deleted.sum())
+        if segments_before <= 1 and dropped == 0 and dedup_threshold is None:
+            return segments_before, 0
+        live = np.flatnonzero(~self.deleted)
+        chunks = [self.chunks[row] for row in live]
+        metadata = [self.metadata[row] for row in live]
+        if dedup_threshold is not None and len(live):
+            from dedup import deduplicate, format_report
+            kept, metadata, report = deduplicate(chunks, metadata, dedup_threshold, dim=self.dim)
+            print(format_report(report))
+            chunks = [chunks[row] for row in kept]
+            dropped += len(live) - len(kept)
+            live = live[kept]
+        manifest = dict(self.manifest)
+        name = f"seg-{manifest['generation'] + 1:06d}.vstore"
+        self._write_segment(
+            name,
+            chunks,
+            self.embeddings[live] if len(live) else np.empty((0, self.dim), dtype=np.float32),
+            metadata,
+            self.ids[live],
+        )
+        old_files = [entry["file"] for entry in manifest["segments"]]
+        old_tombstones = manifest.get("tombstones")
+        manifest["segments"] = [{"file": name, "count": int(len(live))}]
+        manifest["tombstones"] = None
+        self._commit(manifest)
+        for old in old_files:
+            _remove_quietly(os.path.join(self.directory, old))
+            for path_for in _SIDECAR_PATHS:
+                _remove_quietly(path_for(os.path.join(self.directory, old)))
+        if old_tombstones:
+            _remove_quietly(os.path.join(self.directory, old_tombstones))
+        return segments_before, dropped
+
+
+class SegmentedIndex:
+    """Exact search across segments with tombstoned rows masked out"""
+
+    kind = "segmented"
+
+    def __init__(self, store: SegmentedVectorStore):
+        self.store = store
+
+    def search(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None,
+               **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+        queries = _as_query_matrix(queries)
+        store = self.store
+        hits_ids, hits_scores = [], []
+        for part, segment in enumerate(store.segments):
+            start, end = store.offsets[part], store.offsets[part + 1]
+            if rows is not None:
+                local = rows[(rows >= start) & (rows < end)] - start
+                local = local[~store.segment_deleted[part][local]]
+                if len(local) == 0:
+                    continue
+                ids, scores = search_rows(segment.embeddings, queries, k, rows=local)
+            else:
+                ids, scores = self._search_segment(segment.embeddings, store.segment_deleted[part], queries, k)
+            hits_ids.append(np.where(ids >= 0, ids + start, -1))
+            hits_scores.append(scores)
+
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if not hits_ids:
+            return out_ids, out_scores
+        all_ids = np.concatenate(hits_ids, axis=1)
+        all_scores = np.concatenate(hits_scores, axis=1)
+        for i in range(len(queries)):
+            top = top_k_indices_from_scores(all_scores[i], k)
+            top = top[all_ids[i][top] >= 0]
+            out_ids[i], out_scores[i] = _pad(all_ids[i][top], all_scores[i][top], k)
+        return out_ids, out_scores
+
+    @staticmethod
+    def _search_segment(embeddings, deleted, queries, k):
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        block = max(1, SCORE_BUFFER_SIZE // max(1, len(embeddings)))
+        for start in range(0, len(queries), block):
+            block_scores = queries[start:start + block] @ embeddings.T
+            block_scores[:, deleted] = -np.inf
+            for i, row_scores in enumerate(block_scores, start):
+                top = top_k_indices_from_scores(row_scores, k)
+                top = top[np.isfinite(row_scores[top])]
+                ids[i], scores[i] = _pad(top, row_scores[top], k)
+        return ids, scores
+
+
+def _build_metadata_index(segment: VectorStore) -> MetadataIndex:
+    return MetadataIndex.build(segment.metadata, store_version=segment.version)
+
+
+def _build_lexical_index(segment: VectorStore) -> BM25Index:
+    return BM25Index().build(segment.chunks, store_version=segment.version)
+
+
+def _build_token_index(segment: VectorStore, tokenizer) -> ChunkTokenIndex:
+    return ChunkTokenIndex.build(segment.chunks, tokenizer, tokenizer.name_or_path,
+                                 store_version=segment.version)
+
+
+_SIDECAR_BUILDERS = (
+    (metadata_index_path_for, _build_metadata_index),
+    (lexical_index_path_for, _build_lexical_index),
+)
+_SIDECAR_PATHS = (metadata_index_path_for, lexical_index_path_for, token_index_path_for)
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]):
+    path = os.path.join(directory, MANIFEST)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
@@ -0,0 +1,114 @@
+# src/text_processing.py
+"""Complaint narrative cleaning and chunking (library version of the EDA notebook steps).
+
+The cleaning paths reproduce the notebook's ``clean_text`` output:
+
+* ``clean_text``      - one string. Boilerplate phrases are literals, so they
+  are removed with ``str.replace``; ASCII text is stripped of special
+  characters with one ``str.translate`` and collapsed with ``split``/``join``.
+  Only non-ASCII text falls back to the precompiled regex.
+* ``clean_series``    - a pandas Series. Maps ``clean_text`` by default; with
+  ``vectorized=True`` it chains ``.str`` operations instead, which only run as
+  native kernels on Arrow-backed columns, measured slower than the
+  ``translate`` path in ``benchmark_text.py`` and can differ on rare Unicode
+  case mappings (e.g. dotted capital I).
+* ``clean_and_chunk`` - clean and chunk many texts, optionally sharded across
+  a process pool; shards are returned in input order.
+"""
+import re
+import string
+from concurrent.futures import Executor
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+BOILERPLATE_PHRASES = (
+    "i am writing to file a complaint",
+    "this complaint is regarding",
+    "please help me with",
+)
+_NON_ALNUM_SOURCE = r"[^a-z0-9\s]"
+_WHITESPACE_SOURCE = r"\s+"
+_NON_ALNUM = re.compile(_NON_ALNUM_SOURCE)
+_KEPT = set(string.ascii_lowercase + string.digits)
+_ASCII_TO_SPACE = {code: " " for code in range(128)
+                   if chr(code) not in _KEPT and not chr(code).isspace()}
+SHARD_ROWS = 2_000
+
+
+def clean_text(text: str) -> str:
+    """Lower-case, strip boilerplate phrases and special characters, collapse whitespace"""
+    text = text.lower()
+    for phrase in BOILERPLATE_PHRASES:
+        if phrase in text:
+            text = text.replace(phrase, "")
+    text = text.translate(_ASCII_TO_SPACE) if text.isascii() else _NON_ALNUM.sub(" ", text)
+    return " ".join(text.split())
+
+
+def clean_series(texts: pd.Series, vectorized: bool = False) -> pd.Series:
+    """``clean_text`` over a whole Series"""
+    if not vectorized:
+        return texts.map(clean_text)
+    cleaned = texts.astype(str).str.lower()
+    for phrase in BOILERPLATE_PHRASES:
+        cleaned = cleaned.str.replace(phrase, "", regex=False)
+    return (
+        cleaned.str.replace(_NON_ALNUM_SOURCE, " ", regex=True)
+        .str.replace(_WHITESPACE_SOURCE, " ", regex=True)
+        .str.strip()
+    )
+
+
+def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
+    """Split text into word-aligned chunks of at most ``chunk_size`` characters.
+
+    Consecutive chunks share roughly ``chunk_overlap`` characters of trailing
+    words so an answer that straddles a boundary stays retrievable.
+    """
+    if chunk_overlap >= chunk_size:
+        raise ValueError("chunk_overlap must be smaller than chunk_size")
+    if len(text) <= chunk_size:
+        return [text] if text else []
+    words = text.split(" ")
+    chunks = []
+    start = 0
+    while start < len(words):
+        end = start
+        length = 0
+        while end < len(words) and (end == start or length + 1 + len(words[end]) <= chunk_size):
+            length += len(words[end]) + (end > start)
+            end += 1
+        chunks.append(" ".join(words[start:end]))
+        if end >= len(words):
+            break
+        # Step back over trailing words to build the overlap
+        overlap_start = end
+        overlap = 0
+        while overlap_start - 1 > start and overlap + len(words[overlap_start - 1]) + 1 <= chunk_overlap:
+            overlap_start -= 1
+            overlap += len(words[overlap_start]) + 1
+        start = overlap_start
+    return chunks
+
+
+def _clean_and_chunk_shard(texts: Sequence[str], chunk_size: int, chunk_overlap: int) -> List[List[str]]:
+    return [chunk_text(clean_text(text), chunk_size, chunk_overlap) for text in texts]
+
+
+def clean_and_chunk(texts: Sequence[str], chunk_size: int = 500, chunk_overlap: int = 50,
+                    executor: Optional[Executor] = None, shard_rows: int = SHARD_ROWS) -> List[List[str]]:
+    """Clean and chunk every text; returns one list of chunks per input text, in order.
+
+    With a ``ProcessPoolExecutor`` the texts are split into ``shard_rows``
+    shards that are processed on separate cores.
+    """
+    texts = list(texts)
+    if executor is None or len(texts) <= shard_rows:
+        return _clean_and_chunk_shard(texts, chunk_size, chunk_overlap)
+    shards = [texts[start:start + shard_rows] for start in range(0, len(texts), shard_rows)]
+    results: List[List[str]] = []
+    for shard in executor.map(_clean_and_chunk_shard, shards,
+                              [chunk_size] * len(shards), [chunk_overlap] * len(shards)):
+        results.extend(shard)
+    return results
@@ -0,0 +1,196 @@
+# src/token_budget.py
+"""Precomputed chunk token counts and token-budgeted context packing.
+
+Each chunk is split into sentences and every sentence is tokenized once,
+at index-build time, with the generator's tokenizer. The index stores, per
+chunk, the character offset where each sentence ends and the cumulative
+token count up to that point (CSR-style: ``sentence_ptr`` slices
+``sentence_ends`` and ``sentence_tokens``). Sentences keep their leading
+whitespace, so for byte-level BPE tokenizers (gpt2) the counts add up to the
+token count of the chunk itself. SentencePiece tokenizers (Mistral, Llama)
+mark word boundaries themselves and add a prefix marker to each piece
+tokenized on its own, so their sums can overcount by about a token per
+sentence, which only makes packing slightly conservative.
+
+Text with no sentence boundary at all (cleaned narratives have no
+punctuation) is split every ``WORDS_PER_SPAN`` words instead, so such a
+chunk's "sentences" are word groups and it can still be trimmed. Sidecars
+record the ``words_per_span`` they were built with; older ones are rebuilt.
+
+Segmented stores keep one sidecar per segment; ``concatenate`` joins them.
+
+``pack_context`` then fills a token budget in score order: whole chunks
+while they fit, and the chunk that overflows is cut at the last sentence
+(or word-group) boundary that still fits. No candidate chunk is tokenized at query time.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\S+")
+WORDS_PER_SPAN = 8
+TOKENIZE_BATCH = 10_000
+
+
+def token_index_path_for(store_path: str) -> str:
+    """Sidecar path used for a store's chunk token counts"""
+    return f"{store_path}.tokens.npz"
+
+
+def load_tokenizer(name: Optional[str]):
+    """``AutoTokenizer`` for ``name``, or None if it is "none" or cannot be loaded"""
+    if not name or name == "none":
+        return None
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(name)
+    except Exception as e:
+        print(f"⚠️ Could not load tokenizer '{name}' ({e}); token counts will be built at load time")
+        return None
+
+
+def sentence_spans(text: str) -> List[int]:
+    """Character offsets where each sentence of ``text`` ends (the last is ``len(text)``)
+
+    Without sentence punctuation a span ends after every ``WORDS_PER_SPAN``
+    words, so the text can still be trimmed at a word boundary.
+    """
+    ends = [match.start() for match in _SENTENCE_END.finditer(text)]
+    if not ends:
+        ends = [match.end() for match in _WORD.finditer(text)][WORDS_PER_SPAN - 1::WORDS_PER_SPAN]
+    if not ends or ends[-1] != len(text):
+        ends.append(len(text))
+    return ends
+
+
+def count_tokens(tokenizer, texts: Sequence[str]) -> np.ndarray:
+    """Token count of each text, without special tokens"""
+    counts = np.zeros(len(texts), dtype=np.int32)
+    for start in range(0, len(texts), TOKENIZE_BATCH):
+        batch = list(texts[start:start + TOKENIZE_BATCH])
+        if batch:
+            encoded = tokenizer(batch, add_special_tokens=False)["input_ids"]
+            counts[start:start + len(batch)] = [len(ids) for ids in encoded]
+    return counts
+
+
+class ChunkTokenIndex:
+    """Per-chunk sentence boundaries and cumulative token counts for one tokenizer"""
+
+    def __init__(self, tokenizer_name: str, sentence_ptr: np.ndarray, sentence_ends: np.ndarray,
+                 sentence_tokens: np.ndarray, store_version: Optional[str] = None,
+                 words_per_span: Optional[int] = WORDS_PER_SPAN):
+        self.tokenizer_name = tokenizer_name
+        self.sentence_ptr = sentence_ptr
+        self.sentence_ends = sentence_ends
+        self.sentence_tokens = sentence_tokens
+        self.store_version = store_version
+        # None for sidecars saved before unpunctuated text was split into word groups
+        self.words_per_span = words_per_span
+
+    @property
+    def count(self) -> int:
+        return len(self.sentence_ptr) - 1
+
+    @property
+    def token_counts(self) -> np.ndarray:
+        """Tokens in each whole chunk"""
+        return self.sentence_tokens[self.sentence_ptr[1:] - 1]
+
+    @classmethod
+    def build(cls, chunks: Sequence[str], tokenizer, tokenizer_name: Optional[str] = None,
+              store_version: Optional[str] = None) -> "ChunkTokenIndex":
+        ptr = np.zeros(len(chunks) + 1, dtype=np.int64)
+        ends: List[int] = []
+        pieces: List[str] = []
+        for row in range(len(chunks)):
+            text = chunks[row]
+            previous = 0
+            for end in sentence_spans(text):
+                pieces.append(text[previous:end])
+                ends.append(end)
+                previous = end
+            ptr[row + 1] = len(ends)
+        counts = count_tokens(tokenizer, pieces).astype(np.int64)
+        cumulative = np.cumsum(counts)
+        # Restart the running total at each chunk
+        chunk_start = np.repeat(ptr[:-1], np.diff(ptr))
+        offsets = np.concatenate([[0], cumulative])[chunk_start]
+        return cls(tokenizer_name or getattr(tokenizer, "name_or_path", ""), ptr,
+                   np.asarray(ends, dtype=np.int32), (cumulative - offsets).astype(np.int32),
+                   store_version=store_version)
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["ChunkTokenIndex"], tokenizer_name: str,
+                    store_version: Optional[str] = None) -> "ChunkTokenIndex":
+        """One index over the chunks of ``parts`` laid end to end (per-segment sidecars)"""
+        pointers = [np.zeros(1, dtype=np.int64)]
+        sentences = 0
+        for part in parts:
+            pointers.append(part.sentence_ptr[1:] + sentences)
+            sentences += int(part.sentence_ptr[-1])
+        return cls(tokenizer_name, np.concatenate(pointers),
+                   np.concatenate([part.sentence_ends for part in parts] or [np.empty(0, dtype=np.int32)]),
+                   np.concatenate([part.sentence_tokens for part in parts] or [np.empty(0, dtype=np.int32)]),
+                   store_version=store_version)
+
+    def fit(self, row: int, budget: int) -> Tuple[int, int]:
+        """``(char_end, tokens)`` of the longest sentence prefix of chunk ``row`` within ``budget``
+
+        ``char_end`` is 0 when not even the first sentence fits.
+        """
+        start, stop = self.sentence_ptr[row], self.sentence_ptr[row + 1]
+        fitting = int(np.searchsorted(self.sentence_tokens[start:stop], budget, side="right"))
+        if fitting == 0:
+            return 0, 0
+        return int(self.sentence_ends[start + fitting - 1]), int(self.sentence_tokens[start + fitting - 1])
+
+    def save(self, path: str):
+        meta = {"tokenizer": self.tokenizer_name, "count": self.count, "store_version": self.store_version,
+                "words_per_span": self.words_per_span}
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), sentence_ptr=self.sentence_ptr,
+                 sentence_ends=self.sentence_ends, sentence_tokens=self.sentence_tokens)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkTokenIndex":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(meta["tokenizer"], data["sentence_ptr"], data["sentence_ends"],
+                       data["sentence_tokens"], store_version=meta["store_version"],
+                       words_per_span=meta.get("words_per_span"))
+
+
+def pack_context(chunks: Sequence[Dict[str, Any]], index: ChunkTokenIndex, budget: int,
+                 overhead: int = 0) -> List[Dict[str, Any]]:
+    """Chunks (score order) that fit in ``budget`` tokens, the last one trimmed at a sentence boundary
+
+    Chunks without sentence punctuation are trimmed at a word boundary
+    instead (see ``sentence_spans``).
+
+    ``overhead`` is the token cost of the framing added around each chunk
+    (e.g. "Excerpt 3: " and the separator). Trimmed chunks are copies
+    with ``text`` shortened and ``truncated`` set.
+    """
+    packed = []
+    remaining = budget
+    for chunk in chunks:
+        available = remaining - overhead
+        if available <= 0:
+            break
+        row = chunk["id"]
+        tokens = int(index.sentence_tokens[index.sentence_ptr[row + 1] - 1])
+        if tokens <= available:
+            packed.append(chunk)
+            remaining -= tokens + overhead
+            continue
+        end, tokens = index.fit(row, available)
+        if end:
+            packed.append(dict(chunk, text=chunk["text"][:end], truncated=True))
+        break
+    return packed
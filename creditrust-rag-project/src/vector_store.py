@@ -0,0 +1,329 @@
+# src/vector_store.py
+"""Vector store loading and the memory-mapped on-disk store format.
+
+Layout of a ``.vstore`` file (all integers little-endian)::
+
+    magic        8 bytes   b"CTVSTORE"
+    version      uint32    FORMAT_VERSION
+    header_len   uint32    length of the JSON header in bytes
+    header_crc   uint32    crc32 of the JSON header
+    header       JSON      count, dim, dtype and a table of sections
+    sections     raw       each section starts on a 64-byte boundary
+
+Sections:
+    embeddings         float32 (count, dim), rows L2-normalized
+    text_offsets       uint64 (count + 1), byte offsets into ``text``
+    text               utf-8 chunk texts, concatenated
+    metadata_offsets   uint64 (count + 1), byte offsets into ``metadata``
+    metadata           utf-8 JSON objects, concatenated
+    ids                int64 (count,), optional stable chunk ids (segmented stores)
+
+Every section carries its own crc32 in the header. Loading only checks the
+header checksum and maps the file read-only, so startup cost does not grow
+with the corpus and several processes share the same page-cache pages.
+Call ``VectorStore.verify()`` to check the section checksums.
+"""
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"CTVSTORE"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sIII")
+
+
+class VectorStoreFormatError(ValueError):
+    """Raised when a store file is truncated, corrupted or of an unknown version"""
+
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """Return a contiguous float32 copy of ``embeddings`` with unit-length rows"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(embeddings / norms)
+
+
+class BlobSequence(Sequence):
+    """Read-only sequence of records stored as an offsets array plus a byte blob"""
+
+    def __init__(self, offsets: np.ndarray, blob, decode=None):
+        self._offsets = offsets
+        self._blob = blob
+        self._decode = decode
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        text = bytes(self._blob[start:end]).decode("utf-8")
+        return self._decode(text) if self._decode else text
+
+
+class VectorStore:
+    """Chunks, row-normalized float32 embeddings and per-chunk metadata"""
+
+    def __init__(self, chunks: Sequence[str], embeddings: np.ndarray,
+                 metadata: Optional[Sequence[Dict[str, Any]]] = None,
+                 version: Optional[str] = None, path: Optional[str] = None,
+                 ids: Optional[np.ndarray] = None):
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.metadata = metadata if metadata is not None else [{} for _ in range(len(chunks))]
+        self.ids = ids if ids is not None else np.arange(len(chunks), dtype=np.int64)
+        self.path = path
+        self.version = version or self._fingerprint()
+        self._mmap = None
+        self._header = None
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1]) if self.embeddings.ndim == 2 else 0
+
+    def _fingerprint(self) -> str:
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(self.embeddings).tobytes())
+        for chunk in self.chunks:
+            digest.update(chunk.encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], path: Optional[str] = None) -> "VectorStore":
+        """Build a store from the legacy ``{'chunks', 'embeddings', 'metadata'}`` dict"""
+        chunks = list(data["chunks"])
+        embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(chunks), -1)
+        metadata = data.get("metadata")
+        return cls(chunks, normalize_rows(embeddings),
+                   list(metadata) if metadata else None, path=path)
+
+    @classmethod
+    def from_pickle(cls, path: str) -> "VectorStore":
+        """Load the legacy pickled dict of Python lists"""
+        with open(path, "rb") as f:
+            return cls.from_dict(pickle.load(f), path=path)
+
+    @classmethod
+    def open(cls, path: str) -> "VectorStore":
+        """Memory-map a ``.vstore`` file without copying its payload"""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = _read_header(mapped, path)
+            count, dim = header["count"], header["dim"]
+            sections = header["sections"]
+
+            def view(name, dtype, length):
+                section = sections[name]
+                return np.frombuffer(mapped, dtype=dtype, count=length, offset=section["offset"])
+
+            def raw(name):
+                section = sections[name]
+                return memoryview(mapped)[section["offset"]:section["offset"] + section["length"]]
+
+            embeddings = view("embeddings", np.float32, count * dim).reshape(count, dim)
+            chunks = BlobSequence(view("text_offsets", np.uint64, count + 1), raw("text"))
+            metadata = BlobSequence(view("metadata_offsets", np.uint64, count + 1),
+                                    raw("metadata"), decode=json.loads)
+            ids = view("ids", np.int64, count) if "ids" in sections else None
+        except (KeyError, ValueError) as e:
+            mapped.close()
+            raise VectorStoreFormatError(f"{path}: malformed store ({e})") from e
+
+        store = cls(chunks, embeddings, metadata, version=header["store_version"], path=path, ids=ids)
+        store._mmap = mapped
+        store._header = header
+        return store
+
+    def verify(self) -> bool:
+        """Recompute every section checksum of a memory-mapped store"""
+        if self._header is None:
+            return True
+        for name, section in self._header["sections"].items():
+            payload = memoryview(self._mmap)[section["offset"]:section["offset"] + section["length"]]
+            if zlib.crc32(payload) != section["crc32"]:
+                raise VectorStoreFormatError(f"{self.path}: checksum mismatch in section '{name}'")
+        return True
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def save(self, path: str, extra_header: Optional[Dict[str, Any]] = None):
+        """Write the store, stable ids included, in the ``.vstore`` format (atomically replaces ``path``)"""
+        write_vector_store(path, self.chunks, self.embeddings, self.metadata, extra_header, ids=self.ids)
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _read_header(buffer, path: str) -> Dict[str, Any]:
+    if len(buffer) < _PREAMBLE.size:
+        raise VectorStoreFormatError(f"{path}: file too small to be a vector store")
+    magic, version, header_len, header_crc = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise VectorStoreFormatError(f"{path}: not a vector store file")
+    if version != FORMAT_VERSION:
+        raise VectorStoreFormatError(
+            f"{path}: unsupported format version {version} (expected {FORMAT_VERSION})"
+        )
+    header_bytes = bytes(buffer[_PREAMBLE.size:_PREAMBLE.size + header_len])
+    if len(header_bytes) != header_len or zlib.crc32(header_bytes) != header_crc:
+        raise VectorStoreFormatError(f"{path}: header checksum mismatch")
+    header = json.loads(header_bytes.decode("utf-8"))
+    for name, section in header["sections"].items():
+        if section["offset"] + section["length"] > len(buffer):
+            raise VectorStoreFormatError(f"{path}: section '{name}' is truncated")
+    return header
+
+
+def _encode_records(records, encode) -> Tuple[np.ndarray, bytes]:
+    offsets = np.zeros(len(records) + 1, dtype=np.uint64)
+    parts: List[bytes] = []
+    position = 0
+    for i, record in enumerate(records):
+        data = encode(record).encode("utf-8")
+        parts.append(data)
+        position += len(data)
+        offsets[i + 1] = position
+    return offsets, b"".join(parts)
+
+
+def write_vector_store(path: str, chunks: Sequence[str], embeddings: np.ndarray,
+                       metadata: Optional[Sequence[Dict[str, Any]]] = None,
+                       extra_header: Optional[Dict[str, Any]] = None,
+                       ids: Optional[np.ndarray] = None):
+    """Write chunks, embeddings and metadata (and optionally stable ids) to a ``.vstore`` file"""
+    embeddings = normalize_rows(embeddings)
+    count = len(chunks)
+    if embeddings.shape[0] != count:
+        raise ValueError(f"{embeddings.shape[0]} embeddings for {count} chunks")
+    if metadata is None:
+        metadata = [{} for _ in range(count)]
+
+    text_offsets, text = _encode_records(chunks, str)
+    metadata_offsets, metadata_blob = _encode_records(
+        metadata, lambda record: json.dumps(record or {}, ensure_ascii=False, default=str)
+    )
+    payloads = {
+        "embeddings": embeddings.tobytes(),
+        "text_offsets": text_offsets.tobytes(),
+        "text": text,
+        "metadata_offsets": metadata_offsets.tobytes(),
+        "metadata": metadata_blob,
+    }
+    if ids is not None:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != count:
+            raise ValueError(f"{len(ids)} ids for {count} chunks")
+        payloads["ids"] = ids.tobytes()
+
+    # Section offsets depend on the header length, which depends on the
+    # offsets; lay out against a generous upper bound and pad the header.
+    header = {
+        "format_version": FORMAT_VERSION,
+        "count": count,
+        "dim": int(embeddings.shape[1]) if count else 0,
+        "dtype": "float32",
+        "normalized": True,
+        "sections": {},
+    }
+    header.update(extra_header or {})
+    crcs = {name: zlib.crc32(data) for name, data in payloads.items()}
+    header["store_version"] = hashlib.sha1(
+        json.dumps(crcs, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    sections_size = len(json.dumps(
+        {name: {"offset": 2 ** 63, "length": 2 ** 63, "crc32": 2 ** 32} for name in payloads}
+    ))
+    offset = _align(_PREAMBLE.size + len(json.dumps(header)) + sections_size)
+    for name, data in payloads.items():
+        header["sections"][name] = {"offset": offset, "length": len(data), "crc32": crcs[name]}
+        offset = _align(offset + len(data))
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes), zlib.crc32(header_bytes)))
+        f.write(header_bytes)
+        for name, data in payloads.items():
+            f.write(b"\0" * (header["sections"][name]["offset"] - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return header
+
+
+def is_vector_store_file(path: str) -> bool:
+    """True if ``path`` starts with the ``.vstore`` magic bytes"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def resolve_store_path(path: str) -> str:
+    """Prefer a converted ``.vstore`` next to a ``.pkl`` path, falling back to the pickle
+
+    ``data/vector_store.vstore`` and ``data/vector_store.pkl`` both resolve to
+    the memory-mapped file once convert_vector_store.py has written it, and
+    to the pickle until then.
+    """
+    base, extension = os.path.splitext(path)
+    if extension == ".pkl" and is_vector_store_file(base + ".vstore"):
+        return base + ".vstore"
+    if extension == ".vstore" and not os.path.exists(path) and os.path.exists(base + ".pkl"):
+        return base + ".pkl"
+    return path
+
+
+def load_vector_store(path: str):
+    """Open a segmented store directory, a ``.vstore`` file, or a legacy pickle"""
+    if os.path.isdir(path):
+        from segments import SegmentedVectorStore
+        return SegmentedVectorStore(path)
+    if is_vector_store_file(path):
+        return VectorStore.open(path)
+    return VectorStore.from_pickle(path)
+
+
+def convert_pickle_store(pickle_path: str, output_path: str,
+                         dedup_threshold: Optional[float] = None) -> Dict[str, Any]:
+    """Convert a legacy ``vector_store.pkl`` into the memory-mapped format
+
+    With ``dedup_threshold`` near-duplicate chunks are folded into one
+    representative on the way (see ``dedup.deduplicate``).
+    """
+    store = VectorStore.from_pickle(pickle_path)
+    chunks, embeddings, metadata = store.chunks, store.embeddings, store.metadata
+    if dedup_threshold is not None and len(store):
+        from dedup import deduplicate, format_report
+        kept, metadata, report = deduplicate(chunks, metadata, dedup_threshold, dim=store.dim)
+        print(format_report(report))
+        chunks, embeddings = [chunks[row] for row in kept], embeddings[kept]
+    return write_vector_store(output_path, chunks, embeddings, metadata)
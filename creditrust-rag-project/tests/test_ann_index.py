@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from ann_index import build_index, load_index
+from vector_store import VectorStore, normalize_rows, write_vector_store
+
+
+def _store(path, seed):
+    embeddings = normalize_rows(np.random.default_rng(seed).normal(size=(64, 8)).astype(np.float32))
+    write_vector_store(path, [f"chunk {i}" for i in range(64)], embeddings)
+    return VectorStore.open(path)
+
+
+@pytest.mark.parametrize("kind", ["exact", "ivf", "int8"])
+def test_index_loads_only_for_the_store_version_it_was_built_for(tmp_path, kind):
+    store = _store(str(tmp_path / "store.vstore"), seed=0)
+    index_path = str(tmp_path / "index.npz")
+    build_index(kind, store.embeddings).save(index_path, store.version)
+    assert load_index(index_path, store.embeddings, store.version).kind == kind
+
+    # Same row count, different contents
+    rebuilt = _store(str(tmp_path / "rebuilt.vstore"), seed=1)
+    assert len(rebuilt) == len(store) and rebuilt.version != store.version
+    with pytest.raises(ValueError, match="store version"):
+        load_index(index_path, rebuilt.embeddings, rebuilt.version)
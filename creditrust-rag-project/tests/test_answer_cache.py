@@ -0,0 +1,120 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from answer_cache import SemanticAnswerCache
+from generation_control import AnswerStream
+from rag_pipeline import RAGPipeline
+from vector_store import write_vector_store
+
+DIM = 8
+
+
+class HashEncoder:
+    """Deterministic unit vectors per text, so a repeated question matches itself"""
+
+    def encode(self, texts, **kwargs):
+        # Like SentenceTransformer: one string gives one vector
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        rows = [np.random.default_rng(zlib.crc32(text.encode("utf-8"))).normal(size=DIM) for text in texts]
+        rows = np.asarray(rows, dtype=np.float32)
+        return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+class ScriptedGenerator:
+    """Stands in for generation: returns the queued results in order and counts calls"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def result(self, prompt):
+        self.calls += 1
+        return dict(self.results.pop(0))
+
+    def results_for(self, prompts, batch_size=8):
+        return [self.result(prompt) for prompt in prompts]
+
+    def stream(self, prompt, result=None):
+        outcome = self.result(prompt)
+        for word in outcome["answer"].split(" "):
+            yield word + " "
+        if result is not None:
+            result.update(outcome)
+
+
+def _complete(answer):
+    return {"answer": answer, "truncated": False, "stop_reason": "stop_sequence"}
+
+
+def _truncated(answer):
+    return {"answer": answer, "truncated": True, "stop_reason": "budget"}
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "store.vstore")
+    write_vector_store(path, [f"Complaint {i} about card fees." for i in range(6)],
+                       rng.normal(size=(6, DIM)).astype(np.float32), [{"product": "Credit card"}] * 6)
+    pipeline = RAGPipeline(path, load_models=False, answer_cache=SemanticAnswerCache(ttl_seconds=None))
+    pipeline.embedding_model = HashEncoder()
+    return pipeline
+
+
+def _script(pipeline, *results):
+    generator = ScriptedGenerator(*results)
+    pipeline.generate_answer_result = generator.result
+    pipeline.generate_answer_results = generator.results_for
+    pipeline.generate_answer_stream = generator.stream
+    return generator
+
+
+def test_complete_answers_are_cached(pipeline):
+    generator = _script(pipeline, _complete("Fees were refunded."))
+    first = pipeline.query("Why was I charged twice?", k=3)
+    second = pipeline.query("Why was I charged twice?", k=3)
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["answer"] == "Fees were refunded." and generator.calls == 1
+
+
+def test_truncated_answers_are_not_cached(pipeline):
+    generator = _script(pipeline, _truncated("Fees were"), _complete("Fees were refunded."))
+    first = pipeline.query("Why was I charged twice?", k=3)
+    assert first["truncated"] and not first["cached"]
+    second = pipeline.query("Why was I charged twice?", k=3)
+    assert not second["cached"] and second["answer"] == "Fees were refunded."
+    assert generator.calls == 2
+
+
+def test_query_batch_caches_only_complete_rows(pipeline):
+    _script(pipeline, _truncated("Partial"), _complete("Whole answer."))
+    results = pipeline.query_batch(["First question?", "Second question?"], k=3)
+    assert [result["truncated"] for result in results] == [True, False]
+    generator = _script(pipeline, _complete("Regenerated."))
+    again = pipeline.query_batch(["First question?", "Second question?"], k=3)
+    assert [result["cached"] for result in again] == [False, True]
+    assert again[0]["answer"] == "Regenerated." and generator.calls == 1
+
+
+def test_truncated_streams_are_reported_and_not_cached(pipeline):
+    generator = _script(pipeline, _truncated("Fees were"), _complete("Fees were refunded."))
+    _, pieces = pipeline.query_stream("Why was I charged twice?", k=3)
+    assert isinstance(pieces, AnswerStream)
+    assert "".join(pieces).strip() == "Fees were"
+    assert pieces.truncated and pieces.result["stop_reason"] == "budget"
+
+    _, pieces = pipeline.query_stream("Why was I charged twice?", k=3)
+    assert "".join(pieces).strip() == "Fees were refunded." and not pieces.truncated
+    _, pieces = pipeline.query_stream("Why was I charged twice?", k=3)
+    assert list(pieces) == ["Fees were refunded."] and pieces.result["stop_reason"] == "cached"
+    assert generator.calls == 2
+
+
+def test_dummy_generator_stream_reports_its_outcome(pipeline):
+    pipeline.embedding_model = None
+    _, pieces = pipeline.query_stream("Why was I charged twice?", k=3)
+    answer = "".join(pieces)
+    assert answer and not pieces.truncated and pieces.result["answer"] == answer
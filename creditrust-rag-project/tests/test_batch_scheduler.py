@@ -0,0 +1,171 @@
+import threading
+
+import pytest
+
+from batch_scheduler import MicroBatchScheduler
+
+
+class StubPipeline:
+    """Records the batches it is asked to answer"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def query_batch(self, questions, k=5, filters=None, batch_size=8):
+        with self.lock:
+            self.calls.append(("query_batch", list(questions), k, filters))
+        if "boom" in questions:
+            raise ValueError("bad batch")
+        return [{"question": question, "answer": question.upper(), "k": k} for question in questions]
+
+    def query_stream_batch(self, questions, k=5, filters=None):
+        with self.lock:
+            self.calls.append(("query_stream_batch", list(questions), k, filters))
+        return [([{"id": 0}], iter(question.split())) for question in questions]
+
+
+@pytest.fixture
+def pipeline():
+    return StubPipeline()
+
+
+def test_concurrent_questions_share_one_batch(pipeline):
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=8, max_wait_ms=500)
+    futures = [scheduler.submit(f"q{i}", k=3) for i in range(5)]
+    assert [future.result(timeout=5)["answer"] for future in futures] == ["Q0", "Q1", "Q2", "Q3", "Q4"]
+    scheduler.close()
+    assert pipeline.calls == [("query_batch", ["q0", "q1", "q2", "q3", "q4"], 3, None)]
+    stats = scheduler.stats()
+    assert stats["batches"] == 1 and stats["batch_size_histogram"] == {5: 1}
+
+
+def test_batches_are_capped_at_max_batch_size(pipeline):
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=4, max_wait_ms=500)
+    futures = [scheduler.submit(f"q{i}") for i in range(6)]
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.close()
+    assert [len(call[1]) for call in pipeline.calls] == [4, 2]
+
+
+def test_settings_are_answered_in_separate_calls(pipeline):
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=8, max_wait_ms=500)
+    futures = [scheduler.submit("a", k=3), scheduler.submit("b", k=5),
+               scheduler.submit("c", k=3, filters={"product": "Mortgage"}), scheduler.submit("d", k=3)]
+    assert [future.result(timeout=5)["k"] for future in futures] == [3, 5, 3, 3]
+    scheduler.close()
+    assert sorted(call[1] for call in pipeline.calls) == [["a", "d"], ["b"], ["c"]]
+    assert scheduler.stats()["batches"] == 1
+
+
+def test_streaming_questions_use_query_stream_batch(pipeline):
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=8, max_wait_ms=500)
+    futures = [scheduler.submit_stream("card fees", k=3), scheduler.submit_stream("late payment", k=3),
+               scheduler.submit("plain", k=3)]
+    sources, pieces = futures[0].result(timeout=5)
+    assert sources == [{"id": 0}] and list(pieces) == ["card", "fees"]
+    assert futures[2].result(timeout=5)["answer"] == "PLAIN"
+    scheduler.close()
+    kinds = sorted((call[0], tuple(call[1])) for call in pipeline.calls)
+    assert kinds == [("query_batch", ("plain",)), ("query_stream_batch", ("card fees", "late payment"))]
+
+
+def test_a_failing_batch_fails_only_its_callers(pipeline):
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=8, max_wait_ms=500)
+    bad = [scheduler.submit("boom"), scheduler.submit("x")]
+    good = scheduler.submit("y", k=2)
+    for future in bad:
+        with pytest.raises(ValueError, match="bad batch"):
+            future.result(timeout=5)
+    assert good.result(timeout=5)["answer"] == "Y"
+    scheduler.close()
+
+
+def test_close_answers_queued_requests_then_rejects_new_ones(pipeline):
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=2, max_wait_ms=1000)
+    futures = [scheduler.submit(f"q{i}") for i in range(3)]
+    scheduler.close()
+    assert all(future.done() for future in futures)
+    with pytest.raises(RuntimeError):
+        scheduler.submit("late")
+
+
+def test_run_exclusive_waits_for_the_batch_in_flight(pipeline):
+    started, release = threading.Event(), threading.Event()
+    answer = pipeline.query_batch
+
+    def slow_query_batch(questions, **kwargs):
+        started.set()
+        release.wait(5)
+        return answer(questions, **kwargs)
+
+    pipeline.query_batch = slow_query_batch
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=1, max_wait_ms=0)
+    future = scheduler.submit("q")
+    assert started.wait(5)
+    reload = threading.Thread(target=scheduler.run_exclusive, args=(lambda: pipeline.calls.append("reload"),))
+    reload.start()
+    reload.join(0.2)
+    assert reload.is_alive() and pipeline.calls == []
+    release.set()
+    reload.join(5)
+    assert future.result(timeout=5)["answer"] == "Q"
+    assert pipeline.calls[-1] == "reload"
+    scheduler.close()
+
+
+class LetterTokenizer:
+    eos_token_id = 0
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(ord("a") + i - 1) for i in ids if i != self.eos_token_id)
+
+
+class StubController:
+    """Batched generation that answers row ``i`` with ``i + 1`` letters, counting the calls"""
+
+    stop_sequences = ("Question:",)
+
+    def __init__(self):
+        self.batches = []
+
+    def generate_batch(self, prompts, budget=None, streamer=None):
+        import torch
+        self.batches.append(len(prompts))
+        rows = len(prompts)
+        streamer.put(torch.zeros((rows, 3), dtype=torch.long))
+        for step in range(rows):
+            streamer.put(torch.tensor([step + 1 if step <= row else 0 for row in range(rows)]))
+        streamer.end()
+        return [{"answer": "abcd"[:row + 1], "truncated": False, "stop_reason": "eos"} for row in range(rows)]
+
+
+def test_streaming_callers_share_one_generation_call(tmp_path):
+    pytest.importorskip("torch")
+    import numpy as np
+    from rag_pipeline import RAGPipeline
+    from vector_store import write_vector_store
+
+    path = str(tmp_path / "store.vstore")
+    write_vector_store(path, [f"Complaint {i}." for i in range(4)], np.eye(4, dtype=np.float32))
+    pipeline = RAGPipeline(path, load_models=False)
+    pipeline.generator = type("Generator", (), {"tokenizer": LetterTokenizer()})()
+    pipeline.generation_controller = controller = StubController()
+
+    scheduler = MicroBatchScheduler(pipeline, max_batch_size=8, max_wait_ms=500)
+    answers = {}
+
+    def chat(question):
+        _, pieces = scheduler.query_stream(question, k=2, timeout=5)
+        answers[question] = ("".join(pieces), pieces.result["stop_reason"])
+
+    users = [threading.Thread(target=chat, args=(f"question {i}",)) for i in range(3)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join(timeout=5)
+    scheduler.close()
+
+    assert controller.batches == [3]
+    assert sorted(answers.values()) == [("a", "eos"), ("ab", "eos"), ("abc", "eos")]
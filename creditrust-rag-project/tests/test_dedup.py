@@ -0,0 +1,57 @@
+import numpy as np
+
+from dedup import MinHasher, choose_bands, deduplicate, find_near_duplicates
+
+BASE = ("I disputed an unauthorized charge on my credit card statement and the bank "
+        "refused to refund it even after I sent the police report and three letters")
+OTHER = ("My mortgage servicer misapplied two monthly payments and then charged late fees "
+         "and reported me to the credit bureaus without any notice at all")
+
+
+def _jaccard(a, b, hasher):
+    x, y = set(hasher.shingle_hashes(a).tolist()), set(hasher.shingle_hashes(b).tolist())
+    return len(x & y) / len(x | y)
+
+
+def test_choose_bands_threshold_is_at_or_below_target():
+    for threshold in (0.5, 0.8, 0.9):
+        bands = choose_bands(64, threshold)
+        assert 64 % bands == 0
+        assert (1 / bands) ** (bands / 64) <= threshold
+
+
+def test_signature_agreement_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    near = BASE.replace("three letters", "four letters")
+    signatures = hasher.signatures([BASE, near, OTHER])
+    estimate = (signatures[0] == signatures[1]).mean()
+    assert abs(estimate - _jaccard(BASE.lower(), near.lower(), hasher)) < 0.1
+    assert (signatures[0] == signatures[2]).mean() < 0.1
+
+
+def test_near_duplicates_fold_onto_the_earliest_row():
+    texts = [OTHER, BASE, BASE.upper(), BASE.replace("three letters", "four letters"), "", ""]
+    representatives = find_near_duplicates(texts, threshold=0.8)
+    assert representatives.tolist() == [0, 1, 1, 1, 4, 5]
+
+
+def test_deduplicate_counts_folded_chunks():
+    chunks = [BASE, OTHER, BASE + ".", OTHER]
+    metadata = [{"id": i} for i in range(4)]
+    kept, kept_metadata, report = deduplicate(chunks, metadata, threshold=0.8, dim=384)
+    assert kept.tolist() == [0, 1]
+    assert kept_metadata == [{"id": 0, "duplicate_count": 1}, {"id": 1, "duplicate_count": 1}]
+    assert report["chunks_after"] == 2 and report["clusters_merged"] == 2
+    assert report["bytes_saved"] == 2 * 384 * 4
+
+    # A second pass over the survivors carries the counts over
+    again, again_metadata, _ = deduplicate([BASE, BASE], [kept_metadata[0], {"id": 9}], threshold=0.8)
+    assert again.tolist() == [0] and again_metadata[0]["duplicate_count"] == 2
+
+
+def test_distinct_texts_are_kept():
+    rng = np.random.default_rng(0)
+    words = [f"word{i}" for i in range(500)]
+    texts = [" ".join(rng.choice(words, 30)) for _ in range(50)]
+    kept, _, report = deduplicate(texts, threshold=0.8)
+    assert len(kept) == 50 and report["clusters_merged"] == 0
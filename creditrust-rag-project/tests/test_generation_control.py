@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from generation_control import (STOP_SEQUENCES, AnswerStream, GenerationController, _stopping_criteria,
+                                cut_at_stop, filter_stream)
+
+EOS = 0
+
+
+class CharTokenizer:
+    """Token id ``n`` decodes to the n-th letter; 0 is EOS"""
+
+    eos_token_id = EOS
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(ord("a") + int(i) - 1) for i in ids if not (skip_special_tokens and int(i) == EOS))
+
+    def batch_decode(self, rows, skip_special_tokens=True):
+        return [self.decode(row, skip_special_tokens) for row in rows]
+
+
+class StubGenerator:
+    tokenizer = CharTokenizer()
+    generation_kwargs = {"pad_token_id": EOS}
+
+
+def test_cut_at_stop_and_filter_stream():
+    assert cut_at_stop("Fees apply.\n\nQuestion: next", STOP_SEQUENCES) == "Fees apply."
+    assert cut_at_stop("\n\nLeading blank lines are kept", STOP_SEQUENCES) == "\n\nLeading blank lines are kept"
+    assert "".join(filter_stream(["Fees app", "ly.\nQues", "tion: next"])) == "Fees apply.\n"
+
+
+def test_answer_stream_exposes_the_result():
+    outcome = {}
+    stream = AnswerStream(iter(["a", "b"]), outcome)
+    assert list(stream) == ["a", "b"] and not stream.truncated
+    outcome["truncated"] = True
+    assert stream.truncated
+
+
+def test_budget_marks_only_rows_still_running():
+    tokenizer = CharTokenizer()
+    state = {}
+    criteria = _stopping_criteria(tokenizer, None, STOP_SEQUENCES, state)[0]
+    # Prompt of one token; row 0 ends with EOS after its first new token
+    done = criteria(torch.tensor([[5, EOS], [5, 2]]), None)
+    assert done.tolist() == [True, False]
+
+    expired = _stopping_criteria(tokenizer, time.perf_counter() - 1, STOP_SEQUENCES, state)[0]
+    assert expired(torch.tensor([[5, EOS, EOS], [5, 2, 3]]), None).tolist() == [True, True]
+    assert state["budget_exceeded"] and state["running"] == [False, True]
+
+    controller = GenerationController(StubGenerator())
+    started = time.perf_counter()
+    finished = controller._result(torch.tensor([]), state, started, row=0)
+    cut = controller._result(torch.tensor([2, 3]), state, started, row=1)
+    assert (finished["truncated"], cut["truncated"]) == (False, True)
+    assert cut["stop_reason"] == "budget" and cut["answer"] == "bc"
+    assert controller.stats()["truncated"] == 1
+
+
+def test_stop_sequence_ends_a_row_before_the_budget():
+    state = {}
+    tokenizer = CharTokenizer()
+    criteria = _stopping_criteria(tokenizer, None, ("cd",), state)[0]
+    assert criteria(torch.tensor([[1, 3], [1, 2]]), None).tolist() == [False, False]
+    assert criteria(torch.tensor([[1, 3, 4], [1, 2, 2]]), None).tolist() == [True, False]
+    expired = _stopping_criteria(tokenizer, time.perf_counter() - 1, ("cd",), state)[0]
+    expired(torch.tensor([[1, 3, 4, EOS], [1, 2, 2, 2]]), None)
+    assert state["running"] == [False, True]
+
+
+class ScriptedModel:
+    """Emits a fixed sequence of new tokens per row, padding finished rows with EOS like ``generate``"""
+
+    device = "cpu"
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def generate(self, input_ids, attention_mask=None, stopping_criteria=None, streamer=None, **kwargs):
+        finished = torch.zeros(len(input_ids), dtype=torch.bool)
+        for step in range(max(len(row) for row in self.rows)):
+            tokens = [EOS if finished[i] or step >= len(row) else row[step] for i, row in enumerate(self.rows)]
+            input_ids = torch.cat([input_ids, torch.tensor(tokens).unsqueeze(1)], dim=1)
+            finished |= stopping_criteria(input_ids, None)
+            if finished.all():
+                break
+        return input_ids
+
+
+class BatchEncoding(dict):
+    def to(self, device):
+        return self
+
+
+def test_batch_rows_ending_on_eos_keep_their_stop_reason():
+    class Tokenizer(CharTokenizer):
+        def __call__(self, prompts, return_tensors=None, padding=False):
+            ids = torch.tensor([[ord(c) - ord("a") + 1 for c in prompt] for prompt in prompts])
+            return BatchEncoding(input_ids=ids, attention_mask=torch.ones_like(ids))
+
+    generator = StubGenerator()
+    generator.tokenizer = Tokenizer()
+    # Row 0 ends with EOS and is then padded with EOS while row 1 runs to the length limit
+    generator.model = ScriptedModel([[2, 3, EOS], [2, 3, 4, 5]])
+    controller = GenerationController(generator)
+    ended, cut = controller.generate_batch(["ab", "cd"])
+    assert (ended["answer"], ended["stop_reason"], ended["new_tokens"]) == ("bc", "eos", 3)
+    assert (cut["answer"], cut["stop_reason"], cut["new_tokens"]) == ("bcde", "length", 4)
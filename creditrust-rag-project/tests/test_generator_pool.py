@@ -0,0 +1,59 @@
+import os
+import signal
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="the pool forks workers")
+
+from generator_pool import GeneratorPool
+
+# Workers import torch to size their thread pools; importing it once here lets every fork inherit it
+pytest.importorskip("torch")
+
+
+def generate(prompt):
+    if prompt == "crash":
+        os._exit(3)
+    return {"answer": prompt.upper(), "pid": os.getpid(), "parent": os.getppid()}
+
+
+def stream(prompt, result):
+    for piece in prompt:
+        if piece == "!":
+            os.kill(os.getpid(), signal.SIGKILL)
+        yield piece
+    result.update(answer=prompt, truncated=False)
+
+
+@pytest.fixture
+def pool():
+    pool = GeneratorPool(generate, workers=2, threads_per_worker=1, stream=stream)
+    yield pool
+    pool.close()
+
+
+def test_answers_and_streams(pool):
+    assert [result["answer"] for result in pool.generate_many(list("abcd"))] == list("ABCD")
+    outcome = {}
+    assert "".join(pool.stream("hello", outcome)) == "hello"
+    assert outcome == {"answer": "hello", "truncated": False}
+
+
+def test_dead_worker_fails_its_prompt_and_is_replaced_from_the_template(pool):
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        pool.submit("crash").result(timeout=10)
+    results = [pool.submit(prompt).result(timeout=10) for prompt in "xyzw"]
+    assert [result["answer"] for result in results] == list("XYZW")
+    assert pool.restarts == 1
+    # The replacement is a child of the template process, not of this one
+    assert pool._template.process.pid in {result["parent"] for result in results}
+
+
+def test_worker_killed_mid_stream(pool):
+    pieces = []
+    with pytest.raises(RuntimeError, match="exited with code -9"):
+        for piece in pool.stream("ab!cd"):
+            pieces.append(piece)
+    assert pieces == ["a", "b"]
+    assert pool.generate("after")["answer"] == "AFTER"
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from rag_pipeline import RAGPipeline
+from vector_store import write_vector_store
+
+CHUNKS = [
+    "The bank charged an overdraft fee twice.",
+    "My mortgage payment was misapplied.",
+    "Collectors called me every day about a debt.",
+    "The student loan servicer lost my paperwork.",
+    "A credit report error lowered my score.",
+]
+
+
+class FixedEncoder:
+    def __init__(self, embedding):
+        self.embedding = embedding
+
+    def encode(self, texts, **kwargs):
+        return self.embedding if isinstance(texts, str) else np.tile(self.embedding, (len(texts), 1))
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    path = str(tmp_path / "store.vstore")
+    embeddings = np.eye(len(CHUNKS), dtype=np.float32)
+    write_vector_store(path, CHUNKS, embeddings)
+    pipeline = RAGPipeline(path, load_models=False, retrieval_mode="hybrid")
+    # The question is closest to chunk 3, then 2
+    pipeline.embedding_model = FixedEncoder(np.array([0, 0, 0.6, 0.8, 0], dtype=np.float32))
+    return pipeline
+
+
+def test_few_lexical_matches_are_filled_up_to_k_from_dense_results(pipeline):
+    chunks = pipeline.retrieve_chunks("overdraft fee", k=3)
+    ids = [chunk["id"] for chunk in chunks]
+    assert len(ids) == 3
+    assert set(ids) == {0, 2, 3}
+
+
+def test_enough_lexical_matches_are_fused_without_the_dense_top_k(pipeline):
+    # "payment", "paperwork" and "score" each match one chunk; chunk 2 is dense-only
+    chunks = pipeline.retrieve_chunks("payment paperwork score", k=3)
+    assert sorted(chunk["id"] for chunk in chunks) == [1, 3, 4]
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingestion import SOURCE_NAME, ingest_complaints, iter_complaint_blocks
+from segments import SegmentedVectorStore
+
+
+def _encode(chunks):
+    embeddings = np.ones((len(chunks), 4), dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    rows = []
+    for i in range(23):
+        narrative = f"Card {i} was charged twice,\n\"late\" fees\n\nstill unresolved" if i % 2 else f"Card {i} billing error"
+        rows.append({"Complaint ID": str(i), "Product": "Mortgage" if i % 7 == 0 else "Credit card",
+                     "Consumer complaint narrative": None if i == 4 else narrative})
+    path = tmp_path / "complaints.csv"
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+def _ingest(csv_path, store_dir, **kwargs):
+    return ingest_complaints(csv_path, store_dir, _encode, "stub", read_rows=5, **kwargs)
+
+
+def test_blocks_resume_from_the_recorded_byte_offset(csv_path):
+    blocks = list(iter_complaint_blocks(csv_path, read_rows=5))
+    assert [consumed for consumed, _, _ in blocks] == [5, 10, 15, 20, 23]
+    kept = pd.concat([block for _, _, block in blocks])
+    assert kept["Complaint ID"].tolist() == [str(i) for i in range(23) if i % 7 and i != 4]
+    assert "\n\"late\" fees\n\n" in kept["Consumer complaint narrative"].iloc[0]
+
+    consumed, offset, _ = blocks[1]
+    resumed = list(iter_complaint_blocks(csv_path, read_rows=5, offset=offset, records_done=consumed))
+    assert [(c, o) for c, o, _ in resumed] == [(c, o) for c, o, _ in blocks[2:]]
+    assert pd.concat([b for _, _, b in resumed]).equals(pd.concat([b for _, _, b in blocks[2:]]))
+
+
+@pytest.mark.parametrize("legacy_checkpoint", [False, True])
+def test_interrupted_ingest_resumes_where_it_stopped(csv_path, tmp_path, legacy_checkpoint):
+    _ingest(csv_path, str(tmp_path / "full"))
+    full = SegmentedVectorStore(str(tmp_path / "full"))
+
+    store_dir = str(tmp_path / "resumed")
+    _ingest(csv_path, store_dir, max_blocks=2)
+    if legacy_checkpoint:
+        store = SegmentedVectorStore(store_dir)
+        record = dict(store.source_record(SOURCE_NAME))
+        del record["byte_offset"]
+        store.record_source(SOURCE_NAME, record)
+    summary = _ingest(csv_path, store_dir)
+    resumed = SegmentedVectorStore(store_dir)
+
+    assert summary["rows_read"] == 13
+    assert list(resumed.chunks) == list(full.chunks)
+    assert [m["complaint_id"] for m in resumed.metadata] == [m["complaint_id"] for m in full.metadata]
+    assert resumed.source_record(SOURCE_NAME) == full.source_record(SOURCE_NAME)
@@ -0,0 +1,128 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from lexical_index import BM25Index
+import metadata_index
+from metadata_index import MetadataIndex
+from rag_pipeline import RAGPipeline
+from segments import SegmentedIndex, SegmentedVectorStore
+
+
+def _batch(start, count, dim=8, product="Credit card"):
+    rng = np.random.default_rng(start)
+    chunks = [f"Complaint {i} about {product.lower()} late fees and billing" for i in range(start, start + count)]
+    embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+    metadata = [{"product": product, "date_received": f"2023-01-{1 + i % 28:02d}"}
+                for i in range(start, start + count)]
+    return chunks, embeddings, metadata
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SegmentedVectorStore.create(str(tmp_path / "store"))
+    store.append(*_batch(0, 6))
+    store.append(*_batch(6, 4, product="Mortgage"))
+    return store
+
+
+def _sidecars(store, suffix):
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(store.directory, f"*{suffix}")))
+
+
+def test_append_assigns_stable_ids(store):
+    assert len(store.segments) == 2
+    assert store.ids.tolist() == list(range(10))
+    assert store.chunks[7] == "Complaint 7 about mortgage late fees and billing"
+    assert store.metadata[7]["product"] == "Mortgage"
+
+
+def test_append_rejects_other_dimensions(store):
+    chunks, embeddings, metadata = _batch(10, 2, dim=4)
+    with pytest.raises(ValueError):
+        store.append(chunks, embeddings, metadata)
+
+
+def test_delete_masks_search(store):
+    assert store.delete([2, 7]) == 2
+    assert store.live_count == 8
+    query = np.asarray(store.embeddings[2])
+    ids, _ = SegmentedIndex(store).search(query, k=10)
+    assert 2 not in ids[0] and 7 not in ids[0]
+    assert (ids[0] >= 0).sum() == 8
+
+
+def test_delete_where_compares_dates_as_days(store):
+    assert store.delete_where("date_received", ["01/03/2023"]) == 1
+    assert store.delete_where("product", ["Mortgage"]) == 4
+    assert store.live_count == 5
+
+
+def test_delete_where_scans_fields_left_out_of_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(metadata_index, "MAX_CARDINALITY", 3)
+    store = SegmentedVectorStore.create(str(tmp_path / "store"))
+    chunks, embeddings, metadata = _batch(0, 6)
+    store.append(chunks, embeddings, [dict(record, complaint_id=100 + i) for i, record in enumerate(metadata)])
+    assert "complaint_id" in store.metadata_index().skipped
+    assert store.delete_where("complaint_id", [101, 104]) == 2
+    assert store.delete_where("complaint_id", [101]) == 0
+    assert store.delete_where("state", ["CA"]) == 0
+    assert store.live_count == 4
+
+
+def test_merged_sidecars_match_a_full_build(store):
+    assert _sidecars(store, ".meta.npz") == ["seg-000001.vstore.meta.npz", "seg-000002.vstore.meta.npz"]
+    chunks, metadata = list(store.chunks), list(store.metadata)
+
+    merged = store.metadata_index()
+    full = MetadataIndex.build(metadata)
+    assert merged.count == full.count
+    for field, postings in full.postings.items():
+        assert {value: rows.tolist() for value, rows in merged.postings[field].items()} == \
+               {value: rows.tolist() for value, rows in postings.items()}
+    assert merged.resolve({"product": "Mortgage"}).tolist() == [6, 7, 8, 9]
+
+    lexical, reference = store.lexical_index(), BM25Index().build(chunks)
+    np.testing.assert_allclose(lexical.scores("mortgage fees"), reference.scores("mortgage fees"), rtol=1e-5)
+
+
+def test_reload_picks_up_appends_from_another_writer(store):
+    reader = SegmentedVectorStore(store.directory)
+    reader.metadata_index()
+    store.append(*_batch(10, 3, product="Student loan"))
+    reader.reload()
+    assert len(reader) == 13
+    assert reader.metadata_index().resolve({"product": "Student loan"}).tolist() == [10, 11, 12]
+
+
+def test_pipeline_reload_serves_new_segments(store):
+    pipeline = RAGPipeline(store.directory, load_models=False)
+    assert not pipeline.reload_store()
+    chunks, embeddings, metadata = _batch(10, 1, product="Student loan")
+    store.append(chunks, embeddings, metadata)
+    store.delete_where("product", ["Mortgage"])
+    assert pipeline.reload_store()
+    assert not pipeline.reload_store()
+    ids, _ = pipeline.index.search(embeddings[0], k=10)
+    assert ids[0][0] == 10
+    assert not set(ids[0]) & {6, 7, 8, 9}
+
+
+def test_compact_keeps_live_rows_and_ids(store):
+    store.delete([0, 9])
+    segments_before, dropped = store.compact()
+    assert (segments_before, dropped) == (2, 2)
+    assert len(store.segments) == 1 and len(store) == 8
+    assert store.ids.tolist() == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert store.chunks[0] == "Complaint 1 about credit card late fees and billing"
+    # Old segments go away together with their sidecars and the tombstones
+    assert _sidecars(store, ".vstore") == ["seg-000004.vstore"]
+    assert _sidecars(store, ".meta.npz") == ["seg-000004.vstore.meta.npz"]
+    assert _sidecars(store, ".bm25.npz") == ["seg-000004.vstore.bm25.npz"]
+    assert not glob.glob(os.path.join(store.directory, "tombstones-*"))
+
+    reopened = SegmentedVectorStore(store.directory)
+    assert reopened.ids.tolist() == store.ids.tolist()
+    assert reopened.metadata_index().resolve({"product": "Mortgage"}).tolist() == [5, 6, 7]
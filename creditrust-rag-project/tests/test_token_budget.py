@@ -0,0 +1,129 @@
+import glob
+import os
+
+import numpy as np
+
+from segments import SegmentedVectorStore
+from token_budget import WORDS_PER_SPAN, ChunkTokenIndex, pack_context, sentence_spans
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word"""
+
+    name_or_path = "words"
+
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [list(range(len(text.split()))) for text in texts]}
+
+
+class NoCountingTokenizer(WordTokenizer):
+    def __call__(self, texts, add_special_tokens=False):
+        raise AssertionError("token counts should come from the sidecars")
+
+
+CHUNKS = [
+    "One two three. Four five.",          # 3 + 2 tokens
+    "Six seven eight nine. Ten.",         # 4 + 1
+    "Eleven twelve thirteen fourteen.",   # 4
+]
+
+
+def _records(rows):
+    return [{"id": row, "text": CHUNKS[row]} for row in rows]
+
+
+def test_index_counts_tokens_per_sentence():
+    assert sentence_spans(CHUNKS[0]) == [14, len(CHUNKS[0])]
+    index = ChunkTokenIndex.build(CHUNKS, WordTokenizer())
+    assert index.tokenizer_name == "words" and index.count == 3
+    assert index.token_counts.tolist() == [5, 5, 4]
+    assert index.fit(1, 4) == (21, 4)
+    assert index.fit(1, 3) == (0, 0)
+
+
+def test_pack_context_keeps_whole_chunks_that_fit():
+    index = ChunkTokenIndex.build(CHUNKS, WordTokenizer())
+    assert pack_context(_records([0, 1, 2]), index, budget=14) == _records([0, 1, 2])
+    assert pack_context(_records([2, 0]), index, budget=9) == _records([2, 0])
+
+
+def test_pack_context_trims_the_overflowing_chunk_at_a_sentence():
+    index = ChunkTokenIndex.build(CHUNKS, WordTokenizer())
+    packed = pack_context(_records([0, 1, 2]), index, budget=9)
+    assert [chunk["id"] for chunk in packed] == [0, 1]
+    assert packed[1]["text"] == "Six seven eight nine." and packed[1]["truncated"]
+    assert "truncated" not in packed[0]
+
+
+def test_pack_context_trims_unpunctuated_chunks_at_a_word_boundary():
+    # Cleaned narratives have no sentence punctuation: 20 words in one "sentence"
+    words = [f"w{i}" for i in range(20)]
+    chunks = [" ".join(words)]
+    assert sentence_spans(chunks[0]) == [len(" ".join(words[:8])), len(" ".join(words[:16])), len(chunks[0])]
+    index = ChunkTokenIndex.build(chunks, WordTokenizer())
+    assert index.token_counts.tolist() == [20]
+    packed = pack_context([{"id": 0, "text": chunks[0]}], index, budget=12)
+    assert packed == [{"id": 0, "text": " ".join(words[:8]), "truncated": True}]
+    assert pack_context([{"id": 0, "text": chunks[0]}], index, budget=7) == []
+
+
+def test_pack_context_charges_the_overhead_per_chunk():
+    index = ChunkTokenIndex.build(CHUNKS, WordTokenizer())
+    # 5 + 2 for the first chunk leaves 3: not enough for any sentence of the second
+    assert pack_context(_records([0, 1]), index, budget=10, overhead=2) == _records([0])
+    assert pack_context(_records([0]), index, budget=2, overhead=2) == []
+
+
+def test_pack_context_stops_at_the_first_chunk_that_does_not_fit():
+    index = ChunkTokenIndex.build(CHUNKS, WordTokenizer())
+    # Chunk 2 would fit after chunk 1 is dropped, but packing keeps score order
+    assert pack_context(_records([0, 1, 2]), index, budget=7) == _records([0])
+
+
+def test_save_and_load(tmp_path):
+    index = ChunkTokenIndex.build(CHUNKS, WordTokenizer(), store_version="abc")
+    path = str(tmp_path / "store.vstore.tokens.npz")
+    index.save(path)
+    loaded = ChunkTokenIndex.load(path)
+    assert (loaded.tokenizer_name, loaded.store_version, loaded.words_per_span) == ("words", "abc", WORDS_PER_SPAN)
+    np.testing.assert_array_equal(loaded.sentence_tokens, index.sentence_tokens)
+    np.testing.assert_array_equal(loaded.sentence_ptr, index.sentence_ptr)
+
+
+def test_segmented_store_merges_per_segment_sidecars(tmp_path):
+    tokenizer = WordTokenizer()
+    store = SegmentedVectorStore.create(str(tmp_path / "store"), tokenizer=tokenizer)
+    rng = np.random.default_rng(0)
+    store.append(CHUNKS[:2], rng.normal(size=(2, 4)).astype(np.float32))
+    store.append(CHUNKS[2:], rng.normal(size=(1, 4)).astype(np.float32))
+    sidecars = sorted(os.path.basename(path) for path in glob.glob(os.path.join(store.directory, "*.tokens.npz")))
+    assert sidecars == ["seg-000001.vstore.tokens.npz", "seg-000002.vstore.tokens.npz"]
+
+    # Another reader loads the sidecars instead of counting tokens again
+    merged = SegmentedVectorStore(store.directory).token_index(NoCountingTokenizer())
+    full = ChunkTokenIndex.build(CHUNKS, tokenizer)
+    np.testing.assert_array_equal(merged.sentence_ptr, full.sentence_ptr)
+    np.testing.assert_array_equal(merged.sentence_ends, full.sentence_ends)
+    np.testing.assert_array_equal(merged.sentence_tokens, full.sentence_tokens)
+    assert pack_context(_records([1, 2]), merged, budget=9) == _records([1, 2])
+
+    store.delete([0])
+    store.compact()
+    sidecars = glob.glob(os.path.join(store.directory, "*.tokens.npz"))
+    assert [os.path.basename(path) for path in sidecars] == ["seg-000004.vstore.tokens.npz"]
+    assert store.token_index(tokenizer).token_counts.tolist() == [5, 4]
+
+
+def test_sidecars_from_before_word_spans_are_rebuilt(tmp_path):
+    tokenizer = WordTokenizer()
+    store = SegmentedVectorStore.create(str(tmp_path / "store"), tokenizer=tokenizer)
+    chunks = [" ".join(f"w{i}" for i in range(20))]
+    store.append(chunks, np.ones((1, 4), dtype=np.float32))
+    path = glob.glob(os.path.join(store.directory, "*.tokens.npz"))[0]
+    legacy = ChunkTokenIndex.load(path)
+    ChunkTokenIndex(legacy.tokenizer_name, np.array([0, 1]), np.array([len(chunks[0])], dtype=np.int32),
+                    np.array([20], dtype=np.int32), legacy.store_version, words_per_span=None).save(path)
+
+    rebuilt = SegmentedVectorStore(store.directory).token_index(tokenizer)
+    assert rebuilt.sentence_tokens.tolist() == [8, 16, 20]
+    assert ChunkTokenIndex.load(path).words_per_span == WORDS_PER_SPAN
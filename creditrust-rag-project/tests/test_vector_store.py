@@ -0,0 +1,97 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from vector_store import (VectorStore, VectorStoreFormatError, convert_pickle_store, load_vector_store,
+                          resolve_store_path, write_vector_store)
+
+
+def _sample(count=5, dim=8):
+    rng = np.random.default_rng(0)
+    chunks = [f"Complaint {i}: the bank charged a fee twice ✓" for i in range(count)]
+    embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+    metadata = [{"product": "Credit card" if i % 2 else "Mortgage", "id": i} for i in range(count)]
+    return chunks, embeddings, metadata
+
+
+def test_round_trip(tmp_path):
+    chunks, embeddings, metadata = _sample()
+    path = str(tmp_path / "store.vstore")
+    write_vector_store(path, chunks, embeddings, metadata, ids=np.arange(10, 15))
+
+    store = VectorStore.open(path)
+    assert len(store) == 5 and store.dim == 8
+    assert list(store.chunks) == chunks
+    assert list(store.metadata) == metadata
+    assert store.ids.tolist() == list(range(10, 15))
+    expected = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.testing.assert_allclose(store.embeddings, expected, rtol=1e-6)
+    assert store.verify()
+
+
+def test_save_keeps_stable_ids(tmp_path):
+    chunks, embeddings, metadata = _sample()
+    path = str(tmp_path / "store.vstore")
+    write_vector_store(path, chunks, embeddings, metadata, ids=np.arange(10, 15))
+
+    copy_path = str(tmp_path / "copy.vstore")
+    VectorStore.open(path).save(copy_path)
+    assert VectorStore.open(copy_path).ids.tolist() == list(range(10, 15))
+
+
+def test_converted_pickle_matches_pickle(tmp_path):
+    chunks, embeddings, metadata = _sample()
+    pickle_path = str(tmp_path / "vector_store.pkl")
+    with open(pickle_path, "wb") as f:
+        pickle.dump({"chunks": chunks, "embeddings": embeddings.tolist(), "metadata": metadata}, f)
+    convert_pickle_store(pickle_path, str(tmp_path / "vector_store.vstore"))
+
+    # The .pkl path resolves to the converted file next to it
+    resolved = resolve_store_path(pickle_path)
+    assert resolved.endswith(".vstore")
+    legacy, converted = VectorStore.from_pickle(pickle_path), load_vector_store(resolved)
+    assert list(converted.chunks) == legacy.chunks
+    np.testing.assert_allclose(converted.embeddings, legacy.embeddings, rtol=1e-6)
+
+
+def test_missing_vstore_falls_back_to_pickle(tmp_path):
+    (tmp_path / "vector_store.pkl").write_bytes(b"")
+    assert resolve_store_path(str(tmp_path / "vector_store.vstore")).endswith(".pkl")
+
+
+def test_corrupted_section_fails_verify(tmp_path):
+    chunks, embeddings, metadata = _sample()
+    path = str(tmp_path / "store.vstore")
+    header = write_vector_store(path, chunks, embeddings, metadata)
+    offset = header["sections"]["text"]["offset"]
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    store = VectorStore.open(path)
+    with pytest.raises(VectorStoreFormatError, match="section 'text'"):
+        store.verify()
+
+
+def test_corrupted_header_is_rejected(tmp_path):
+    chunks, embeddings, metadata = _sample()
+    path = str(tmp_path / "store.vstore")
+    write_vector_store(path, chunks, embeddings, metadata)
+    data = bytearray(open(path, "rb").read())
+    data[20] ^= 0xFF
+    open(path, "wb").write(bytes(data))
+    with pytest.raises(VectorStoreFormatError):
+        VectorStore.open(path)
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    chunks, embeddings, metadata = _sample()
+    path = str(tmp_path / "store.vstore")
+    write_vector_store(path, chunks, embeddings, metadata)
+    data = open(path, "rb").read()
+    open(path, "wb").write(data[:len(data) - 16])
+    with pytest.raises(VectorStoreFormatError, match="truncated"):
+        VectorStore.open(path)
@@ -16,12 +16,15 @@ def evaluate_rag_pipeline(rag_pipeline, questions, k=5):
     print(f"Evaluating {len(questions)} questions...")
     print("-" * 80)
     
-    for i, question in enumerate(questions, 1):
+    # Batch all questions through one encode/search/generate pass when supported
+    if hasattr(rag_pipeline, 'query_batch'):
+        responses = rag_pipeline.query_batch(questions, k)
+    else:
+        responses = [rag_pipeline.query(question, k) for question in questions]
+    
+    for i, (question, result) in enumerate(zip(questions, responses), 1):
         print(f"Question {i}/{len(questions)}: {question[:50]}...")
         
-        # Get RAG response
-        result = rag_pipeline.query(question, k)
-        
         # Format evaluation result
         eval_result = {
             'question': question,
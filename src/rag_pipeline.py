@@ -1,18 +1,113 @@
+import gc
+import os
+import sys
+import threading
+from typing import Any
+
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.llms import HuggingFacePipeline
+from langchain_community.llms.utils import enforce_stop_tokens
+from langchain_core.language_models.llms import LLM
 from langchain_core.prompts import PromptTemplate
 from transformers import pipeline
 from langchain.chains import LLMChain
 
-def load_vector_store():
+# The preamble KV-cache lives with the RAG project's generation code
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'creditrust-rag-project', 'src'))
+
+from prefix_cache import PrefixCachedGenerator
+
+
+class ResourceRegistry:
     """
-    Load the pre-built FAISS vector store from disk
+    Process-wide, lazily built resources shared by every question.
+
+    Each resource is built by its factory on first use and then reused.
+    Building takes a per-resource lock, so concurrent callers wait for one
+    build instead of loading the same model twice, while unrelated resources
+    can still load in parallel. Releasing a resource also releases the
+    resources that depend on it (e.g. the chain when the LLM is dropped).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factories = {}
+        self._release_hooks = {}
+        self._dependents = {}
+        self._build_locks = {}
+        self._resources = {}
+
+    def register(self, name, factory, depends_on=(), on_release=None):
+        """
+        Register how to build a resource and what it depends on
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._release_hooks[name] = on_release
+            self._build_locks[name] = threading.Lock()
+            for dependency in depends_on:
+                self._dependents.setdefault(dependency, set()).add(name)
+
+    def get(self, name):
+        """
+        Return the resource, building it on first use
+        """
+        resource = self._resources.get(name)
+        if resource is not None:
+            return resource
+        with self._build_locks[name]:
+            resource = self._resources.get(name)
+            if resource is None:
+                resource = self._factories[name]()
+                with self._lock:
+                    self._resources[name] = resource
+        return resource
+
+    def is_loaded(self, name):
+        return name in self._resources
+
+    def release(self, *names):
+        """
+        Drop resources (all of them if no names are given) and their dependents
+        """
+        pending = list(names or self._factories)
+        released = set()
+        while pending:
+            name = pending.pop()
+            if name in released:
+                continue
+            released.add(name)
+            pending.extend(self._dependents.get(name, ()))
+            with self._build_locks[name]:
+                with self._lock:
+                    resource = self._resources.pop(name, None)
+                if resource is not None and self._release_hooks[name] is not None:
+                    self._release_hooks[name](resource)
+        gc.collect()
+
+    def reload(self, name):
+        """
+        Rebuild a resource now (e.g. after the index on disk was updated)
+        """
+        self.release(name)
+        return self.get(name)
+
+
+def load_embeddings():
     """
-    embeddings = HuggingFaceEmbeddings(
+    Load the sentence embedding model used by the FAISS index
+    """
+    return HuggingFaceEmbeddings(
         model_name="all-MiniLM-L6-v2"
     )
 
+
+def load_vector_store():
+    """
+    Load the pre-built FAISS vector store from disk
+    """
+    embeddings = registry.get("embeddings")
+
     vector_store = FAISS.load_local(
         folder_path="../data/vector_store",
         embeddings=embeddings,
@@ -26,7 +121,7 @@ def retrieve_context(question, k=5):
     """
     Retrieve top-k relevant documents for the given question
     """
-    vector_store = load_vector_store()
+    vector_store = registry.get("vector_store")
 
     docs = vector_store.similarity_search(
         question,
@@ -55,6 +150,36 @@ Question:
 Answer:
 """
 
+# Everything before the context is identical on every request
+PROMPT_PREAMBLE = PROMPT_TEMPLATE[:PROMPT_TEMPLATE.index("{context}")]
+
+GENERATION_KWARGS = {
+    "max_new_tokens": 300,
+    "temperature": 0.2
+}
+
+
+class PrefixCachedLLM(LLM):
+    """
+    LangChain LLM over a PrefixCachedGenerator.
+
+    The fixed prompt preamble is prefilled once and its past-key-values are
+    reused for every prompt that starts with it, so only the context and
+    question are prefilled. Returns only the newly generated text.
+    """
+
+    generator: Any
+
+    @property
+    def _llm_type(self):
+        return "prefix_cached_huggingface"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        text = self.generator(prompt, **kwargs)
+        if stop:
+            text = enforce_stop_tokens(text, stop)
+        return text
+
 
 def load_llm():
     """
@@ -63,31 +188,80 @@ def load_llm():
     generator = pipeline(
         "text-generation",
         model="mistralai/Mistral-7B-Instruct-v0.2",
-        max_new_tokens=300,
-        temperature=0.2
+        **GENERATION_KWARGS
     )
 
-    llm = HuggingFacePipeline(pipeline=generator)
+    llm = PrefixCachedLLM(
+        generator=PrefixCachedGenerator(
+            generator.model,
+            generator.tokenizer,
+            PROMPT_PREAMBLE,
+            **GENERATION_KWARGS
+        )
+    )
     return llm
 
 
+def build_chain():
+    """
+    Compile the prompt | llm chain once
+    """
+    prompt = PromptTemplate(
+        template=PROMPT_TEMPLATE,
+        input_variables=["context", "question"]
+    )
+
+    return prompt | registry.get("llm")
+
+
+def free_model_memory(resource):
+    """
+    Release hook: return freed GPU memory to the device after a model is dropped
+    """
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+registry = ResourceRegistry()
+registry.register("embeddings", load_embeddings, on_release=free_model_memory)
+registry.register("vector_store", load_vector_store, depends_on=("embeddings",))
+registry.register("llm", load_llm, on_release=free_model_memory)
+registry.register("chain", build_chain, depends_on=("llm",))
+
+
+def reload_resources(*names):
+    """
+    Rebuild the named resources (e.g. "vector_store" after re-indexing)
+    """
+    for name in names:
+        registry.reload(name)
+
+
+def release_resources(*names):
+    """
+    Free the named resources, or all of them, under memory pressure; they reload on next use
+    """
+    registry.release(*names)
+
+
 def rag_answer(question):
     """
     Full RAG pipeline:
     1. Retrieve context
     2. Format prompt
     3. Generate answer
+
+    The embedding model, FAISS index, LLM and chain are built once per
+    process and reused across questions.
     """
     context, docs = retrieve_context(question)
 
-    llm = load_llm()
-
-    prompt = PromptTemplate(
-        template=PROMPT_TEMPLATE,
-        input_variables=["context", "question"]
-    )
-
-    chain = prompt | llm
+    chain = registry.get("chain")
 
     answer = chain.invoke({
         "context": context,